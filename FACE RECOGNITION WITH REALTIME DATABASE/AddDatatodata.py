@@ -1,30 +1,11 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import db
+import argparse
+import logging
 
-# Try to import config for Firebase settings
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import db
+from backend import open_backend
+from loadgen import seed_students, synthetic_ids, synthetic_students
 
-# Try to import config for Firebase settings
-try:
-    import config
-    service_account_key = getattr(config, 'SERVICE_ACCOUNT_KEY', 'serviceAccountKey.json')
-    firebase_config = getattr(config, 'FIREBASE_CONFIG', {
-        'databaseURL': "XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX"
-    })
-except ImportError:
-    # Use defaults if config is not available
-    service_account_key = 'serviceAccountKey.json'
-    firebase_config = {
-        'databaseURL': "XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX"
-    }
-
-cred = credentials.Certificate(service_account_key)
-firebase_admin.initialize_app(cred, firebase_config)
-
-ref = db.reference('Students')
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 data = {
     "11232950": {
@@ -74,63 +55,24 @@ data = {
     },
 }
 
-for key, value in data.items():
 
+def main():
+    parser = argparse.ArgumentParser(description="Seed the Students node of the configured backend")
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help="also add N synthetic students with placeholder photos")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic profiles")
+    args = parser.parse_args()
 
-    ref = db.reference('Students')
+    # Firebase, or the local stand-in with BACKEND = 'local'
+    backend = open_backend()
+    if backend is None:
+        return
+    seed_students(backend, data)
+    if args.synthetic:
+        seed_students(backend, synthetic_students(synthetic_ids(args.synthetic), args.seed), photos=True)
+    backend.close()
+    logger.info(f"Added {len(data) + args.synthetic} students")
 
-data = {
-        "11232950":
-        {
-                "name":"Sharukh khan",
-                "major":"Hero",
-                "Starting_year":2000,
-                "total_attendance":6,
-                "standing":"G",
-                "year":4,
-                "Last_attendance_time":"2022-08-25 00:54:23"
-        },
-        "11232955":
-        {
-                "name":"Salman khan",
-                "major":"single",
-                "Starting_year":2007,
-                "total_attendance":6,
-                "standing":"E",
-                "year":4,
-                "Last_attendance_time":"2022-08-25 00:54:23"
-        },
-        "11232957":
-        {
-                "name":"Ryan Reynolds",
-                "major":"Comedian",
-                "Starting_year":2008,
-                "total_attendance":6,
-                "standing":"EX",
-                "year":4,
-                "Last_attendance_time":"2022-08-25 00:54:23"
-        },
-        "11232958":
-        {
-                "name":"Tom",
-                "major":"Action",
-                "Starting_year":2004,
-                "total_attendance":6,
-                "standing":"S",
-                "year":4,
-                "Last_attendance_time":"2022-08-25 00:54:23"
-        },
-        "11232959":
-        {
-                "name":"Saif Ansari",
-                "major":"AI & ML",
-                "Starting_year":2023,
-                "total_attendance":10,
-                "standing":"G",
-                "year":1,
-                "Last_attendance_time":"2022-08-25 00:54:23"
-        },
 
-}
-for key,value in data.items():
-        ref.child(key).set(value)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
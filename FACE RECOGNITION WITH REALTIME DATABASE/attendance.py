@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from ledger import TIME_FORMAT, AttendanceLedger
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = REGISTRY.histogram('face_backend_seconds', 'Latency of Firebase reads and writes',
+                                   {'op': 'attendance_flush'})
+
+
+class AttendanceQueue:
+    """Offline-first attendance: a local ledger with a background syncer.
+
+    record() enforces the cooldown from local state and appends accepted
+    events to the AttendanceLedger before returning, so they survive
+    crashes and network outages and stay queryable locally. A background
+    thread pushes unsynced events in batches as one multi-path update per
+    batch: the increment of total_attendance uses the Realtime Database's
+    server-side increment, so two kiosks counting the same student never
+    overwrite each other. Events older than late_after seconds (held back
+    by an outage) only move Last_attendance_time forward: one query per
+    batch reads the students seen since the batch's oldest late event, and
+    a later time written by another kiosk is left alone.
+
+    Every batch also writes the highest ledger seq it carries to
+    AttendanceSync/<kiosk id> in the same update. After a write whose
+    outcome is unknown (an error or timeout, or a restart with events
+    pending) that watermark is read back first, and events at or below it
+    are marked synced instead of being sent, and counted, again. Ledger
+    errors (a locked or full disk) fail the flush, which is retried with
+    back-off like a network error.
+    """
+
+    def __init__(self, root_ref, cooldown=300, ledger_path='attendance.db',
+                 journal_path='attendance_journal.jsonl', batch_size=50, flush_interval=2.0,
+                 late_after=60, on_recorded=None):
+        self.root_ref = root_ref
+        self.cooldown = cooldown
+        self.ledger = AttendanceLedger(ledger_path)
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.late_after = late_after
+        self.on_recorded = on_recorded
+        self._last_seen = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one batch in flight, or it could be counted twice
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._verify = True  # a previous run may have written its last batch without marking it
+        self.flushed = 0
+        self.failures = 0
+        REGISTRY.gauge('face_attendance_pending', 'Attendance events not yet written', fn=self.pending)
+        REGISTRY.counter('face_attendance_flushed_total', 'Attendance events written', fn=lambda: self.flushed)
+        REGISTRY.counter('face_backend_errors_total', 'Failed backend operations', {'op': 'attendance_flush'},
+                         fn=lambda: self.failures)
+        self._replay()
+
+    def _replay(self):
+        """Import unsent events of the old JSONL journal, then restore cooldowns and the backlog"""
+        try:
+            with open(self.journal_path, 'r') as f:
+                events = [json.loads(line) for line in f if line.strip()]
+            for event in events:
+                self.ledger.append(event['id'], event['ts'])
+            os.remove(self.journal_path)
+            logger.info(f"Moved {len(events)} unsent attendance events from {self.journal_path} to the ledger")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to import attendance journal: {e}")
+        self._last_seen = self.ledger.last_seen()
+        self._pending = self.ledger.pending_count()
+        if self._pending:
+            logger.info(f"{self._pending} attendance events waiting to be written to Firebase")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._flush_loop, name='attendance-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the flusher after one last attempt to send pending events"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._thread is None or not self._thread.is_alive():
+            self.ledger.close()
+
+    def record(self, student_id, profile=None, stream=None, distance=None):
+        """Count attendance unless the student is inside the cooldown; returns True if counted.
+
+        profile seeds the cooldown from Last_attendance_time the first time
+        a student is seen by this kiosk; stream and distance are kept in
+        the ledger.
+        """
+        now = time.time()
+        with self._lock:
+            last = self._last_seen.get(student_id)
+            if last is None and profile and profile.get('Last_attendance_time'):
+                try:
+                    last = datetime.strptime(profile['Last_attendance_time'], TIME_FORMAT).timestamp()
+                except ValueError:
+                    last = None
+            if last is not None and now - last <= self.cooldown:
+                return False
+            self._last_seen[student_id] = now
+            event = self.ledger.append(student_id, now, stream, distance)
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._wake.set()
+        if self.on_recorded is not None:
+            self.on_recorded(student_id, event)
+        logger.info(f"Queued attendance for student {student_id}")
+        return True
+
+    def pending(self):
+        return self._pending
+
+    def _flush_loop(self):
+        backoff = self.flush_interval
+        while True:
+            self._wake.wait(backoff)
+            self._wake.clear()
+            stopping = self._stop.is_set()
+            try:
+                flushed = self.flush()
+            except Exception as e:
+                # Whatever went wrong, the flusher must keep running
+                self.failures += 1
+                logger.error(f"Attendance flush failed: {e}")
+                flushed = False
+            if flushed:
+                backoff = self.flush_interval
+            else:
+                backoff = min(backoff * 2, 60.0)
+            if stopping:
+                return
+
+    def flush(self):
+        """Send one batch of pending events; returns False if the write failed"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _watermark_path(self):
+        return f'AttendanceSync/{self.ledger.kiosk_id}'
+
+    def _skip_applied(self, batch):
+        """Mark events an earlier, unconfirmed write already applied; returns the rest of batch"""
+        watermark = self.root_ref.child(self._watermark_path()).get()
+        if not isinstance(watermark, int):
+            watermark = 0
+        applied = [event['seq'] for event in batch if event['seq'] <= watermark]
+        if applied:
+            self._synced(applied)
+            self.flushed += len(applied)
+            logger.info(f"{len(applied)} attendance events were already written, not sending them again")
+        self._verify = False
+        return [event for event in batch if event['seq'] > watermark]
+
+    def _synced(self, seqs):
+        self.ledger.mark_synced(seqs)
+        with self._lock:
+            self._pending = max(0, self._pending - len(seqs))
+
+    def _flush(self):
+        try:
+            batch = self.ledger.unsynced(self.batch_size)
+            if batch and self._verify:
+                batch = self._skip_applied(batch)
+        except sqlite3.Error as e:
+            self.failures += 1
+            logger.error(f"Attendance ledger read failed, will retry: {e}")
+            return False
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Attendance sync watermark read failed, will retry: {e}")
+            return False
+        if not batch:
+            return True
+
+        latest = {}
+        counts = {}
+        for event in batch:
+            counts[event['id']] = counts.get(event['id'], 0) + 1
+            # Events are in time order, so the last one wins
+            latest[event['id']] = event
+        updates = {f'Students/{student_id}/total_attendance': {'.sv': {'increment': count}}
+                   for student_id, count in counts.items()}
+        updates[self._watermark_path()] = batch[-1]['seq']
+
+        try:
+            with FLUSH_SECONDS.time():
+                # Held back by an outage: another kiosk may have seen the student since
+                late = {student_id for student_id, event in latest.items()
+                        if time.time() - event['ts'] > self.late_after}
+                newer = self._seen_since(min(latest[student_id]['time'] for student_id in late)) if late else {}
+                for student_id, event in latest.items():
+                    current = newer.get(student_id)
+                    if student_id in late and isinstance(current, str) and current >= event['time']:
+                        continue
+                    updates[f'Students/{student_id}/Last_attendance_time'] = event['time']
+                self.root_ref.update(updates)
+        except Exception as e:
+            # The write may have been applied before the error: check the watermark before resending
+            self._verify = True
+            self.failures += 1
+            logger.warning(f"Attendance flush of {len(batch)} events failed, will retry: {e}")
+            return False
+
+        try:
+            self._synced([event['seq'] for event in batch])
+        except sqlite3.Error as e:
+            self._verify = True
+            self.failures += 1
+            logger.error(f"Attendance ledger update failed, will retry: {e}")
+            return False
+        with self._lock:
+            more = self._pending > 0
+        self.flushed += len(batch)
+        logger.info(f"Flushed {len(batch)} attendance events for {len(counts)} students")
+        if more:
+            self._wake.set()
+        return True
+
+    def _seen_since(self, when):
+        """Last_attendance_time of every student seen at or after when, in one query"""
+        students = (self.root_ref.child('Students').order_by_child('Last_attendance_time')
+                    .start_at(when).get()) or {}
+        return {student_id: info.get('Last_attendance_time') for student_id, info in students.items()
+                if isinstance(info, dict)}
+
+    def report(self):
+        return f"attendance pending={self.pending()} flushed={self.flushed} failures={self.failures}"
@@ -0,0 +1,297 @@
+import base64
+import copy
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for backend settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+BACKEND = getattr(config, 'BACKEND', 'firebase')
+SERVICE_ACCOUNT_KEY = getattr(config, 'SERVICE_ACCOUNT_KEY', 'serviceAccountKey.json')
+FIREBASE_CONFIG = getattr(config, 'FIREBASE_CONFIG', {
+    'databaseURL': "https://face-attendance-realtime-6b86f-default-rtdb.asia-southeast1.firebasedatabase.app/",
+    'storageBucket': "face-attendance-realtime-6b86f.appspot.com"
+})
+LOCAL_BACKEND_DIR = getattr(config, 'LOCAL_BACKEND_DIR', 'local_backend')
+LOCAL_BACKEND_LATENCY = getattr(config, 'LOCAL_BACKEND_LATENCY', 0.0)
+LOCAL_BACKEND_JITTER = getattr(config, 'LOCAL_BACKEND_JITTER', 0.0)
+LOCAL_BACKEND_FAILURE_RATE = getattr(config, 'LOCAL_BACKEND_FAILURE_RATE', 0.0)
+
+ListenEvent = namedtuple('ListenEvent', 'event_type path data')
+
+
+class BackendUnavailable(ConnectionError):
+    """A call failed by the local stand-in's failure injection"""
+
+
+class FirebaseBackend:
+    """The Firebase project: Realtime Database references and the Storage bucket.
+
+    firebase_admin is imported here only, so the local stand-in runs
+    without it installed. The app is initialized once per process.
+    """
+
+    def __init__(self, service_account_key=SERVICE_ACCOUNT_KEY, options=FIREBASE_CONFIG):
+        import firebase_admin
+        from firebase_admin import credentials, db, storage
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(service_account_key), options)
+            logger.info("Firebase initialized successfully")
+        self._db = db
+        self.bucket = storage.bucket()
+
+    def reference(self, path=''):
+        return self._db.reference(path or '/')
+
+    def close(self):
+        pass
+
+
+class LocalBackend:
+    """In-process stand-in for the Realtime Database and Storage.
+
+    Serves the subset of firebase_admin this project uses: references with
+    get/set/update/listen (including the server-side increment) and a
+    bucket with blob upload, get_blob and list_blobs. Every call is delayed
+    by latency plus an exponentially distributed jitter (mean jitter
+    seconds) and fails with BackendUnavailable at failure_rate, drawn from
+    a seeded generator so a run can be repeated. With a path the database
+    is loaded from path/database.json and photos from path/storage/, and
+    close() writes them back, so AddDatatodata.py, encoding.py and Main.py
+    can share one local project (one process at a time).
+    """
+
+    def __init__(self, path=None, latency=0.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.path = path
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.tree = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self.bucket = LocalBucket(self)
+        if path:
+            self._load()
+
+    def reference(self, path=''):
+        return LocalReference(self, path)
+
+    def call(self):
+        """Account for one network round trip: count it, delay it, maybe fail it"""
+        with self.lock:
+            self.calls += 1
+            delay = self.latency + (self._random.expovariate(1.0 / self.jitter) if self.jitter else 0.0)
+            fail = self.failure_rate and self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise BackendUnavailable("Injected backend failure")
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.path, 'database.json'), encoding='utf-8') as f:
+                self.tree = json.load(f)
+        except FileNotFoundError:
+            pass
+        storage_dir = os.path.join(self.path, 'storage')
+        for folder, _, files in os.walk(storage_dir):
+            for name in files:
+                full = os.path.join(folder, name)
+                with open(full, 'rb') as f:
+                    self.bucket.upload(os.path.relpath(full, storage_dir).replace(os.sep, '/'), f.read())
+        logger.info(f"Local backend loaded from {self.path} ({len(self.bucket.blobs)} files)")
+
+    def save(self):
+        """Write the database and stored files under path"""
+        os.makedirs(self.path, exist_ok=True)
+        with self.lock:
+            text = json.dumps(self.tree, indent=1)
+            blobs = list(self.bucket.blobs.values())
+        tmp_path = os.path.join(self.path, 'database.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, os.path.join(self.path, 'database.json'))
+        for blob in blobs:
+            full = os.path.join(self.path, 'storage', *blob.name.split('/'))
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            with open(full, 'wb') as f:
+                f.write(blob.data)
+
+    def close(self):
+        if self.path:
+            self.save()
+
+
+class LocalReference:
+    """In-memory stand-in for a firebase_admin.db.Reference.
+
+    get/set/update/listen behave like the Realtime Database for the calls
+    this project makes, including the server-side increment, writing None
+    to delete and set() on the root replacing the whole database. listen()
+    delivers the initial snapshot; later writes are not streamed.
+    """
+
+    def __init__(self, backend, path=''):
+        self._backend = backend
+        self.path = path.strip('/')
+
+    def child(self, path):
+        return LocalReference(self._backend, f"{self.path}/{path}")
+
+    def _parts(self, path=''):
+        return [p for p in f"{self.path}/{path}".split('/') if p]
+
+    def get(self):
+        self._backend.call()
+        with self._backend.lock:
+            node = self._backend.tree
+            for part in self._parts():
+                if not isinstance(node, dict) or part not in node:
+                    return None
+                node = node[part]
+            return copy.deepcopy(node)
+
+    def _set(self, parts, value):
+        if not parts:
+            self._backend.tree = value if isinstance(value, dict) else {}
+            return
+        node = self._backend.tree
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if isinstance(value, dict) and '.sv' in value:
+            value = (node.get(parts[-1]) or 0) + value['.sv']['increment']
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def set(self, value):
+        self._backend.call()
+        with self._backend.lock:
+            self._set(self._parts(), copy.deepcopy(value))
+
+    def update(self, values):
+        self._backend.call()
+        with self._backend.lock:
+            for path, value in values.items():
+                self._set(self._parts(path), copy.deepcopy(value))
+
+    def order_by_child(self, key):
+        return LocalQuery(self, key)
+
+    def listen(self, callback):
+        callback(ListenEvent('put', '/', self.get()))
+        return LocalListener()
+
+
+class LocalQuery:
+    """Stand-in for a firebase_admin.db.Query: children whose key child is at or after start_at"""
+
+    def __init__(self, reference, key):
+        self._reference = reference
+        self._key = key
+        self._start = None
+
+    def start_at(self, start):
+        self._start = start
+        return self
+
+    def get(self):
+        children = self._reference.get()
+        if not isinstance(children, dict):
+            return {}
+        matches = [(info[self._key], child) for child, info in children.items()
+                   if isinstance(info, dict) and self._key in info
+                   and (self._start is None or (type(info[self._key]) is type(self._start)
+                                                and info[self._key] >= self._start))]
+        return {child: children[child] for _, child in sorted(matches, key=lambda m: (type(m[0]).__name__, m))}
+
+
+class LocalListener:
+    def close(self):
+        pass
+
+
+class LocalBlob:
+    """Stand-in for a google.cloud.storage Blob"""
+
+    def __init__(self, backend, name, data=None):
+        self._backend = backend
+        self.name = name
+        self.data = data
+
+    @property
+    def md5_hash(self):
+        return base64.b64encode(hashlib.md5(self.data).digest()).decode() if self.data is not None else None
+
+    def upload_from_string(self, data, content_type=None):
+        self._backend.call()
+        self.data = data.encode() if isinstance(data, str) else bytes(data)
+        self._backend.bucket.blobs[self.name] = self
+
+    def upload_from_filename(self, filename, content_type=None):
+        with open(filename, 'rb') as f:
+            self.upload_from_string(f.read(), content_type)
+
+    def download_as_bytes(self):
+        self._backend.call()
+        if self.data is None:
+            raise FileNotFoundError(self.name)
+        return self.data
+
+
+class LocalBucket:
+    """In-memory stand-in for a Cloud Storage bucket"""
+
+    def __init__(self, backend):
+        self._backend = backend
+        self.blobs = {}
+
+    def blob(self, name):
+        return self.blobs.get(name) or LocalBlob(self._backend, name)
+
+    def upload(self, name, data):
+        """Store a file directly, without a simulated call (seeding)"""
+        self.blobs[name] = LocalBlob(self._backend, name, data)
+
+    def get_blob(self, name):
+        self._backend.call()
+        return self.blobs.get(name)
+
+    def list_blobs(self, prefix=''):
+        self._backend.call()
+        return [blob for name, blob in list(self.blobs.items()) if name.startswith(prefix)]
+
+
+def open_backend(kind=BACKEND):
+    """Open the configured backend ('firebase' or 'local'); returns None on failure"""
+    try:
+        if kind == 'local':
+            backend = LocalBackend(LOCAL_BACKEND_DIR, latency=LOCAL_BACKEND_LATENCY, jitter=LOCAL_BACKEND_JITTER,
+                                   failure_rate=LOCAL_BACKEND_FAILURE_RATE)
+            logger.info(f"Using the local backend stand-in in {LOCAL_BACKEND_DIR}")
+            return backend
+        if kind != 'firebase':
+            raise ValueError(f"Unknown backend: {kind}")
+        return FirebaseBackend()
+    except Exception as e:
+        logger.error(f"Backend initialization failed: {e}")
+        return None
@@ -0,0 +1,89 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class BackendPool:
+    """Bounded thread pool for backend I/O with per-key request coalescing.
+
+    submit(key, fn, ...) returns a Future. While a request for the same key
+    is in flight, later submissions get that same Future instead of a second
+    request. At most max_pending requests may be queued or running; beyond
+    that submit() returns None so the caller (the render loop) never blocks
+    and can retry on a later frame.
+    """
+
+    def __init__(self, workers=4, max_pending=64):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backend')
+        self.workers = workers
+        self.max_pending = max_pending
+        self._in_flight = {}
+        self._running = 0
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.errors = 0
+        REGISTRY.gauge('face_backend_in_flight', 'Backend requests executing', fn=lambda: self.in_flight)
+        REGISTRY.gauge('face_backend_queue_depth', 'Backend requests waiting for a worker',
+                       fn=lambda: self.queue_depth)
+        for result in ('submitted', 'coalesced', 'rejected'):
+            REGISTRY.counter('face_backend_requests_total', 'Backend lookups by outcome', {'result': result},
+                             fn=lambda result=result: getattr(self, result))
+        REGISTRY.counter('face_backend_errors_total', 'Failed backend operations', {'op': 'lookup'},
+                         fn=lambda: self.errors)
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            if len(self._in_flight) >= self.max_pending:
+                self.rejected += 1
+                return None
+            future = self._executor.submit(self._run, key, fn, *args)
+            self._in_flight[key] = future
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+    def _run(self, key, fn, *args):
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        if not future.cancelled() and future.exception() is not None:
+            self.errors += 1
+            logger.error(f"Backend request for {key} failed: {future.exception()}")
+
+    @property
+    def in_flight(self):
+        """Requests currently executing"""
+        return self._running
+
+    @property
+    def queue_depth(self):
+        """Requests accepted but still waiting for a worker"""
+        with self._lock:
+            return len(self._in_flight) - self._running
+
+    def report(self):
+        return (f"backend in_flight={self.in_flight} queued={self.queue_depth} submitted={self.submitted} "
+                f"coalesced={self.coalesced} rejected={self.rejected} errors={self.errors}")
+
+    def shutdown(self, wait=False):
+        """Stop the workers; without wait, queued requests are dropped"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
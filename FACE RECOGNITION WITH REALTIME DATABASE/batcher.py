@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+
+from metrics import REGISTRY
+from pipeline import StageStats
+
+logger = logging.getLogger(__name__)
+
+
+class EncodingBatcher:
+    """Collect aligned face chips from many frames and encode them in one call.
+
+    Callers (recognition workers of one or several streams) hand in the
+    chips of one frame with submit() and get a Future for that frame's
+    encodings. A single batching thread waits until max_batch chips are
+    queued or the oldest request has waited max_wait seconds, runs
+    encode(chips) once for the whole batch and splits the result back per
+    request. With an executor each batch is submitted to it and up to
+    max_in_flight batches encode at once, one per worker process; the
+    batching thread only waits when all of them are busy, and the next
+    batch accumulates meanwhile. Without one, batches encode in turn on the
+    batching thread.
+    """
+
+    def __init__(self, encode, max_batch=16, max_wait=0.01, executor=None, max_in_flight=1):
+        self.encode = encode
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.executor = executor
+        self.max_in_flight = max(1, max_in_flight)
+        self._pending = []  # (chips, future, submitted_at)
+        self._queued = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._stop = False
+        self.latency = StageStats('encode-batch')
+        self.batches = 0
+        self.chips = 0
+        REGISTRY.counter('face_encode_batches_total', 'Encoder calls made by the batcher', fn=lambda: self.batches)
+        REGISTRY.counter('face_encode_batched_faces_total', 'Faces encoded through the batcher', fn=lambda: self.chips)
+        self._thread = threading.Thread(target=self._loop, name='encode-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, chips):
+        future = Future()
+        if not chips:
+            future.set_result([])
+            return future
+        with self._cond:
+            self._pending.append((chips, future, time.perf_counter()))
+            self._queued += len(chips)
+            self._cond.notify()
+        return future
+
+    def encode_many(self, chips):
+        """Blocking submit(): return the encodings of chips, in order"""
+        return self.submit(chips).result()
+
+    def _take_batch(self):
+        """Wait for a free encoder and a full batch or the max_wait deadline of the oldest request"""
+        with self._cond:
+            while (not self._pending or self._in_flight >= self.max_in_flight) and not self._stop:
+                self._cond.wait()
+            if self._stop:
+                return []
+            deadline = self._pending[0][2] + self.max_wait
+            while self._queued < self.max_batch and not self._stop:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # Whole requests only, so one frame's faces are never split across batches
+            batch, size = [], 0
+            while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch):
+                request = self._pending.pop(0)
+                batch.append(request)
+                size += len(request[0])
+            self._queued -= size
+            self._in_flight += 1
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            chips = [chip for request in batch for chip in request[0]]
+            if self.executor is None:
+                try:
+                    self._finish(batch, chips, self.encode(chips))
+                except Exception as e:
+                    self._fail(batch, chips, e)
+                continue
+            try:
+                encoded = self.executor.submit(self.encode, chips)
+            except Exception as e:
+                self._fail(batch, chips, e)
+                continue
+            encoded.add_done_callback(lambda f, batch=batch, chips=chips: self._done(batch, chips, f))
+
+    def _done(self, batch, chips, encoded):
+        """Runs in the executor's result thread when a submitted batch completes"""
+        if encoded.cancelled():
+            self._fail(batch, chips, CancelledError())
+        elif encoded.exception() is not None:
+            self._fail(batch, chips, encoded.exception())
+        else:
+            self._finish(batch, chips, encoded.result())
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _fail(self, batch, chips, error):
+        self._release()
+        logger.error(f"Batch encoding of {len(chips)} faces failed: {error}")
+        for _, future, _ in batch:
+            future.set_exception(error)
+
+    def _finish(self, batch, chips, encodings):
+        with self._cond:
+            self._in_flight -= 1
+            self.batches += 1
+            self.chips += len(chips)
+            self._cond.notify_all()
+        done = time.perf_counter()
+        offset = 0
+        for request_chips, future, submitted in batch:
+            future.set_result(encodings[offset:offset + len(request_chips)])
+            offset += len(request_chips)
+            self.latency.record(done - submitted)
+
+    def report(self):
+        p50_ms, p99_ms = (1000 * q for q in self.latency.percentiles(0.5, 0.99))
+        mean_batch = self.chips / self.batches if self.batches else 0.0
+        return (f"encode batches={self.batches} faces/batch={mean_batch:.1f} "
+                f"latency p50={p50_ms:.1f}ms p99={p99_ms:.1f}ms")
+
+    def close(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout=2)
+        for _, future, _ in self._pending:
+            future.cancel()
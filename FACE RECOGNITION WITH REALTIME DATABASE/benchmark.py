@@ -0,0 +1,274 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from backend import LocalBackend
+from benchmark_matcher import noisy_queries, synthetic_gallery, time_search
+from matcher import GalleryMatcher
+from pipeline import StageStats
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+# Local stand-in for Firebase
+
+def local_backend(student_ids, image_dir='Images', latency=0.0):
+    """Local backend seeded with a profile (and photo, if enrolled) for every id"""
+    students = {}
+    backend = LocalBackend(latency=latency)
+    for student_id in student_ids:
+        students[student_id] = {'name': student_id, 'major': 'Benchmark', 'Starting_year': 2020,
+                                'total_attendance': 0, 'standing': 'G', 'year': 1,
+                                'Last_attendance_time': '2000-01-01 00:00:00'}
+        path = os.path.join(image_dir, f'{student_id}.png')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                backend.bucket.upload(f'images/{student_id}.png', f.read())
+    backend.tree['Students'] = students
+    return backend
+
+
+# Measurements
+
+def peak_rss_mb():
+    """Peak resident set size of this process, or None where it cannot be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def rss_mb():
+    """Current resident set size of this process, or None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def stage_summary(stats):
+    mean_ms, _, _ = stats.summary()
+    p50, p95, p99 = stats.percentiles(0.5, 0.95, 0.99)
+    return {'mean_ms': round(mean_ms, 3), 'p50_ms': round(1000 * p50, 3),
+            'p95_ms': round(1000 * p95, 3), 'p99_ms': round(1000 * p99, 3)}
+
+
+def replay_frames(source, label=None, limit=0):
+    """Yield (image, expected student id) from a video file or an image directory.
+
+    In a directory the expected id is the sub-directory name, or the file
+    name for images directly inside it (the Images/<id>.png layout).
+    """
+    count = 0
+    if os.path.isdir(source):
+        for root, _, files in sorted(os.walk(source)):
+            for name in sorted(files):
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                img = cv2.imread(os.path.join(root, name))
+                if img is None:
+                    continue
+                expected = os.path.basename(root) if root != source else os.path.splitext(name)[0]
+                yield img, expected
+                count += 1
+                if limit and count >= limit:
+                    return
+        return
+    cap = cv2.VideoCapture(source)
+    while not limit or count < limit:
+        success, img = cap.read()
+        if not success:
+            break
+        yield img, label
+        count += 1
+    cap.release()
+
+
+def build_gallery(distractors=0):
+    """The enrolled gallery, optionally padded with synthetic identities to test scale"""
+    from gallery import build_matcher, load_centroids, load_encoding_file, with_hot_cache
+    embeddings, ids, _ = load_encoding_file()
+    if embeddings is None:
+        return None, []
+    centroids, centroid_ids = load_centroids()
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    enrolled = list(dict.fromkeys(ids))
+    if distractors:
+        extra = synthetic_gallery(distractors, embeddings.shape[1])
+        extra_ids = [f'synthetic-{i}' for i in range(distractors)]
+        embeddings = np.vstack([embeddings, extra])
+        ids = list(ids) + extra_ids
+        if centroids is not None:
+            centroids = np.vstack([centroids, extra])
+            centroid_ids = list(centroid_ids) + extra_ids
+    matcher = build_matcher(embeddings, ids, centroids=centroids, centroid_ids=centroid_ids)
+    return with_hot_cache(matcher), enrolled
+
+
+def run_replay(args):
+    """Replay recorded frames through detect -> encode -> match -> attendance"""
+    from recognition import FrameRecognizer
+    from services import BackendServices
+
+    gallery, enrolled = build_gallery(args.distractors)
+    if gallery is None:
+        logger.error("No enrolled encodings to replay against; run encoding.py first")
+        return None
+    backend = local_backend(enrolled, latency=args.backend_latency / 1000)
+    workdir = tempfile.mkdtemp(prefix='face-benchmark-')
+    services = BackendServices(backend, cache_dir=os.path.join(workdir, 'profile_cache'),
+                               ledger_path=os.path.join(workdir, 'attendance.db'),
+                               journal_path=os.path.join(workdir, 'attendance_journal.jsonl'))
+    services.start()
+    # Unrelated still images must not be tracked as one moving face or diffed for motion
+    still_images = os.path.isdir(args.source)
+    recognizer = FrameRecognizer(gallery, tracking=not still_images, adaptive=not args.fixed, motion=not still_images)
+    frame_stats = StageStats('frame')
+
+    frames = faces = labeled = correct = wrong = unknown = missed = 0
+    start = time.perf_counter()
+    for img, expected in replay_frames(args.source, args.label, args.limit):
+        with frame_stats.time():
+            results = recognizer.recognize(img)
+        frames += 1
+        faces += len(results)
+        for detected_id, distance, _ in results:
+            if detected_id is not None:
+                services.submit(detected_id, 'replay', distance)
+        if expected is None:
+            continue
+        labeled += 1
+        if not results:
+            missed += 1
+        elif any(detected_id == expected for detected_id, _, _ in results):
+            correct += 1
+        elif all(detected_id is None for detected_id, _, _ in results):
+            unknown += 1
+        else:
+            wrong += 1
+    elapsed = time.perf_counter() - start
+
+    # Let the backend drain so its latency and the attendance writes are part of the run
+    services.pool.shutdown(wait=True)
+    services.attendance.flush()
+    services.close()
+
+    stages = {name: stage_summary(stats) for name, stats in recognizer.stats.items()}
+    stages['backend'] = stage_summary(services.stats)
+    stages['frame'] = stage_summary(frame_stats)
+    return {
+        'source': args.source,
+        'frames': frames,
+        'faces': faces,
+        'seconds': round(elapsed, 3),
+        'fps': round(frames / elapsed, 2) if elapsed else 0.0,
+        'stages': stages,
+        'accuracy': {
+            'labeled_frames': labeled,
+            'correct': correct,
+            'wrong': wrong,
+            'unknown': unknown,
+            'no_face': missed,
+            'top1': round(correct / labeled, 4) if labeled else None,
+        },
+        'backend': {
+            'backend_calls': backend.calls,
+            'attendance_flushed': services.attendance.flushed,
+            'latency_ms': args.backend_latency,
+        },
+        'gallery_size': len(gallery),
+        'reports': [report() for report in recognizer.reporters()],
+    }
+
+
+def run_galleries(args):
+    """Matcher build time, scanned memory, per-frame latency and recall on synthetic galleries"""
+    results = []
+    for size in args.sizes:
+        gallery = synthetic_gallery(size)
+        ids = [str(i) for i in range(size)]
+        queries, truth = noisy_queries(gallery, args.queries)
+        for index_type in args.indexes:
+            for quantization in args.quantizations:
+                if index_type == 'ivfpq' and quantization != 'none':
+                    continue
+                # The peak RSS only ever grows, so each build is measured as the growth of the current RSS
+                matcher = None
+                gc.collect()
+                rss_before = rss_mb()
+                t0 = time.perf_counter()
+                matcher = GalleryMatcher(gallery, ids, index_type=index_type, quantization=quantization,
+                                         rerank=args.rerank)
+                build = time.perf_counter() - t0
+                rss_after = rss_mb()
+                latency = time_search(matcher, queries, args.batch, args.repeats)
+                _, found = matcher.search(queries)
+                results.append({
+                    'size': size,
+                    'index': matcher.index_type,
+                    'quantization': matcher.quantization,
+                    'index_mb': round(matcher.index_bytes / 1e6, 2),
+                    'build_s': round(build, 3),
+                    'ms_per_frame': round(latency, 3),
+                    'frames_per_s': round(1000 / latency, 1) if latency else None,
+                    'recall_at_1': round(float(np.mean(found[:, 0] == truth)), 4),
+                    'build_rss_mb': round(rss_after - rss_before, 1) if rss_before is not None else None,
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recognition hot path offline")
+    parser.add_argument('source', nargs='?', help="video file or image directory to replay")
+    parser.add_argument('--label', help="student id expected in every frame of a video")
+    parser.add_argument('--limit', type=int, default=0, help="replay at most this many frames")
+    parser.add_argument('--fixed', action='store_true', help="disable adaptive scheduling for repeatable runs")
+    parser.add_argument('--distractors', type=int, default=0, help="synthetic identities added to the gallery")
+    parser.add_argument('--backend-latency', type=float, default=0.0, help="simulated Firebase round trip, ms")
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1000, 10000, 100000],
+                        help="synthetic gallery sizes (none to skip)")
+    parser.add_argument('--indexes', nargs='+', default=['flat', 'ivf'])
+    parser.add_argument('--quantizations', nargs='+', default=['none', 'float16', 'int8'])
+    parser.add_argument('--rerank', type=int, default=32, help="candidates re-ranked when quantized")
+    parser.add_argument('--queries', type=int, default=256)
+    parser.add_argument('--batch', type=int, default=4, help="faces per frame")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': sys.version.split()[0]}
+    if args.source:
+        report['replay'] = run_replay(args)
+    if args.sizes:
+        report['galleries'] = run_galleries(args)
+    report['peak_rss_mb'] = peak_rss_mb()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from embedding_store import write_store
+from matcher import QUANTIZATIONS, GalleryMatcher, faiss
+from shards import ShardedMatcher
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def synthetic_gallery(size, dim=128, seed=0):
+    """Random unit-length embeddings with identity clusters like real face encodings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, size // 50), dim)).astype(np.float32)
+    gallery = centres[rng.integers(0, len(centres), size)] + 0.6 * rng.normal(size=(size, dim)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery
+
+
+def noisy_queries(gallery, count, noise=0.02, seed=1):
+    """Queries are gallery rows plus a small perturbation, like a new frame of a known face"""
+    rng = np.random.default_rng(seed)
+    truth = rng.integers(0, len(gallery), count)
+    queries = gallery[truth] + noise * rng.normal(size=(count, gallery.shape[1])).astype(np.float32)
+    return queries, truth
+
+
+def time_search(matcher, queries, batch, repeats):
+    """Median milliseconds to search one batch of faces (one frame)"""
+    timings = []
+    for _ in range(repeats):
+        for start in range(0, len(queries), batch):
+            t0 = time.perf_counter()
+            matcher.search(queries[start:start + batch])
+            timings.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gallery matcher recall and latency")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=256)
+    parser.add_argument('--batch', type=int, default=4, help="faces per frame")
+    parser.add_argument('--nprobe', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--rerank', type=int, default=32, help="candidates re-ranked when quantized")
+    parser.add_argument('--shards', type=int, nargs='*', default=[],
+                        help="also time the flat index split across this many worker processes")
+    args = parser.parse_args()
+
+    configs = [(index_type, quantization) for index_type in ('flat', 'ivf') for quantization in QUANTIZATIONS]
+    configs += [('ivfpq', 'none')] if faiss is not None else []
+    print(f"{'gallery':>8} {'index':>6} {'storage':>8} {'MB':>8} {'build s':>8} {'ms/frame':>9} {'recall@1':>9}")
+    for size in args.sizes:
+        gallery = synthetic_gallery(size)
+        ids = [str(i) for i in range(size)]
+        queries, _ = noisy_queries(gallery, args.queries)
+        exact = None
+        for index_type, quantization in configs:
+            t0 = time.perf_counter()
+            matcher = GalleryMatcher(gallery, ids, index_type=index_type, nprobe=args.nprobe,
+                                     quantization=quantization, rerank=args.rerank)
+            build = time.perf_counter() - t0
+            latency = time_search(matcher, queries, args.batch, args.repeats)
+            _, found = matcher.search(queries)
+            if exact is None:
+                exact = found[:, 0]
+            recall = float(np.mean(found[:, 0] == exact))
+            print(f"{size:>8} {index_type:>6} {quantization:>8} {matcher.index_bytes / 1e6:>8.2f} "
+                  f"{build:>8.2f} {latency:>9.3f} {recall:>9.3f}")
+        if not args.shards:
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'encodings.bin')
+            write_store(path, ids, gallery)
+            for shards in args.shards:
+                t0 = time.perf_counter()
+                matcher = ShardedMatcher(path, shards, index={'rerank': args.rerank}, refresh=0)
+                build = time.perf_counter() - t0
+                latency = time_search(matcher, queries, args.batch, args.repeats)
+                _, found = matcher.search(queries)
+                matcher.close()
+                recall = float(np.mean(found[:, 0] == exact))
+                print(f"{size:>8} {f'{shards}x':>6} {'none':>8} {size * gallery.shape[1] * 4 / 1e6:>8.2f} "
+                      f"{build:>8.2f} {latency:>9.3f} {recall:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import http.client
+import json
+import logging
+import threading
+from urllib.parse import quote, urlsplit
+
+import cv2
+import numpy as np
+
+from backend_pool import BackendPool
+from profile_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for client settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+CLIENT_JPEG_QUALITY = getattr(config, 'CLIENT_JPEG_QUALITY', 80)
+CLIENT_TIMEOUT = getattr(config, 'CLIENT_TIMEOUT', 5.0)
+CLIENT_PROFILE_TTL = getattr(config, 'CLIENT_PROFILE_TTL', 10)
+SERVER_TOKEN = getattr(config, 'SERVER_TOKEN', '')
+PROFILE_CACHE_SIZE = getattr(config, 'PROFILE_CACHE_SIZE', 5000)
+PHOTO_CACHE_SIZE = getattr(config, 'PHOTO_CACHE_SIZE', 500)
+PROFILE_CACHE_TTL = getattr(config, 'PROFILE_CACHE_TTL', 3600)
+BACKEND_WORKERS = getattr(config, 'BACKEND_WORKERS', 4)
+BACKEND_MAX_PENDING = getattr(config, 'BACKEND_MAX_PENDING', 64)
+
+
+class ServerConnection:
+    """Keep-alive HTTP connection to the recognition server, one per calling thread"""
+
+    def __init__(self, url, timeout=CLIENT_TIMEOUT, token=SERVER_TOKEN):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, content_type='image/jpeg'):
+        """Return (status, body bytes); reconnects once if the kept-alive connection went stale"""
+        for attempt in (0, 1):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                headers = dict(self.headers, **({'Content-Type': content_type} if body else {}))
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (ConnectionError, http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+
+class RecognitionClient:
+    """Sends camera frames to the recognition server instead of running dlib locally"""
+
+    def __init__(self, connection, camera_id):
+        self.connection = connection
+        self.path = f'/recognize?camera={quote(str(camera_id))}'
+        self.frame_skip = 1
+
+    def recognize(self, img, dropped=0):
+        """Return (student_id or None, distance, (top, right, bottom, left)) per face in img.
+
+        Same contract as FrameRecognizer.recognize; dropped is unused because
+        the server schedules each camera from its own latency.
+        """
+        ok, jpeg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, CLIENT_JPEG_QUALITY])
+        if not ok:
+            return []
+        status, body = self.connection.request('POST', self.path, jpeg.tobytes())
+        result = json.loads(body)
+        if status != 200:
+            raise RuntimeError(f"Recognition server returned {status}: {result.get('error')}")
+        # The server's scheduler for this camera decides how many frames to send
+        self.frame_skip = result.get('frame_skip', self.frame_skip)
+        return [(face['id'], face['distance'], tuple(face['box'])) for face in result['faces']]
+
+
+class RemoteProfiles:
+    """Memory cache of profiles and photos fetched from the recognition server.
+
+    Profiles expire after CLIENT_PROFILE_TTL so attendance counts written by
+    the server show up on the next visit; photos follow PROFILE_CACHE_TTL.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.profiles = LRUCache(PROFILE_CACHE_SIZE, CLIENT_PROFILE_TTL)
+        self.photos = LRUCache(PHOTO_CACHE_SIZE, PROFILE_CACHE_TTL)
+
+    def fetch(self, student_id):
+        path = f'/students/{quote(str(student_id))}'
+        if self.profiles.get(student_id) is None:
+            status, body = self.connection.request('GET', path)
+            if status == 200:
+                self.profiles.put(student_id, json.loads(body))
+        if self.photos.get(student_id) is None:
+            status, body = self.connection.request('GET', path + '/photo')
+            if status == 200:
+                img = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+                if img is not None:
+                    self.photos.put(student_id, img)
+
+    def peek(self, student_id):
+        return self.profiles.peek(student_id), self.photos.peek(student_id)
+
+
+class RemoteServices:
+    """Thin-client stand-in for BackendServices.
+
+    The server already records attendance for every face it recognizes,
+    so the client only fetches what the student card shows.
+    """
+
+    def __init__(self, connection):
+        self.profile_cache = RemoteProfiles(connection)
+        self.pool = BackendPool(workers=BACKEND_WORKERS, max_pending=BACKEND_MAX_PENDING)
+
+    def start(self):
+        pass
+
+    def submit(self, student_id, stream=None, distance=None):
+        future = self.pool.submit(student_id, self.profile_cache.fetch, student_id)
+        if future is None:
+            logger.warning(f"Backend queue full, retrying student {student_id} on a later frame")
+        return future
+
+    def reporters(self):
+        return [self.pool.report]
+
+    def close(self):
+        self.pool.shutdown()
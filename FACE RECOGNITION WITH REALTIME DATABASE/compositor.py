@@ -0,0 +1,97 @@
+from collections import OrderedDict
+
+import cv2
+import cvzone
+
+
+class Compositor:
+    """Draws the attendance screen into one preallocated canvas.
+
+    The background with each mode image pasted in is composited once at
+    start-up. Per frame only the camera area is overwritten; the mode
+    panel and student card are redrawn only when what they show changes,
+    and student photos are resized to thumbnails once per student.
+    """
+
+    CAMERA_ORIGIN = (162, 55)  # (top, left) of the camera feed
+    PANEL = (44, 808, 633, 414)  # (top, left, height, width) of the mode panel
+    THUMB_ORIGIN = (175, 909)
+    THUMB_SIZE = 216
+    BOX_MARGIN = 8  # face box corners are drawn this far outside the box
+
+    def __init__(self, background, mode_images, max_thumbnails=64):
+        top, left, height, width = self.PANEL
+        self.layers = []
+        for mode_image in mode_images:
+            layer = background.copy()
+            layer[top:top + height, left:left + width] = mode_image
+            self.layers.append(layer)
+        self.canvas = self.layers[0].copy()
+        self.max_thumbnails = max_thumbnails
+        self._thumbnails = OrderedDict()
+        self._panel_key = (0, None, None, None)
+        self._box_extent = None
+
+    def thumbnail(self, student_id, img):
+        """Return the card-sized photo of a student, resizing only when the photo changed"""
+        item = self._thumbnails.get(student_id)
+        if item is None or item[0] is not img:
+            item = (img, cv2.resize(img, (self.THUMB_SIZE, self.THUMB_SIZE)))
+            self._thumbnails[student_id] = item
+            while len(self._thumbnails) > self.max_thumbnails:
+                self._thumbnails.popitem(last=False)
+        self._thumbnails.move_to_end(student_id)
+        return item[1]
+
+    def draw_frame(self, img, boxes):
+        """Copy the camera frame into the canvas and draw the face boxes on it"""
+        top, left = self.CAMERA_ORIGIN
+        h, w = img.shape[:2]
+        if self._box_extent is not None:
+            # Restore what the last boxes drew outside the camera area; the frame covers the inside
+            y0, y1, x0, x1 = self._box_extent
+            self.canvas[y0:y1, x0:x1] = self.layers[self._panel_key[0]][y0:y1, x0:x1]
+            self._box_extent = None
+        self.canvas[top:top + h, left:left + w] = img
+        for bbox in boxes:
+            cvzone.cornerRect(self.canvas, bbox, rt=0)
+        if boxes:
+            m = self.BOX_MARGIN
+            self._box_extent = (max(0, min(y for x, y, bw, bh in boxes) - m),
+                                max(y + bh for x, y, bw, bh in boxes) + m,
+                                max(0, min(x for x, y, bw, bh in boxes) - m),
+                                max(x + bw for x, y, bw, bh in boxes) + m)
+
+    def draw_panel(self, modeType, student_id=None, studentInfo=None, imgStudent=None):
+        """Show the mode image and, when given, the student card; a no-op if nothing changed"""
+        # Profile dicts and photos are replaced, never mutated, when they change
+        key = (modeType, student_id, id(studentInfo), id(imgStudent))
+        if key == self._panel_key:
+            return
+        self._panel_key = key
+        top, left, height, width = self.PANEL
+        self.canvas[top:top + height, left:left + width] = self.layers[modeType][top:top + height, left:left + width]
+        if studentInfo is None or imgStudent is None:
+            return
+
+        imgBackground = self.canvas
+        cv2.putText(imgBackground, str(studentInfo['total_attendance']), (861, 125),
+                    cv2.FONT_HERSHEY_COMPLEX, 1, (255, 255, 255), 1)
+        cv2.putText(imgBackground, str(studentInfo['major']), (1006, 550),
+                    cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255), 1)
+        cv2.putText(imgBackground, str(student_id), (1006, 493),
+                    cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255), 1)
+        cv2.putText(imgBackground, str(studentInfo['standing']), (910, 625),
+                    cv2.FONT_HERSHEY_COMPLEX, 0.6, (100, 100, 100), 1)
+        cv2.putText(imgBackground, str(studentInfo['year']), (1025, 625),
+                    cv2.FONT_HERSHEY_COMPLEX, 0.6, (100, 100, 100), 1)
+        cv2.putText(imgBackground, str(studentInfo['Starting_year']), (1125, 625),
+                    cv2.FONT_HERSHEY_COMPLEX, 0.6, (100, 100, 100), 1)
+
+        (w, h), _ = cv2.getTextSize(studentInfo['name'], cv2.FONT_HERSHEY_COMPLEX, 1, 1)
+        offset = (width - w) // 2
+        cv2.putText(imgBackground, str(studentInfo['name']), (left + offset, 445),
+                    cv2.FONT_HERSHEY_COMPLEX, 1, (50, 50, 50), 1)
+
+        y, x = self.THUMB_ORIGIN
+        imgBackground[y:y + self.THUMB_SIZE, x:x + self.THUMB_SIZE] = self.thumbnail(student_id, imgStudent)
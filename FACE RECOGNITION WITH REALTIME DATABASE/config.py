@@ -7,11 +7,124 @@ FIREBASE_CONFIG = {
     'storageBucket': "face-attendance-realtime-6b86f.appspot.com"
 }
 
+# Backend Settings
+BACKEND = 'firebase'  # 'firebase', or 'local' for the in-process stand-in (no credentials needed)
+LOCAL_BACKEND_DIR = 'local_backend'  # Where the local stand-in keeps database.json and storage/
+LOCAL_BACKEND_LATENCY = 0.0  # Seconds added to every local backend call (simulated round trip)
+LOCAL_BACKEND_JITTER = 0.0  # Mean of the exponential extra delay per local call, in seconds
+LOCAL_BACKEND_FAILURE_RATE = 0.0  # Share of local calls that fail, to exercise retries and the ledger
+
 # Face Recognition Settings
-FRAME_SKIP = 2  # Process every 2nd frame to reduce CPU load
-FACE_DETECTION_SCALE = 0.25  # Scale down image for faster processing
+FRAME_SKIP = 2  # Process every 2nd frame to reduce CPU load (starting value when adaptive)
+FACE_DETECTION_SCALE = 0.25  # Scale down image for faster processing (starting value when adaptive)
 MIN_FACE_CONFIDENCE = 0.6  # Minimum confidence threshold for face matches
-FACE_DETECTION_MODEL = 'cnn'  # Use CNN model for better accuracy ('hog' for faster processing)
+FACE_DETECTION_MODEL = 'cnn'  # Use CNN model for better accuracy ('hog' for faster processing, and never escalates to CNN)
+
+# Gallery Matcher Settings
+MATCHER_INDEX = 'flat'  # 'flat' (exact), 'ivf' (approximate, large rosters) or 'ivfpq' (needs faiss)
+MATCHER_NLIST = 0  # IVF cells, 0 = sqrt(gallery size)
+MATCHER_NPROBE = 8  # IVF cells scanned per face (higher = better recall, slower)
+MATCHER_QUANTIZATION = 'none'  # 'none', 'float16' or 'int8': scan a compact copy of the gallery, then re-rank exactly
+MATCHER_RERANK = 32  # Candidates per face re-ranked against full-precision encodings when quantized
+MATCHER_SHORTLIST = 8  # Students whose prototypes are compared after the centroid search (several photos per student)
+MATCHER_SHARDS = 0  # Split encodings.bin across this many matcher processes (0 = match in-process)
+MATCHER_SHARD_REFRESH = 5.0  # Seconds between checks of encodings.bin for newly enrolled students
+HOT_CACHE_SIZE = 512  # Recently matched embeddings checked before the gallery (0 = disabled)
+HOT_CACHE_RADIUS = 0.15  # A face this close to a cached embedding takes its student without a search
+HOT_CACHE_TTL = 3600  # Seconds an unused cache entry stays valid
+
+# Pipeline Settings
+PIPELINE_WORKERS = 2  # Frames recognized in parallel, each in its own worker process
+PIPELINE_USE_PROCESSES = True  # Run detection in worker processes so the display never waits on dlib
+PIPELINE_QUEUE_SIZE = 2  # Frames buffered per stage; the oldest frame is dropped when full
+STATS_LOG_INTERVAL = 10  # Seconds between per-stage latency log lines
+
+# Face Tracking Settings (encode a face only when its track is new or uncertain)
+TRACKING_ENABLED = True
+TRACK_IOU_THRESHOLD = 0.3  # Minimum box overlap to continue a track
+TRACK_MAX_MISSES = 5  # Processed frames a track survives without a detection
+TRACK_REENCODE_INTERVAL = 30  # Re-encode a recognized track at least this often (processed frames)
+TRACK_CONFIDENCE_DECAY = 0.95  # Per-frame confidence decay; movement decays it faster
+TRACK_MIN_CONFIDENCE = 0.3  # Re-encode once track confidence falls below this
+
+# Adaptive Detection Scheduling (tunes frame skip, scale and detector at runtime)
+ADAPTIVE_SCHEDULING = True  # False = use FRAME_SKIP / FACE_DETECTION_SCALE / FACE_DETECTION_MODEL as fixed
+SCHEDULER_TARGET_LATENCY = 0.2  # Seconds budget to recognize one frame
+SCHEDULER_CPU_BUDGET = 0.75  # Share of worker time recognition may keep busy
+SCHEDULER_MAX_SKIP = 6  # Never process fewer than every Nth frame
+SCHEDULER_INTERVAL = 2.0  # Seconds between adjustments
+
+# Enrollment Settings (encoding.py)
+ENCODING_CACHE_FILE = 'encoding_cache.json'  # Content hashes and encodings of already enrolled images
+ENCODING_WORKERS = 0  # Encoder processes, 0 = all cores
+EMBEDDING_STORE_FILE = 'encodings.bin'  # Memory-mapped embedding store written by encoding.py
+CENTROID_STORE_FILE = 'centroids.bin'  # One averaged encoding per student, searched before the prototypes
+ENROLL_MAX_PROTOTYPES = 5  # Most diverse photos kept per student from Images/<id>/
+ENROLL_OUTLIER_DISTANCE = 0.45  # Photos further than this from the student's median encoding are ignored
+
+# Student Profile Cache (roster and photos preloaded, kept current by a database listener)
+PROFILE_CACHE_DIR = 'profile_cache'  # Local on-disk store (SQLite) of profiles and photos
+PROFILE_CACHE_SIZE = 5000  # Profiles kept in memory
+PHOTO_CACHE_SIZE = 500  # Decoded photos kept in memory
+PROFILE_CACHE_TTL = 3600  # Seconds before an entry is refreshed in the background (profiles: only without the listener)
+
+# Backend I/O Pool (profile lookups and attendance for every recognized face)
+BACKEND_WORKERS = 4  # Concurrent backend requests
+BACKEND_MAX_PENDING = 64  # Queued + running requests before new ones are deferred
+
+# Multi-Camera Mode (multistream.py)
+STREAM_SOURCES = [0]  # Camera indices, RTSP URLs or video files used when none are given on the command line
+STREAM_WORKERS = 4  # Recognition workers shared by all streams
+STREAM_USE_PROCESSES = True  # Run detection in worker processes
+STREAM_RECONNECT_DELAY = 5.0  # Seconds before a lost live stream is reopened
+
+# Batched Face Encoding (faces of concurrent frames and streams share one encoder call)
+ENCODE_BATCHING = True
+ENCODE_MAX_BATCH = 16  # Faces per encoder call
+ENCODE_MAX_WAIT = 0.01  # Seconds the first face of a batch waits for more
+
+# Metrics and Profiling
+METRICS_PORT = 9108  # Prometheus endpoint at http://METRICS_HOST:METRICS_PORT/metrics, 0 = disabled
+METRICS_HOST = '127.0.0.1'  # Use '0.0.0.0' to let a remote Prometheus scrape the kiosk
+PROFILER_ENABLED = False  # Sample all thread stacks; served at /profile and written on exit
+PROFILER_INTERVAL = 0.005  # Seconds between stack samples
+PROFILER_OUTPUT = 'profile.folded'  # Folded stacks for flamegraph tools
+
+# Recognition Server (server.py) and Thin Clients
+SERVER_HOST = '127.0.0.1'  # Use '0.0.0.0' to serve kiosks on the LAN (then SERVER_TOKEN is required)
+SERVER_TOKEN = ''  # Shared secret kiosks send as 'Authorization: Bearer <token>'; set it on both sides
+SERVER_PORT = 8765
+SERVER_WORKERS = 4  # Recognition workers shared by all cameras
+SERVER_USE_PROCESSES = True  # Run detection in worker processes
+SERVER_MAX_BODY = 8 * 1024 * 1024  # Largest accepted frame or WebSocket message in bytes
+SERVER_MAX_HEADERS = 100  # Most header lines accepted in one request
+SERVER_CAMERA_IDLE = 300  # Seconds before an idle camera's tracking state is dropped
+RECOGNITION_SERVER_URL = ''  # e.g. 'http://10.0.0.5:8765' makes Main.py a thin client of that server
+CAMERA_ID = 'kiosk'  # Name this kiosk uses on the server (one tracker per name)
+CLIENT_JPEG_QUALITY = 80  # JPEG quality of frames sent to the server
+CLIENT_TIMEOUT = 5.0  # Seconds to wait for the server
+CLIENT_PROFILE_TTL = 10  # Seconds a thin client keeps a profile before re-fetching it
+
+# Face Quality Gate (faces failing these are not encoded)
+QUALITY_GATE = True  # Skip tiny, blurred, badly exposed or turned-away faces before the encoder
+QUALITY_MIN_FACE_SIZE = 40  # Smallest face side in camera pixels
+QUALITY_MIN_SHARPNESS = 25.0  # Laplacian variance of the face at 64px wide; lower = blurrier
+QUALITY_MIN_BRIGHTNESS = 40  # Mean face brightness range (0-255)
+QUALITY_MAX_BRIGHTNESS = 220
+QUALITY_MAX_YAW = 0.35  # Head turn from landmarks, 0 frontal, ~0.5 profile (0 disables the pose check)
+
+# Motion Gating (detection only where the scene changes)
+MOTION_GATING = True  # Skip detection on static frames, limit it to changed regions and active tracks
+MOTION_WIDTH = 160  # Width of the grayscale copy compared against the background
+MOTION_THRESHOLD = 25  # Brightness change (0-255) that counts as motion
+MOTION_MIN_AREA = 0.002  # Share of the frame that must change before a frame counts as moving
+MOTION_LEARNING_RATE = 0.05  # How fast the background absorbs changes (higher = forgets sooner)
+MOTION_ROI_MARGIN = 0.5  # Regions are widened by this share of their size before detection
+MOTION_MAX_ROI_SHARE = 0.5  # Detect on the whole frame when regions cover more than this share
+MOTION_REFRESH = 10.0  # Seconds between whole-frame detections regardless of motion
+
+# Startup Settings
+STARTUP_SNAPSHOT = 'warm_start.pkl'  # Decoded assets + built gallery index for fast restarts ('' = disabled)
 
 # GPU Acceleration Settings
 USE_GPU = False  # Set to True if you have GPU support
@@ -31,6 +144,11 @@ def check_gpu_support():
 MAX_FRAME_WIDTH = 640
 MAX_FRAME_HEIGHT = 480
 ATTENDANCE_COOLDOWN = 300  # 5 minutes cooldown between attendance records
+ATTENDANCE_LEDGER = 'attendance.db'  # Local SQLite history of every attendance event (reports: python ledger.py)
+ATTENDANCE_JOURNAL = 'attendance_journal.jsonl'  # Old journal of unsent events, moved into the ledger on start
+ATTENDANCE_BATCH_SIZE = 50  # Events per Firebase write
+ATTENDANCE_FLUSH_INTERVAL = 2.0  # Seconds between background flushes
+ATTENDANCE_LATE_AFTER = 60  # Events older than this when sent never move Last_attendance_time backwards
 
 # Debug Settings
 DEBUG_MODE = False
@@ -0,0 +1,107 @@
+import logging
+import os
+import struct
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'FACEEMB\0'
+VERSION = 1
+# magic, version, embedding dim, record count, id width in bytes, padding to 64 bytes
+HEADER = struct.Struct('<8sIIQI36x')
+
+
+def record_dtype(dim, id_width):
+    """One record: fixed-width id, squared norm, float32 embedding"""
+    return np.dtype([('id', f'S{id_width}'), ('sq_norm', '<f4'), ('embedding', '<f4', (dim,))])
+
+
+class EmbeddingStore:
+    """Versioned binary store of face embeddings that is memory-mapped on open.
+
+    The file is a 64-byte header followed by fixed-size records, so the
+    embedding matrix and squared norms are read-only views into the page
+    cache: opening is near-instant and every process on the host that maps
+    the file shares the same pages. Records are paired with their id on
+    write, so ids can never drift out of alignment with embeddings.
+    append() adds records at the end and bumps the count in the header
+    last; a crash mid-append leaves the previous records intact.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, dim, count, id_width = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an embedding store")
+        if version != VERSION:
+            raise ValueError(f"Unsupported embedding store version {version} in {path}")
+        self.dim = dim
+        self.id_width = id_width
+        self.dtype = record_dtype(dim, id_width)
+        if count:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r', offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+        self.ids = [raw.decode('utf-8') for raw in self.records['id'].tolist()]
+        self.index = {}
+        for row, student_id in enumerate(self.ids):
+            self.index.setdefault(student_id, []).append(row)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def embeddings(self):
+        """(count, dim) float32 view of the mapped file, no copy"""
+        return self.records['embedding']
+
+    @property
+    def sq_norms(self):
+        return self.records['sq_norm']
+
+    def rows(self, student_id):
+        """Rows holding embeddings of one student"""
+        return self.index.get(student_id, [])
+
+    @staticmethod
+    def create(path, dim=128, id_width=32):
+        """Write an empty store and return it"""
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, dim, 0, id_width))
+        return EmbeddingStore(path)
+
+    def append(self, ids, embeddings):
+        """Append records without rewriting existing ones; returns a reopened store"""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), self.dim)
+        new = np.zeros(len(ids), dtype=self.dtype)
+        for i, student_id in enumerate(ids):
+            raw = str(student_id).encode('utf-8')
+            if len(raw) > self.id_width:
+                raise ValueError(f"Student id {student_id!r} longer than {self.id_width} bytes")
+            new['id'][i] = raw
+        new['embedding'] = embeddings
+        new['sq_norm'] = np.einsum('ij,ij->i', embeddings, embeddings)
+
+        count = len(self) + len(ids)
+        with open(self.path, 'r+b') as f:
+            f.seek(HEADER.size + len(self) * self.dtype.itemsize)
+            f.write(new.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, self.dim, count, self.id_width))
+        logger.info(f"Appended {len(ids)} embeddings to {self.path} ({count} total)")
+        return EmbeddingStore(self.path)
+
+
+def write_store(path, ids, embeddings, dim=128, id_width=32):
+    """Write a complete store atomically, replacing any existing file"""
+    tmp_path = path + '.tmp'
+    store = EmbeddingStore.create(tmp_path, dim, id_width)
+    if len(ids):
+        store.append(ids, embeddings)
+    del store
+    os.replace(tmp_path, path)
+    return EmbeddingStore(path)
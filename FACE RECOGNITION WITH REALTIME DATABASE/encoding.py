@@ -1,70 +1,196 @@
 import cv2
-import face_recognition
-import pickle
+import numpy as np
+import hashlib
+import json
+import multiprocessing
 import os
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import storage
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import logging
+from backend import open_backend
+from embedding_store import EmbeddingStore, write_store
+from enrollment import summarize_identity
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def findencoding(imagesList):
-    """Find face encodings for a list of images with error handling"""
-    encodeList = []
-    for i, img in enumerate(imagesList):
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def student_of(key):
+    """Student id of an image cache key: '<id>/<file>' or '<id>.<ext>'"""
+    return key.split('/')[0] if '/' in key else os.path.splitext(key)[0]
+
+def list_images(folder):
+    """Return (cache key, student id) for Images/<id>.png and every image in Images/<id>/"""
+    images = []
+    for name in sorted(os.listdir(folder)):
+        full = os.path.join(folder, name)
+        if os.path.isdir(full):
+            images.extend((f'{name}/{sub}', name) for sub in sorted(os.listdir(full))
+                          if sub.lower().endswith(IMAGE_EXTENSIONS))
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            images.append((name, os.path.splitext(name)[0]))
+        else:
+            logger.info(f"Skipping non-image file: {name}")
+    return images
+
+def profile_photos(images):
+    """Pick the image shown on each student's card: Images/<id>.png if present, else the first in Images/<id>/"""
+    photos = {}
+    for key, student_id in images:
+        if student_id not in photos or '/' not in key:
+            photos[student_id] = key
+    return photos
+
+def file_hash(path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_cache(cache_path):
+    """Load the enrollment cache: file name -> hash, mtime, size, encoding, uploaded hash"""
+    try:
+        with open(cache_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable encoding cache {cache_path}: {e}")
+        return {}
+
+def save_cache(cache, cache_path):
+    """Write the cache atomically so an interrupted run never corrupts it"""
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+def scan_images(folder, images, cache):
+    """Compare images against the cache; returns (entries of current images, new or changed keys, removed keys)"""
+    current = {}
+    changed = []
+    for path, _ in images:
         try:
-            if img is None:
-                logger.warning(f"Image at index {i} is None, skipping")
+            img_path = os.path.join(folder, path)
+            stat = os.stat(img_path)
+            entry = cache.get(path)
+            # Unchanged size and mtime means unchanged content; only hash files that were touched
+            if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                current[path] = entry
                 continue
-                
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            encodings = face_recognition.face_encodings(img_rgb)
-            
-            if encodings:
-                encodeList.append(encodings[0])
-                logger.info(f"Successfully encoded image {i+1}/{len(imagesList)}")
-            else:
-                logger.warning(f"No face found in image {i+1}/{len(imagesList)}")
-                
+            content_hash = file_hash(img_path)
+            if entry and entry['hash'] == content_hash:
+                entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                current[path] = entry
+                continue
+            current[path] = {'hash': content_hash, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                             'encoding': None, 'uploaded': None}
+            changed.append(path)
         except Exception as e:
-            logger.error(f"Error encoding image {i+1}: {e}")
+            logger.error(f"Error processing file {path}: {e}")
+    return current, changed, set(cache) - set(current)
+
+def encode_image(img_path):
+    """Encode the first face of one image (runs in a worker process)"""
+    # dlib is only imported in the workers, so the cache logic runs without it
+    import face_recognition
+    try:
+        img = cv2.imread(img_path)
+        if img is None:
+            return img_path, None, "failed to load image"
+        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        encodings = face_recognition.face_encodings(img_rgb)
+        if not encodings:
+            return img_path, None, "no face found"
+        return img_path, encodings[0].tolist(), None
+    except Exception as e:
+        return img_path, None, str(e)
+
+def findencoding(imagePaths, workers=None):
+    """Encode images in a process pool; returns {path: encoding list or None}"""
+    results = {}
+    if not imagePaths:
+        return results
+    # Spawned workers start clean instead of forking a parent that may hold threads or dlib state
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        for i, (img_path, encoding, error) in enumerate(executor.map(encode_image, imagePaths, chunksize=4)):
+            results[img_path] = encoding
+            if error:
+                logger.warning(f"Could not encode {img_path} ({i+1}/{len(imagePaths)}): {error}")
+            else:
+                logger.info(f"Successfully encoded image {i+1}/{len(imagePaths)}")
+    return results
+
+def upload_images(bucket, uploads, workers=8):
+    """Upload (cache key, local path, student id) photos to Firebase storage; returns keys uploaded"""
+    def upload(item):
+        path, img_path, student_id = item
+        fileName = f'images/{student_id}.png'
+        if img_path.lower().endswith('.png'):
+            bucket.blob(fileName).upload_from_filename(img_path)
+        else:
+            # The kiosk fetches images/<id>.png, so photos from Images/<id>/ are converted
+            ok, png = cv2.imencode('.png', cv2.imread(img_path))
+            if not ok:
+                raise ValueError("could not convert to PNG")
+            bucket.blob(fileName).upload_from_string(png.tobytes(), content_type='image/png')
+        return path
     
-    return encodeList
+    uploaded = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(upload, item): item for item in uploads}
+        for future, (path, _, student_id) in futures.items():
+            try:
+                uploaded.append(future.result())
+                logger.info(f"Uploaded {path} to Firebase storage as images/{student_id}.png")
+            except Exception as e:
+                logger.error(f"Error uploading {path}: {e}")
+    return uploaded
+
+def summarize_students(enrolled):
+    """Reduce (cache key, student id, encoding) rows to prototype rows and one centroid per student"""
+    students = {}
+    for path, student_id, encoding in enrolled:
+        students.setdefault(student_id, []).append((path, encoding))
+    prototype_ids, prototypes, centroid_ids, centroids = [], [], [], []
+    for student_id, rows in students.items():
+        centroid, keep, outliers = summarize_identity([encoding for _, encoding in rows])
+        for i in outliers:
+            logger.warning(f"Ignoring {rows[i][0]}: too far from the other photos of student {student_id}")
+        prototype_ids.extend([student_id] * len(keep))
+        prototypes.extend(rows[i][1] for i in keep)
+        centroid_ids.append(student_id)
+        centroids.append(centroid)
+    return prototype_ids, prototypes, centroid_ids, centroids
 
 def main():
+    # Try to import config for encoding settings
     try:
-        # Try to import config for Firebase settings
-        try:
-            import config
-            service_account_key = getattr(config, 'SERVICE_ACCOUNT_KEY', 'serviceAccountKey.json')
-            firebase_config = getattr(config, 'FIREBASE_CONFIG', {
-                'databaseURL': "https://face-attendance-realtime-6b86f-default-rtdb.asia-southeast1.firebasedatabase.app/",
-                'storageBucket': "face-attendance-realtime-6b86f.appspot.com"
-            })
-        except ImportError:
-            # Use defaults if config is not available
-            service_account_key = 'serviceAccountKey.json'
-            firebase_config = {
-                'databaseURL': "https://face-attendance-realtime-6b86f-default-rtdb.asia-southeast1.firebasedatabase.app/",
-                'storageBucket': "face-attendance-realtime-6b86f.appspot.com"
-            }
-        
-        # Initialize Firebase
-        cred = credentials.Certificate(service_account_key)
-        firebase_admin.initialize_app(cred, firebase_config)
-        logger.info("Firebase initialized successfully")
-    except Exception as e:
-        logger.error(f"Firebase initialization failed: {e}")
+        import config
+        cache_path = getattr(config, 'ENCODING_CACHE_FILE', 'encoding_cache.json')
+        workers = getattr(config, 'ENCODING_WORKERS', 0) or None
+        store_path = getattr(config, 'EMBEDDING_STORE_FILE', 'encodings.bin')
+        centroid_path = getattr(config, 'CENTROID_STORE_FILE', 'centroids.bin')
+    except ImportError:
+        # Use defaults if config is not available
+        cache_path = 'encoding_cache.json'
+        workers = None
+        store_path = 'encodings.bin'
+        centroid_path = 'centroids.bin'
+
+    # Firebase, or the local stand-in with BACKEND = 'local'
+    backend = open_backend()
+    if backend is None:
         return
 
     # Import student images
     FolderPath = 'Images'  # Changed from 'images' to 'Images' to match actual directory
     try:
-        PathList = os.listdir(FolderPath)
-        logger.info(f"Found {len(PathList)} images in {FolderPath}")
+        PathList = list_images(FolderPath)
+        logger.info(f"Found {len(PathList)} images of {len(set(s for _, s in PathList))} students in {FolderPath}")
     except FileNotFoundError:
         logger.error(f"Directory {FolderPath} not found")
         return
@@ -72,55 +198,64 @@ def main():
         logger.error(f"Error accessing directory {FolderPath}: {e}")
         return
 
-    imgList = []
-    studentsid = []
-    bucket = storage.bucket()
+    cache = load_cache(cache_path)
+    current, changed, removed = scan_images(FolderPath, PathList, cache)
+    logger.info(f"{len(changed)} new or changed images, {len(current) - len(changed)} unchanged, {len(removed)} removed")
 
-    for path in PathList:
-        try:
-            if path.lower().endswith(('.png', '.jpg', '.jpeg')):
-                img_path = os.path.join(FolderPath, path)
-                img = cv2.imread(img_path)
-                
-                if img is not None:
-                    imgList.append(img)
-                    student_id = os.path.splitext(path)[0]
-                    studentsid.append(student_id)
-                    logger.info(f"Loaded image: {path} -> ID: {student_id}")
-                    
-                    # Upload to Firebase storage
-                    fileName = f'images/{path}'
-                    blob = bucket.blob(fileName)
-                    blob.upload_from_filename(img_path)
-                    logger.info(f"Uploaded {fileName} to Firebase storage")
-                else:
-                    logger.warning(f"Failed to load image: {img_path}")
-            else:
-                logger.info(f"Skipping non-image file: {path}")
-                
-        except Exception as e:
-            logger.error(f"Error processing file {path}: {e}")
+    if changed:
+        logger.info(f"Starting encoding for {len(changed)} images...")
+        encoded = findencoding([os.path.join(FolderPath, path) for path in changed], workers)
+        for path in changed:
+            current[path]['encoding'] = encoded.get(os.path.join(FolderPath, path))
 
-    if not imgList:
-        logger.error("No valid images found to process")
-        return
+    # Upload only blobs whose content changed since the last successful upload
+    photos = profile_photos(PathList)
+    pending = [(path, os.path.join(FolderPath, path), student_id) for student_id, path in photos.items()
+               if path in current and current[path]['uploaded'] != current[path]['hash']]
+    for path in upload_images(backend.bucket, pending):
+        current[path]['uploaded'] = current[path]['hash']
+    backend.close()
 
-    logger.info(f"Starting encoding for {len(imgList)} images...")
-    encodeltKnown = findencoding(imgList)
-    
-    if not encodeltKnown:
+    try:
+        save_cache(current, cache_path)
+    except Exception as e:
+        logger.error(f"Failed to save encoding cache: {e}")
+
+    # Keep encodings and ids paired so images without a face cannot shift the ids
+    enrolled = [(path, student_of(path), entry['encoding']) for path, entry in current.items()
+                if entry['encoding'] is not None]
+    if not enrolled:
         logger.error("No faces were successfully encoded")
         return
 
-    encodeltKnownwithid = [encodeltKnown, studentsid]
+    logger.info("Encoding complete. Saving embedding store...")
+    try:
+        existing = EmbeddingStore(store_path) if os.path.exists(store_path) else None
+        existing_centroids = EmbeddingStore(centroid_path) if os.path.exists(centroid_path) else None
+    except Exception as e:
+        logger.warning(f"Rebuilding unreadable embedding store: {e}")
+        existing = existing_centroids = None
 
-    logger.info("Encoding complete. Saving to file...")
     try:
-        with open("Encoded file.p", 'wb') as file:
-            pickle.dump(encodeltKnownwithid, file)
-        logger.info(f"File saved successfully with {len(encodeltKnown)} encodings")
+        # A student with any new, changed or removed photo gets a new centroid and prototypes
+        touched = {student_of(path) for path in set(changed) | removed}
+        unchanged = {student_id for _, student_id, _ in enrolled} - touched
+        if existing is not None and existing_centroids is not None and \
+                set(existing.index) == unchanged and set(existing_centroids.index) == unchanged:
+            # Only new students since the last run: append them instead of rewriting the stores
+            new = [row for row in enrolled if row[1] in touched]
+            prototype_ids, prototypes, centroid_ids, centroids = summarize_students(new)
+            if new:
+                existing.append(prototype_ids, prototypes)
+                existing_centroids.append(centroid_ids, centroids)
+            logger.info(f"Embedding store up to date with {len(existing) + len(prototype_ids)} encodings")
+        else:
+            prototype_ids, prototypes, centroid_ids, centroids = summarize_students(enrolled)
+            store = write_store(store_path, prototype_ids, prototypes)
+            write_store(centroid_path, centroid_ids, centroids)
+            logger.info(f"Embedding store saved with {len(store)} encodings of {len(centroid_ids)} students")
     except Exception as e:
-        logger.error(f"Failed to save encoding file: {e}")
+        logger.error(f"Failed to save embedding store: {e}")
 
 if __name__ == "__main__":
     main()
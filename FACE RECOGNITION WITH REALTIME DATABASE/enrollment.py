@@ -0,0 +1,59 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for enrollment settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+ENROLL_MAX_PROTOTYPES = getattr(config, 'ENROLL_MAX_PROTOTYPES', 5)
+ENROLL_OUTLIER_DISTANCE = getattr(config, 'ENROLL_OUTLIER_DISTANCE', 0.45)
+
+
+def prune_outliers(encodings, max_distance=ENROLL_OUTLIER_DISTANCE):
+    """Return a keep mask dropping encodings far from the identity's median encoding.
+
+    The coordinate-wise median is not pulled towards a wrong face the way a
+    mean is. With fewer than three encodings there is no majority to trust,
+    so nothing is dropped; at least the closest encoding is always kept.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32)
+    keep = np.ones(len(encodings), dtype=bool)
+    if len(encodings) < 3:
+        return keep
+    dists = np.linalg.norm(encodings - np.median(encodings, axis=0), axis=1)
+    keep = dists <= max_distance
+    if not keep.any():
+        keep[np.argmin(dists)] = True
+    return keep
+
+
+def select_prototypes(encodings, centroid, max_prototypes=ENROLL_MAX_PROTOTYPES):
+    """Indices of up to max_prototypes diverse encodings (farthest-point order from the centroid)"""
+    encodings = np.asarray(encodings, dtype=np.float32)
+    if len(encodings) <= max_prototypes:
+        return list(range(len(encodings)))
+    # Start from the most typical encoding, then add the one furthest from every chosen one
+    nearest = np.linalg.norm(encodings - centroid, axis=1)
+    chosen = [int(np.argmin(nearest))]
+    nearest = np.linalg.norm(encodings - encodings[chosen[0]], axis=1)
+    while len(chosen) < max_prototypes:
+        pick = int(np.argmax(nearest))
+        chosen.append(pick)
+        nearest = np.minimum(nearest, np.linalg.norm(encodings - encodings[pick], axis=1))
+    return chosen
+
+
+def summarize_identity(encodings, max_prototypes=ENROLL_MAX_PROTOTYPES, max_distance=ENROLL_OUTLIER_DISTANCE):
+    """Reduce one student's encodings to (centroid, prototype indices, outlier indices)"""
+    encodings = np.asarray(encodings, dtype=np.float32).reshape(len(encodings), -1)
+    keep = prune_outliers(encodings, max_distance)
+    inliers = np.flatnonzero(keep)
+    centroid = encodings[inliers].mean(axis=0)
+    prototypes = [int(inliers[i]) for i in select_prototypes(encodings[inliers], centroid, max_prototypes)]
+    return centroid, prototypes, [int(i) for i in np.flatnonzero(~keep)]
@@ -0,0 +1,131 @@
+import logging
+import os
+import pickle
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+from hot_cache import HOT_CACHE_RADIUS, HOT_CACHE_SIZE, HOT_CACHE_TTL, HotIdentityCache
+from matcher import GalleryMatcher, IdentityMatcher
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for gallery settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+EMBEDDING_STORE_FILE = getattr(config, 'EMBEDDING_STORE_FILE', 'encodings.bin')
+CENTROID_STORE_FILE = getattr(config, 'CENTROID_STORE_FILE', 'centroids.bin')
+LEGACY_ENCODING_FILE = 'Encoded file.p'
+MATCHER_INDEX = getattr(config, 'MATCHER_INDEX', 'flat')
+MATCHER_NLIST = getattr(config, 'MATCHER_NLIST', 0)
+MATCHER_NPROBE = getattr(config, 'MATCHER_NPROBE', 8)
+MATCHER_QUANTIZATION = getattr(config, 'MATCHER_QUANTIZATION', 'none')
+MATCHER_RERANK = getattr(config, 'MATCHER_RERANK', 32)
+MATCHER_SHORTLIST = getattr(config, 'MATCHER_SHORTLIST', 8)
+MATCHER_SHARDS = getattr(config, 'MATCHER_SHARDS', 0)
+
+# Everything a built matcher depends on besides the files it was loaded from
+MATCHER_SETTINGS = (MATCHER_INDEX, MATCHER_NLIST, MATCHER_NPROBE, MATCHER_QUANTIZATION, MATCHER_RERANK,
+                    MATCHER_SHORTLIST, MATCHER_SHARDS, HOT_CACHE_SIZE, HOT_CACHE_RADIUS, HOT_CACHE_TTL)
+SOURCE_FILES = (EMBEDDING_STORE_FILE, CENTROID_STORE_FILE, LEGACY_ENCODING_FILE)
+
+
+def load_encoding_file():
+    """Map the embedding store, falling back to the legacy pickle"""
+    try:
+        if os.path.exists(EMBEDDING_STORE_FILE):
+            logger.info(f"Mapping embedding store {EMBEDDING_STORE_FILE}...")
+            store = EmbeddingStore(EMBEDDING_STORE_FILE)
+            logger.info(f"Embedding store mapped with {len(store)} encodings")
+            return store.embeddings, store.ids, store.sq_norms
+
+        logger.warning(f"{EMBEDDING_STORE_FILE} not found, loading legacy 'Encoded file.p' (re-run encoding.py to convert)")
+        with open(LEGACY_ENCODING_FILE, 'rb') as file:
+            encodeltKnownwithid = pickle.load(file)
+        encodeltKnown, studentsid = encodeltKnownwithid
+        if len(encodeltKnown) != len(studentsid):
+            logger.error(f"Encoding file is misaligned: {len(encodeltKnown)} encodings for {len(studentsid)} ids")
+            return None, None, None
+        logger.info(f"Encoding file loaded successfully with {len(studentsid)} students")
+        return encodeltKnown, studentsid, None
+    except Exception as e:
+        logger.error(f"Failed to load encoding file: {e}")
+        return None, None, None
+
+
+def load_centroids():
+    """Map the per-student centroid store written by encoding.py, or (None, None) without one"""
+    try:
+        if os.path.exists(CENTROID_STORE_FILE):
+            store = EmbeddingStore(CENTROID_STORE_FILE)
+            return store.embeddings, store.ids
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable centroid store {CENTROID_STORE_FILE}: {e}")
+    return None, None
+
+
+def matcher_index():
+    """Index settings passed to every GalleryMatcher"""
+    return dict(index_type=MATCHER_INDEX, nlist=MATCHER_NLIST, nprobe=MATCHER_NPROBE,
+                quantization=MATCHER_QUANTIZATION, rerank=MATCHER_RERANK)
+
+
+def build_matcher(encodings, ids, sq_norms=None, centroids=None, centroid_ids=None, trained=None):
+    """GalleryMatcher over the encodings, or an IdentityMatcher when students have several.
+
+    trained is a previous build's index_state(), reused when it still fits.
+    """
+    index = matcher_index()
+    ids = list(ids)
+    if len(set(ids)) == len(ids):
+        return GalleryMatcher(encodings, ids, sq_norms=sq_norms, trained=trained, **index)
+    if centroids is None or set(centroid_ids) != set(ids):
+        # Store written without centroids: average each student's prototypes instead
+        matrix = np.asarray(encodings, dtype=np.float32)
+        rows = {}
+        for row, student_id in enumerate(ids):
+            rows.setdefault(student_id, []).append(row)
+        centroid_ids = list(rows)
+        centroids = np.stack([matrix[rows[student_id]].mean(axis=0) for student_id in centroid_ids])
+    return IdentityMatcher(centroids, centroid_ids, encodings, ids, sq_norms=sq_norms,
+                           shortlist=MATCHER_SHORTLIST, trained=trained, **index)
+
+
+def with_hot_cache(matcher):
+    """Put the hot-identity cache in front of a matcher, unless HOT_CACHE_SIZE is 0"""
+    if matcher is None or not HOT_CACHE_SIZE:
+        return matcher
+    return HotIdentityCache(matcher)
+
+
+def index_state(matcher):
+    """Trained index structures of a loaded gallery for the warm-start snapshot, or None"""
+    if isinstance(matcher, HotIdentityCache):
+        matcher = matcher.matcher
+    return matcher.index_state() if isinstance(matcher, (GalleryMatcher, IdentityMatcher)) else None
+
+
+def load_gallery(trained=None):
+    """Load the known encodings into a matcher, or None on failure.
+
+    The encodings stay memory-mapped; only the index structures in trained
+    (from index_state()) come from the warm-start snapshot.
+    """
+    if MATCHER_SHARDS:
+        if os.path.exists(EMBEDDING_STORE_FILE):
+            from shards import ShardedMatcher
+            try:
+                return with_hot_cache(ShardedMatcher(EMBEDDING_STORE_FILE, MATCHER_SHARDS, index=matcher_index()))
+            except Exception as e:
+                logger.error(f"Failed to start sharded gallery: {e}")
+                return None
+        logger.warning(f"MATCHER_SHARDS needs {EMBEDDING_STORE_FILE} (re-run encoding.py), matching in-process")
+    encodeltKnown, studentsid, sq_norms = load_encoding_file()
+    if encodeltKnown is None or studentsid is None:
+        return None
+    centroids, centroid_ids = load_centroids()
+    return with_hot_cache(build_matcher(encodeltKnown, studentsid, sq_norms, centroids, centroid_ids, trained))
@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for hot cache settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+HOT_CACHE_SIZE = getattr(config, 'HOT_CACHE_SIZE', 512)
+HOT_CACHE_RADIUS = getattr(config, 'HOT_CACHE_RADIUS', 0.15)
+HOT_CACHE_TTL = getattr(config, 'HOT_CACHE_TTL', 3600)
+
+RESULTS = ('hit', 'fallback')
+LOOKUPS = {result: REGISTRY.counter('face_hot_cache_total', "Faces resolved by the hot-identity cache or the full gallery",
+                                    {'result': result})
+           for result in RESULTS}
+
+
+class HotIdentityCache:
+    """Small LRU cache of recently matched embeddings in front of the gallery matcher.
+
+    A face within radius of a cached embedding takes that entry's student
+    without a gallery search; everything else goes to the wrapped matcher,
+    and matched faces are added to the cache, evicting the least recently
+    used entry when it holds capacity embeddings. Entries unused for ttl
+    seconds no longer hit, and the cache is cleared whenever the matcher's
+    ids change (a sharded gallery picking up new enrollments).
+
+    A hit reports the cached match distance plus the distance to the cached
+    embedding, an upper bound on the distance to the gallery row, and only
+    counts when that bound is under the threshold, so every hit satisfies
+    MIN_FACE_CONFIDENCE. With a tight radius the cached student is the one
+    the full search would find; the cache is shared by all streams.
+    """
+
+    def __init__(self, matcher, capacity=HOT_CACHE_SIZE, radius=HOT_CACHE_RADIUS, ttl=HOT_CACHE_TTL):
+        self.matcher = matcher
+        self.capacity = max(1, capacity)
+        self.radius = radius
+        self.ttl = ttl
+        self.hits = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._clear()
+        REGISTRY.gauge('face_hot_cache_size', 'Embeddings in the hot-identity cache', fn=lambda: self._count)
+
+    def _clear(self):
+        self._embeddings = None
+        self._sq_norms = np.zeros(self.capacity, np.float32)
+        self._ids = [None] * self.capacity
+        self._entries = [None] * self.capacity  # (match distance, gallery row)
+        self._used = np.full(self.capacity, -np.inf)
+        self._count = 0
+        self._gallery_ids = self.matcher.ids
+
+    def __len__(self):
+        return len(self.matcher)
+
+    @property
+    def ids(self):
+        return self.matcher.ids
+
+    @property
+    def index_bytes(self):
+        return self.matcher.index_bytes
+
+    def search(self, queries, k=1):
+        return self.matcher.search(queries, k)
+
+    def _lookup(self, queries, threshold, now):
+        """Cached (student_id, distance, row) per query, or None where the gallery must be searched"""
+        if self._gallery_ids is not self.matcher.ids:
+            logger.info("Gallery changed, clearing the hot-identity cache")
+            self._clear()
+        if not self._count:
+            return [None] * len(queries)
+        cached = self._embeddings[:self._count]
+        dist_sq = (np.einsum('ij,ij->i', queries, queries)[:, None] + self._sq_norms[None, :self._count]
+                   - 2.0 * queries @ cached.T)
+        dist_sq[:, self._used[:self._count] < now - self.ttl] = np.inf
+        nearest = np.argmin(dist_sq, axis=1)
+        results = []
+        for i, slot in enumerate(nearest):
+            d = float(np.sqrt(max(dist_sq[i, slot], 0.0)))
+            if d <= self.radius and self._entries[slot][0] + d < threshold:
+                self._used[slot] = now
+                results.append((self._ids[slot], self._entries[slot][0] + d, self._entries[slot][1]))
+            else:
+                results.append(None)
+        return results
+
+    def _insert(self, embedding, result, now):
+        if self._embeddings is None:
+            self._embeddings = np.zeros((self.capacity, len(embedding)), np.float32)
+        if self._count < self.capacity:
+            slot = self._count
+            self._count += 1
+        else:
+            slot = int(np.argmin(self._used))
+        self._embeddings[slot] = embedding
+        self._sq_norms[slot] = embedding @ embedding
+        self._ids[slot] = result[0]
+        self._entries[slot] = (result[1], result[2])
+        self._used[slot] = now
+
+    def match(self, queries, threshold):
+        """Match every query; returns (student_id or None, distance, row) per query"""
+        queries = np.asarray(queries, dtype=np.float32)
+        queries = queries.reshape(len(queries), -1)
+        now = time.monotonic()
+        with self._lock:
+            results = self._lookup(queries, threshold, now)
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            gallery_ids = self.matcher.ids
+            found = self.matcher.match(queries[misses], threshold)
+            with self._lock:
+                for i, result in zip(misses, found):
+                    results[i] = result
+                    if result[0] is not None and gallery_ids is self._gallery_ids:
+                        self._insert(queries[i], result, now)
+        hits = len(results) - len(misses)
+        with self._lock:
+            self.hits += hits
+            self.fallbacks += len(misses)
+        LOOKUPS['hit'].inc(hits)
+        LOOKUPS['fallback'].inc(len(misses))
+        return results
+
+    def report(self):
+        total = self.hits + self.fallbacks
+        rate = 100.0 * self.hits / total if total else 0.0
+        return f"hot cache hits={self.hits} ({rate:.0f}%) fallbacks={self.fallbacks} size={self._count}/{self.capacity}"
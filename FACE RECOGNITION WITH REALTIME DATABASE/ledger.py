@@ -0,0 +1,160 @@
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DAY_FORMAT = "%Y-%m-%d"
+
+
+class AttendanceLedger:
+    """Append-only local record of every attendance event, in SQLite.
+
+    Each event keeps the student, time, camera stream and match distance;
+    rows are never changed except for the synced time set once the event
+    has reached the Realtime Database. The database runs in WAL mode, so
+    the flusher and report queries read while a recognition thread
+    appends, and with synchronous=FULL a committed event survives a crash
+    or power loss. Indexes on (student_id, ts) and (day, student_id) answer
+    per-student history and "who was present on day X" without a scan.
+    kiosk_id is a random id created with the ledger, naming this kiosk's
+    sync watermark upstream.
+    """
+
+    def __init__(self, path='attendance.db'):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=FULL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                             'student_id TEXT NOT NULL, ts REAL NOT NULL, day TEXT NOT NULL, time TEXT NOT NULL, '
+                             'stream TEXT, distance REAL, synced REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS events_student ON events (student_id, ts)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS events_day ON events (day, student_id)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS events_unsynced ON events (seq) WHERE synced IS NULL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._db.execute("INSERT OR IGNORE INTO meta VALUES ('kiosk_id', ?)", (uuid.uuid4().hex,))
+            self._db.commit()
+            self.kiosk_id = self._db.execute("SELECT value FROM meta WHERE key = 'kiosk_id'").fetchone()[0]
+
+    def append(self, student_id, ts, stream=None, distance=None):
+        """Write one event and return it as a dict"""
+        moment = datetime.fromtimestamp(ts)
+        event = {'id': student_id, 'ts': ts, 'time': moment.strftime(TIME_FORMAT),
+                 'stream': stream, 'distance': distance}
+        with self._lock:
+            cursor = self._db.execute('INSERT INTO events (student_id, ts, day, time, stream, distance) '
+                                      'VALUES (?, ?, ?, ?, ?, ?)',
+                                      (student_id, ts, moment.strftime(DAY_FORMAT), event['time'], stream, distance))
+            self._db.commit()
+        event['seq'] = cursor.lastrowid
+        return event
+
+    def unsynced(self, limit):
+        """Oldest events not yet pushed upstream"""
+        with self._lock:
+            rows = self._db.execute('SELECT seq, student_id, ts, time, stream, distance FROM events '
+                                    'WHERE synced IS NULL ORDER BY seq LIMIT ?', (limit,)).fetchall()
+        return [{'seq': seq, 'id': student_id, 'ts': ts, 'time': when, 'stream': stream, 'distance': distance}
+                for seq, student_id, ts, when, stream, distance in rows]
+
+    def mark_synced(self, seqs):
+        now = time.time()
+        with self._lock:
+            self._db.executemany('UPDATE events SET synced = ? WHERE seq = ?', [(now, seq) for seq in seqs])
+            self._db.commit()
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM events WHERE synced IS NULL').fetchone()[0]
+
+    def last_seen(self):
+        """Latest event time per student, to restore the cooldown after a restart"""
+        with self._lock:
+            return dict(self._db.execute('SELECT student_id, MAX(ts) FROM events GROUP BY student_id').fetchall())
+
+    def present(self, day):
+        """(student_id, first time, last time, events) for everyone seen on a YYYY-MM-DD day"""
+        with self._lock:
+            return self._db.execute('SELECT student_id, MIN(time), MAX(time), COUNT(*) FROM events '
+                                    'WHERE day = ? GROUP BY student_id ORDER BY MIN(ts)', (day,)).fetchall()
+
+    def history(self, student_id, since=None, until=None):
+        """(time, stream, distance, synced) of one student's events, optionally between two days"""
+        query = 'SELECT time, stream, distance, synced FROM events WHERE student_id = ?'
+        params = [student_id]
+        if since:
+            query += ' AND ts >= ?'
+            params.append(datetime.strptime(since, DAY_FORMAT).timestamp())
+        if until:
+            query += ' AND ts < ?'
+            params.append(datetime.strptime(until, DAY_FORMAT).timestamp() + 86400)
+        with self._lock:
+            return self._db.execute(query + ' ORDER BY ts', params).fetchall()
+
+    def events(self, since=None, until=None):
+        """(student_id, ts, stream, distance) of every event in time order, optionally between two days"""
+        query = 'SELECT student_id, ts, stream, distance FROM events WHERE 1'
+        params = []
+        if since:
+            query += ' AND ts >= ?'
+            params.append(datetime.strptime(since, DAY_FORMAT).timestamp())
+        if until:
+            query += ' AND ts < ?'
+            params.append(datetime.strptime(until, DAY_FORMAT).timestamp() + 86400)
+        with self._lock:
+            return self._db.execute(query + ' ORDER BY ts', params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance reports from the local ledger")
+    parser.add_argument('--ledger', help="ledger file (default: ATTENDANCE_LEDGER from config)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    present = commands.add_parser('present', help="students seen on a day")
+    present.add_argument('day', nargs='?', default=datetime.now().strftime(DAY_FORMAT), help="YYYY-MM-DD, default today")
+    history = commands.add_parser('history', help="attendance events of one student")
+    history.add_argument('student_id')
+    history.add_argument('--since', help="first day, YYYY-MM-DD")
+    history.add_argument('--until', help="last day, YYYY-MM-DD")
+    commands.add_parser('pending', help="events not yet written to Firebase")
+    args = parser.parse_args()
+
+    path = args.ledger
+    if path is None:
+        try:
+            import config
+        except ImportError:
+            config = None
+        path = getattr(config, 'ATTENDANCE_LEDGER', 'attendance.db')
+    ledger = AttendanceLedger(path)
+    start = time.perf_counter()
+    if args.command == 'present':
+        rows = ledger.present(args.day)
+        for student_id, first, last, count in rows:
+            print(f"{student_id:<16} {first[11:]} - {last[11:]}  {count} event(s)")
+        summary = f"{len(rows)} student(s) present on {args.day}"
+    elif args.command == 'history':
+        rows = ledger.history(args.student_id, args.since, args.until)
+        for when, stream, distance, synced in rows:
+            distance = f"{distance:.3f}" if distance is not None else '-'
+            print(f"{when}  {stream or '-':<12} distance {distance}  {'synced' if synced else 'pending'}")
+        summary = f"{len(rows)} event(s) for {args.student_id}"
+    else:
+        summary = f"{ledger.pending_count()} event(s) waiting to be written to Firebase"
+    print(f"{summary} ({1000 * (time.perf_counter() - start):.1f} ms)")
+    ledger.close()
+
+
+if __name__ == "__main__":
+    main()
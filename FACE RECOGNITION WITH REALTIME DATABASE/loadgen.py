@@ -0,0 +1,231 @@
+import argparse
+import bisect
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from backend import LocalBackend
+
+logger = logging.getLogger(__name__)
+
+FIRST_SYNTHETIC_ID = 20000000
+MAJORS = ('Computer Science', 'Mathematics', 'Physics', 'Biology', 'Economics', 'AI & ML')
+STANDINGS = ('G', 'E', 'EX', 'S')
+
+
+# Synthetic roster
+
+def synthetic_ids(count, first_id=FIRST_SYNTHETIC_ID):
+    return [str(first_id + i) for i in range(count)]
+
+
+def synthetic_students(student_ids, seed=0):
+    """A profile in the Students schema for every id, drawn reproducibly from seed"""
+    rng = random.Random(seed)
+    students = {}
+    for student_id in student_ids:
+        year = rng.randint(1, 4)
+        students[student_id] = {'name': f"Student {student_id}", 'major': rng.choice(MAJORS),
+                                'Starting_year': 2025 - year, 'total_attendance': 0,
+                                'standing': rng.choice(STANDINGS), 'year': year,
+                                'Last_attendance_time': '2000-01-01 00:00:00'}
+    return students
+
+
+def synthetic_photo(student_id, size=216):
+    """A small PNG card with the student id, standing in for a profile photo"""
+    shade = int(student_id[-3:]) % 200 if student_id[-3:].isdigit() else 100
+    img = np.full((size, size, 3), (shade, 120, 200 - shade), np.uint8)
+    cv2.putText(img, student_id[-8:], (10, size // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 255, 255), 2)
+    return cv2.imencode('.png', img)[1].tobytes()
+
+
+def seed_students(backend, students, photos=False, batch_size=500):
+    """Write profiles to Students in batched updates, with a placeholder photo each if photos"""
+    ref = backend.reference('Students')
+    items = list(students.items())
+    for start in range(0, len(items), batch_size):
+        ref.update(dict(items[start:start + batch_size]))
+    if photos:
+        for student_id in students:
+            backend.bucket.blob(f'images/{student_id}.png').upload_from_string(synthetic_photo(student_id),
+                                                                               content_type='image/png')
+    logger.info(f"Seeded {len(items)} students{' with photos' if photos else ''}")
+
+
+# Event streams
+
+def synthetic_events(student_ids, rate, duration, cameras=1, skew=1.0, seed=0):
+    """(offset s, student_id, stream, distance) with Poisson arrivals at rate per second.
+
+    Students are drawn with Zipf weights 1/rank**skew, so a few regulars
+    make up most of the traffic as at a real entrance; skew 0 is uniform.
+    """
+    rng = random.Random(seed)
+    order = list(student_ids)
+    rng.shuffle(order)
+    cumulative = np.cumsum(1.0 / np.arange(1, len(order) + 1) ** skew).tolist()
+    events = []
+    t = rng.expovariate(rate)
+    while t < duration:
+        student_id = order[min(bisect.bisect(cumulative, rng.random() * cumulative[-1]), len(order) - 1)]
+        events.append((t, student_id, f'camera-{rng.randrange(cameras)}', round(rng.uniform(0.3, 0.55), 3)))
+        t += rng.expovariate(rate)
+    return events
+
+
+def ledger_events(path, speed=1.0, since=None, until=None):
+    """Recorded attendance events from a ledger as (offset s, student_id, stream, distance), sped up by speed"""
+    from ledger import AttendanceLedger
+    ledger = AttendanceLedger(path)
+    rows = ledger.events(since, until)
+    ledger.close()
+    if not rows:
+        return []
+    first = rows[0][1]
+    return [((ts - first) / speed, student_id, stream or 'replay', distance)
+            for student_id, ts, stream, distance in rows]
+
+
+# Replay
+
+def percentiles_ms(samples):
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'mean_ms': round(float(values.mean()), 3), 'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3), 'p99_ms': round(float(p99), 3), 'max_ms': round(float(values.max()), 3)}
+
+
+def replay(services, events, drain_timeout=30.0):
+    """Submit events at their offsets (open loop) and time each one from its scheduled time to completion"""
+    latencies = []
+    outcomes = {'completed': 0, 'failed': 0, 'rejected': 0}
+    lock = threading.Lock()
+    done = threading.Semaphore(0)
+
+    def finished(future, scheduled):
+        elapsed = time.perf_counter() - scheduled
+        try:
+            ok = future.result()[0] is not None
+        except Exception:
+            ok = False
+        with lock:
+            latencies.append(elapsed)
+            outcomes['completed' if ok else 'failed'] += 1
+        done.release()
+
+    start = time.perf_counter()
+    submitted = 0
+    lag = 0.0
+    for offset, student_id, stream, distance in events:
+        scheduled = start + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            lag = max(lag, -delay)
+        future = services.submit(student_id, stream, distance)
+        if future is None:
+            outcomes['rejected'] += 1
+            continue
+        submitted += 1
+        future.add_done_callback(lambda f, scheduled=scheduled: finished(f, scheduled))
+    deadline = time.perf_counter() + drain_timeout
+    for _ in range(submitted):
+        if not done.acquire(timeout=max(0.0, deadline - time.perf_counter())):
+            break
+    elapsed = time.perf_counter() - start
+    return {
+        'events': len(events),
+        'seconds': round(elapsed, 3),
+        'offered_per_s': round(len(events) / events[-1][0], 2) if events and events[-1][0] > 0 else None,
+        'completed_per_s': round(outcomes['completed'] / elapsed, 2) if elapsed else 0.0,
+        'max_dispatch_lag_ms': round(1000 * lag, 3),
+        **outcomes,
+        'latency': percentiles_ms(latencies),
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Replay recognition events against a local backend stand-in")
+    parser.add_argument('--students', type=int, default=1000, help="synthetic students to seed")
+    parser.add_argument('--rate', type=float, default=20.0, help="recognitions per second")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds of synthetic events")
+    parser.add_argument('--cameras', type=int, default=2, help="streams the events are spread over")
+    parser.add_argument('--skew', type=float, default=1.0, help="Zipf exponent of student popularity (0 = uniform)")
+    parser.add_argument('--ledger', help="replay the events recorded in this attendance ledger instead")
+    parser.add_argument('--speed', type=float, default=1.0, help="time compression of a ledger replay")
+    parser.add_argument('--latency-ms', type=float, default=40.0, help="injected round trip per backend call")
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help="mean of the exponential extra delay")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of backend calls that fail")
+    parser.add_argument('--no-photos', action='store_true', help="seed profiles without photos")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the roster, events and injected faults")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    from services import BackendServices
+
+    if args.ledger:
+        events = ledger_events(args.ledger, args.speed)
+        student_ids = sorted({student_id for _, student_id, _, _ in events})
+    else:
+        student_ids = synthetic_ids(args.students)
+        events = synthetic_events(student_ids, args.rate, args.duration, args.cameras, args.skew, args.seed)
+    if not events:
+        parser.error("no events to replay")
+
+    backend = LocalBackend(seed=args.seed)
+    seed_students(backend, synthetic_students(student_ids, args.seed), photos=not args.no_photos)
+    # Latency and failures are injected into the replay only, not the seeding
+    backend.latency = args.latency_ms / 1000
+    backend.jitter = args.jitter_ms / 1000
+    backend.failure_rate = args.failure_rate
+    backend.calls = backend.failures = 0
+
+    workdir = tempfile.mkdtemp(prefix='face-loadgen-')
+    try:
+        services = BackendServices(backend, cache_dir=os.path.join(workdir, 'profile_cache'),
+                                   ledger_path=os.path.join(workdir, 'attendance.db'),
+                                   journal_path=os.path.join(workdir, 'attendance_journal.jsonl'))
+        services.start()
+        result = replay(services, events)
+        # Write out what the cooldown let through, as the kiosk does on shutdown
+        services.pool.shutdown(wait=True)
+        services.attendance.flush()
+        report = {
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'students': len(student_ids),
+            'source': args.ledger or 'synthetic',
+            'replay': result,
+            'backend': {'calls': backend.calls, 'injected_failures': backend.failures,
+                        'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms,
+                        'failure_rate': args.failure_rate},
+            'attendance': {'flushed': services.attendance.flushed, 'pending': services.attendance.pending(),
+                           'flush_failures': services.attendance.failures},
+            'reports': [report() for report in services.reporters()],
+        }
+        services.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+INDEX_TYPES = ('flat', 'ivf', 'ivfpq')
+QUANTIZATIONS = ('none', 'float16', 'int8')
+ENCODING_DIM = 128  # dlib face encodings
+
+
+def as_matrix(encodings, rows):
+    """The encodings as a (rows, dim) float32 array; an empty gallery keeps its dim, or ENCODING_DIM"""
+    matrix = np.asarray(encodings, dtype=np.float32)
+    if rows:
+        return matrix.reshape(rows, -1)
+    return matrix.reshape(0, matrix.shape[-1] if matrix.ndim == 2 else ENCODING_DIM)
+
+
+def _kmeans(data, k, iterations=10, seed=0):
+    """Plain Lloyd's k-means used to train the IVF coarse quantizer"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    data_sq = np.einsum('ij,ij->i', data, data)
+    for _ in range(iterations):
+        cent_sq = np.einsum('ij,ij->i', centroids, centroids)
+        assign = np.argmin(cent_sq[None, :] - 2.0 * data @ centroids.T, axis=1)
+        for c in range(k):
+            members = data[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+            else:
+                # Re-seed empty cells with the point furthest from its centroid
+                worst = np.argmax(data_sq - 2.0 * np.einsum('ij,ij->i', data, centroids[assign]))
+                centroids[c] = data[worst]
+    return centroids
+
+
+def quantize(matrix, quantization):
+    """Compact copy of the gallery: (float16 codes, None) or (int8 codes, per-row float32 scales)"""
+    if quantization == 'float16':
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.empty(matrix.shape, np.int8)
+    for start in range(0, len(matrix), 16384):
+        block = slice(start, start + 16384)
+        codes[block] = np.round(matrix[block] / scales[block, None])
+    return codes, scales.astype(np.float32)
+
+
+def _topk(dist_sq, k):
+    """Indices of the k smallest squared distances per row, nearest first, and their distances"""
+    k = min(k, dist_sq.shape[1])
+    if k == 1:
+        top = np.argmin(dist_sq, axis=1)[:, None]
+    else:
+        top = np.argpartition(dist_sq, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.argsort(np.take_along_axis(dist_sq, top, axis=1), axis=1), axis=1)
+    dists = np.sqrt(np.maximum(np.take_along_axis(dist_sq, top, axis=1), 0.0))
+    return dists, top
+
+
+class GalleryMatcher:
+    """Nearest-neighbour search over the known face encodings.
+
+    The gallery is held as one contiguous float32 matrix with precomputed
+    squared norms, so all faces of a frame are matched with a single matrix
+    product instead of one compare_faces/face_distance pair per face.
+    'ivf' and 'ivfpq' trade a little recall for sub-linear search on large
+    rosters; 'ivfpq' needs faiss and falls back to 'ivf' without it.
+
+    With quantization 'float16' or 'int8' (per-row scale) the flat and ivf
+    indexes scan a 2x or 4x smaller copy of the gallery, and the best
+    rerank candidates of that coarse pass are re-ranked against the
+    full-precision rows. Returned distances are therefore exact, and the
+    MIN_FACE_CONFIDENCE threshold means the same as without quantization.
+    The full-precision rows are only read for candidates, so when they are
+    the memory-mapped EmbeddingStore most of them never become resident.
+
+    index_state() returns the trained parts of an ivf/ivfpq index (the
+    cells or the faiss index), which are small next to the gallery; passing
+    them back as trained skips k-means on the next build over the same rows.
+    """
+
+    def __init__(self, encodings, ids, index_type='flat', nlist=0, nprobe=8, sq_norms=None,
+                 quantization='none', rerank=32, trained=None):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown matcher index type: {index_type}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown matcher quantization: {quantization}")
+        self.ids = list(ids)
+        matrix = as_matrix(encodings, len(self.ids))
+        if matrix.strides[1] != matrix.itemsize:
+            matrix = np.ascontiguousarray(matrix)
+        # Row-strided float32 views (e.g. a memory-mapped EmbeddingStore) are used in place, not copied
+        self.matrix = matrix
+        self.sq_norms = np.asarray(sq_norms, dtype=np.float32) if sq_norms is not None else \
+            np.einsum('ij,ij->i', matrix, matrix)
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.quantization = quantization if index_type != 'ivfpq' else 'none'
+        self.rerank = max(1, rerank)
+        self._faiss_index = None
+        self._centroids = None
+        self._codes = self._scales = None
+
+        if index_type == 'ivfpq' and faiss is None:
+            logger.warning("faiss not installed, falling back to numpy IVF index")
+            self.index_type = index_type = 'ivf'
+        if self.quantization != 'none' and index_type == 'flat' and len(self.ids):
+            self._codes, self._scales = quantize(self.matrix, self.quantization)
+        if index_type != 'flat' and len(self.ids):
+            nlist = nlist or max(1, int(np.sqrt(len(self.ids))))
+            self.nlist = min(nlist, len(self.ids))
+            if index_type == 'ivfpq':
+                self._build_faiss(self.nlist, trained)
+            else:
+                self._build_ivf(self.nlist, trained)
+        logger.info(f"Gallery matcher ready: {len(self.ids)} encodings, index={self.index_type}, "
+                    f"quantization={self.quantization}, {self.index_bytes / 1e6:.1f} MB scanned")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_state(self):
+        """Trained index structures for the warm-start snapshot, or None for a flat index"""
+        if self._faiss_index is not None:
+            return {'index': 'ivfpq', 'rows': len(self.ids), 'faiss': faiss.serialize_index(self._faiss_index)}
+        if self._centroids is not None:
+            return {'index': 'ivf', 'rows': len(self.ids), 'centroids': self._centroids,
+                    'order': self._order, 'offsets': self._offsets}
+        return None
+
+    def _reusable(self, trained, index_type, nlist):
+        return (isinstance(trained, dict) and trained.get('index') == index_type
+                and trained.get('rows') == len(self.ids)
+                and (index_type != 'ivf' or len(trained['centroids']) == nlist))
+
+    @property
+    def index_bytes(self):
+        """Bytes of gallery data scanned per search (the full matrix unless quantized)"""
+        if self._faiss_index is not None:
+            return self._faiss_index.ntotal * (16 + 8)  # 16 one-byte PQ codes and an id per vector
+        arrays = [self.sq_norms]
+        if self.quantization != 'none':
+            arrays += [self._ivf_codes, self._ivf_scales] if self._centroids is not None else [self._codes, self._scales]
+        else:
+            arrays.append(self._ivf_matrix if self._centroids is not None else self.matrix)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def _build_ivf(self, nlist, trained=None):
+        """Cluster the gallery and reorder rows so each cell is a contiguous slice"""
+        if self._reusable(trained, 'ivf', nlist):
+            self._centroids, self._order, self._offsets = trained['centroids'], trained['order'], trained['offsets']
+        else:
+            sample = self.matrix
+            if len(sample) > 50 * nlist:
+                rng = np.random.default_rng(0)
+                sample = sample[rng.choice(len(sample), 50 * nlist, replace=False)]
+            self._centroids = _kmeans(sample, nlist)
+            cent_sq = np.einsum('ij,ij->i', self._centroids, self._centroids)
+            assign = np.argmin(cent_sq[None, :] - 2.0 * self.matrix @ self._centroids.T, axis=1)
+            self._order = np.argsort(assign, kind='stable')
+            self._offsets = np.searchsorted(assign[self._order], np.arange(nlist + 1))
+        if self.quantization != 'none':
+            self._ivf_matrix = None
+            self._ivf_codes, self._ivf_scales = quantize(self.matrix[self._order], self.quantization)
+        else:
+            self._ivf_matrix = np.ascontiguousarray(self.matrix[self._order])
+        self._ivf_sq_norms = self.sq_norms[self._order]
+
+    def _build_faiss(self, nlist, trained=None):
+        if self._reusable(trained, 'ivfpq', nlist):
+            self._faiss_index = faiss.deserialize_index(trained['faiss'])
+            self._faiss_index.nprobe = self.nprobe
+            return
+        dim = self.matrix.shape[1]
+        quantizer = faiss.IndexFlatL2(dim)
+        self._faiss_index = faiss.IndexIVFPQ(quantizer, dim, nlist, 16, 8)
+        self._faiss_index.train(self.matrix)
+        self._faiss_index.add(self.matrix)
+        self._faiss_index.nprobe = self.nprobe
+
+    @staticmethod
+    def _exact(queries, matrix, sq_norms, k):
+        """Batched L2 distances via |q|^2 + |g|^2 - 2 q.g"""
+        q_sq = np.einsum('ij,ij->i', queries, queries)
+        dist_sq = q_sq[:, None] + sq_norms[None, :] - 2.0 * (queries @ matrix.T)
+        return _topk(dist_sq, k)
+
+    def _coarse(self, queries, codes, scales, sq_norms, k, block=16384):
+        """Approximate nearest rows from the quantized codes, dequantized a block at a time"""
+        q_sq = np.einsum('ij,ij->i', queries, queries)
+        dots = np.empty((len(queries), len(codes)), np.float32)
+        for start in range(0, len(codes), block):
+            dots[:, start:start + block] = queries @ codes[start:start + block].astype(np.float32).T
+        if scales is not None:
+            dots *= scales[None, :]
+        return _topk(q_sq[:, None] + sq_norms[None, :] - 2.0 * dots, k)[1]
+
+    def _rerank(self, query, rows, k):
+        """Exact distances of one query to candidate gallery rows; returns (dists, rows) nearest first"""
+        rows = np.sort(rows)  # ascending reads from a memory-mapped store
+        d, top = self._exact(query, self.matrix[rows], self.sq_norms[rows], k)
+        return d[0], rows[top[0]]
+
+    def search(self, queries, k=1):
+        """Return (distances, row indices) of the k nearest gallery rows per query"""
+        queries = np.ascontiguousarray(np.asarray(queries, dtype=np.float32).reshape(-1, self.matrix.shape[1]))
+        n = len(queries)
+        if n == 0 or not self.ids:
+            return np.empty((n, 0), np.float32), np.empty((n, 0), np.int64)
+
+        if self.index_type == 'flat' and self._codes is None:
+            return self._exact(queries, self.matrix, self.sq_norms, k)
+
+        if self.index_type == 'flat':
+            candidates = self._coarse(queries, self._codes, self._scales, self.sq_norms, max(k, self.rerank))
+            dists = np.full((n, k), np.inf, np.float32)
+            indices = np.full((n, k), -1, np.int64)
+            for i in range(n):
+                d, rows = self._rerank(queries[i:i + 1], candidates[i], k)
+                dists[i, :len(d)] = d
+                indices[i, :len(rows)] = rows
+            return dists, indices
+
+        if self._faiss_index is not None:
+            dist_sq, idx = self._faiss_index.search(queries, k)
+            return np.sqrt(np.maximum(dist_sq, 0.0)), idx
+
+        cent_sq = np.einsum('ij,ij->i', self._centroids, self._centroids)
+        probe_d = cent_sq[None, :] - 2.0 * queries @ self._centroids.T
+        nprobe = min(self.nprobe, len(self._centroids))
+        probes = np.argpartition(probe_d, nprobe - 1, axis=1)[:, :nprobe]
+
+        dists = np.full((n, k), np.inf, np.float32)
+        indices = np.full((n, k), -1, np.int64)
+        for i in range(n):
+            rows = np.concatenate([np.arange(self._offsets[c], self._offsets[c + 1]) for c in probes[i]])
+            if not len(rows):
+                continue
+            if self._ivf_matrix is None:
+                scales = self._ivf_scales[rows] if self._ivf_scales is not None else None
+                top = self._coarse(queries[i:i + 1], self._ivf_codes[rows], scales,
+                                   self._ivf_sq_norms[rows], max(k, self.rerank))
+                d, found = self._rerank(queries[i:i + 1], self._order[rows[top[0]]], k)
+                dists[i, :len(d)] = d
+                indices[i, :len(found)] = found
+                continue
+            d, top = self._exact(queries[i:i + 1], self._ivf_matrix[rows], self._ivf_sq_norms[rows], k)
+            dists[i, :d.shape[1]] = d[0]
+            indices[i, :d.shape[1]] = self._order[rows[top[0]]]
+        return dists, indices
+
+    def match(self, queries, threshold):
+        """Match every query; returns (student_id or None, distance, row) per query"""
+        dists, indices = self.search(queries, k=1)
+        results = []
+        for d, i in zip(dists, indices):
+            if len(i) and i[0] >= 0 and d[0] < threshold:
+                results.append((self.ids[i[0]], float(d[0]), int(i[0])))
+            else:
+                results.append((None, float(d[0]) if len(d) else float('inf'), -1))
+        return results
+
+
+class IdentityMatcher:
+    """Two-stage matcher over a centroid and a few prototype encodings per student.
+
+    Every query is first searched against one centroid per student (with
+    the configured index and quantization), then compared exactly with the
+    prototypes of the shortlist closest students. The distance reported is
+    to the nearest prototype, i.e. to a real enrollment photo, so
+    MIN_FACE_CONFIDENCE means the same as with one encoding per student.
+    Rows returned by search() index the prototype matrix.
+    """
+
+    def __init__(self, centroids, centroid_ids, prototypes, prototype_ids, sq_norms=None, shortlist=8,
+                 trained=None, **index):
+        self.centroids = GalleryMatcher(centroids, centroid_ids, trained=trained, **index)
+        self.ids = list(prototype_ids)
+        matrix = as_matrix(prototypes, len(self.ids))
+        self.matrix = matrix if matrix.strides[1] == matrix.itemsize else np.ascontiguousarray(matrix)
+        self.sq_norms = np.asarray(sq_norms, dtype=np.float32) if sq_norms is not None else \
+            np.einsum('ij,ij->i', self.matrix, self.matrix)
+        self.shortlist = max(1, shortlist)
+        rows = {}
+        for row, student_id in enumerate(self.ids):
+            rows.setdefault(student_id, []).append(row)
+        # Prototype rows per centroid row; students without a centroid are unreachable
+        self._rows = [np.array(rows.get(student_id, []), dtype=np.int64) for student_id in self.centroids.ids]
+        logger.info(f"Identity matcher ready: {len(self.centroids)} students, {len(self.ids)} prototypes")
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def index_bytes(self):
+        return self.centroids.index_bytes + self.matrix.nbytes + self.sq_norms.nbytes
+
+    def index_state(self):
+        return self.centroids.index_state()
+
+    def search(self, queries, k=1):
+        """Return (distances, prototype rows) of the k nearest prototypes among the shortlisted students"""
+        queries = np.ascontiguousarray(np.asarray(queries, dtype=np.float32).reshape(-1, self.matrix.shape[1]))
+        n = len(queries)
+        if n == 0 or not self.ids:
+            return np.empty((n, 0), np.float32), np.empty((n, 0), np.int64)
+        _, candidates = self.centroids.search(queries, self.shortlist)
+        dists = np.full((n, k), np.inf, np.float32)
+        indices = np.full((n, k), -1, np.int64)
+        for i in range(n):
+            rows = [self._rows[c] for c in candidates[i] if c >= 0]
+            rows = np.concatenate(rows) if rows else np.empty(0, np.int64)
+            if not len(rows):
+                continue
+            d, top = GalleryMatcher._exact(queries[i:i + 1], self.matrix[rows], self.sq_norms[rows], k)
+            dists[i, :d.shape[1]] = d[0]
+            indices[i, :d.shape[1]] = rows[top[0]]
+        return dists, indices
+
+    # Same contract as GalleryMatcher: (student_id or None, distance, row) per query
+    match = GalleryMatcher.match
@@ -0,0 +1,282 @@
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally, OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for metrics settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+METRICS_PORT = getattr(config, 'METRICS_PORT', 9108)
+METRICS_HOST = getattr(config, 'METRICS_HOST', '127.0.0.1')
+PROFILER_ENABLED = getattr(config, 'PROFILER_ENABLED', False)
+PROFILER_INTERVAL = getattr(config, 'PROFILER_INTERVAL', 0.005)
+PROFILER_OUTPUT = getattr(config, 'PROFILER_OUTPUT', 'profile.folded')
+
+# Seconds; fine at the low end for matching, wide enough for a cnn detection or a slow database call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in seconds"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += seconds
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        """Return ([(upper bound, cumulative count)], sum, count)"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative, running = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            running += count
+            cumulative.append((bound, running))
+        return cumulative, total, running
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Named metric families with label sets, rendered in the Prometheus text format.
+
+    histogram()/counter()/gauge() return the series for a label set,
+    creating it on first use, so modules can look their series up at import
+    or construction time. Counters and gauges can instead be given fn, a
+    callable read at scrape time; that is how existing counters (queue
+    drops, cache hits, pool depth) are exported without touching their hot
+    path. Registering fn again for the same labels replaces the old one.
+    """
+
+    def __init__(self):
+        self._families = OrderedDict()  # name -> [type, help, {label tuple: series or callable}]
+        self._lock = threading.Lock()
+
+    def _series(self, kind, name, help_text, labels, factory, fn=None):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            family = self._families.setdefault(name, [kind, help_text, OrderedDict()])
+            if family[0] != kind:
+                raise ValueError(f"Metric {name} already registered as {family[0]}")
+            if fn is not None:
+                family[2][key] = fn
+                return fn
+            series = family[2].get(key)
+            if series is None:
+                series = family[2][key] = factory()
+            return series
+
+    def histogram(self, name, help_text, labels=None, buckets=DEFAULT_BUCKETS):
+        return self._series('histogram', name, help_text, labels, lambda: Histogram(buckets))
+
+    def counter(self, name, help_text, labels=None, fn=None):
+        return self._series('counter', name, help_text, labels, Counter, fn)
+
+    def gauge(self, name, help_text, labels=None, fn=None):
+        return self._series('gauge', name, help_text, labels, Gauge, fn)
+
+    def expose(self):
+        """Render every family in the Prometheus text exposition format"""
+        with self._lock:
+            families = [(name, kind, help_text, list(series.items()))
+                        for name, (kind, help_text, series) in self._families.items()]
+        lines = []
+        for name, kind, help_text, series in families:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, item in series:
+                if kind == 'histogram':
+                    cumulative, total, count = item.snapshot()
+                    for bound, running in cumulative:
+                        lines.append(f'{name}_bucket{_format_labels(labels, {"le": _format_value(bound)})} {running}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {total!r}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {count}')
+                    continue
+                try:
+                    value = item() if callable(item) else item.value
+                except Exception as e:
+                    logger.debug(f"Metric {name} could not be read: {e}")
+                    continue
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry every module reports into
+REGISTRY = Registry()
+
+
+class SamplingProfiler:
+    """Low-overhead wall-clock profiler that samples every thread's stack.
+
+    Every interval seconds the current stack of each thread is recorded;
+    collapsed() returns the counts in the folded format flamegraph tools
+    read ("thread;outer;...;inner count"). A kiosk stuck in dlib shows up
+    under the recognition workers, one waiting on the database under the
+    backend threads.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._stacks = _Tally()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='profiler', daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started ({1000 * self.interval:.1f}ms interval)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                key = ';'.join([names.get(ident, str(ident))] + stack[::-1])
+                with self._lock:
+                    self._stacks[key] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+        logger.info(f"Wrote {self.samples} profiler samples to {path}")
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and, with a profiler, /profile (folded stacks)"""
+
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=9108, profiler=None):
+        self.registry = registry
+        self.profiler = profiler
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] == '/metrics':
+                    body, content_type = server.registry.expose(), 'text/plain; version=0.0.4'
+                elif self.path.split('?')[0] == '/profile' and server.profiler is not None:
+                    body, content_type = server.profiler.collapsed(), 'text/plain'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='metrics-http', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"Metrics served on http://{self._httpd.server_address[0]}:{self.port}/metrics")
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def start_monitoring():
+    """Start the metrics endpoint and optional profiler from config; returns a stop callable"""
+    profiler = SamplingProfiler(PROFILER_INTERVAL) if PROFILER_ENABLED else None
+    server = None
+    if profiler is not None:
+        profiler.start()
+    if METRICS_PORT:
+        try:
+            server = MetricsServer(REGISTRY, METRICS_HOST, METRICS_PORT, profiler)
+            server.start()
+        except OSError as e:
+            logger.warning(f"Metrics endpoint not started on port {METRICS_PORT}: {e}")
+            server = None
+
+    def stop():
+        if server is not None:
+            server.stop()
+        if profiler is not None:
+            profiler.stop()
+            profiler.dump(PROFILER_OUTPUT)
+    return stop
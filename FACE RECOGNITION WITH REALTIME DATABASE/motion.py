@@ -0,0 +1,137 @@
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for motion gating settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+MOTION_WIDTH = getattr(config, 'MOTION_WIDTH', 160)
+MOTION_THRESHOLD = getattr(config, 'MOTION_THRESHOLD', 25)
+MOTION_MIN_AREA = getattr(config, 'MOTION_MIN_AREA', 0.002)
+MOTION_LEARNING_RATE = getattr(config, 'MOTION_LEARNING_RATE', 0.05)
+MOTION_ROI_MARGIN = getattr(config, 'MOTION_ROI_MARGIN', 0.5)
+MOTION_MAX_ROI_SHARE = getattr(config, 'MOTION_MAX_ROI_SHARE', 0.5)
+MOTION_REFRESH = getattr(config, 'MOTION_REFRESH', 10.0)
+
+RESULTS = ('static', 'roi', 'full')
+FRAMES = {result: REGISTRY.counter('motion_frames_total', "Frames by where detection ran: nowhere, in regions, everywhere",
+                                   {'result': result})
+          for result in RESULTS}
+
+
+def merge_boxes(boxes):
+    """Union overlapping (top, right, bottom, left) boxes until none overlap"""
+    boxes = [list(box) for box in boxes]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]:
+                    boxes[i] = [min(a[0], b[0]), max(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(box) for box in boxes]
+
+
+class MotionGate:
+    """Decides per frame whether, and where, face detection needs to run.
+
+    A small blurred grayscale copy of each frame is compared with a running
+    average background. A frame where almost nothing changed and no face is
+    being tracked needs no detection at all; otherwise detection is limited
+    to the changed regions and the areas around active tracks, widened by
+    margin, unless those cover more than max_roi_share of the frame. Every
+    refresh seconds the whole frame is searched regardless, so a face that
+    arrived without enough motion is still found. One gate per stream.
+    """
+
+    def __init__(self, width=MOTION_WIDTH, threshold=MOTION_THRESHOLD, min_area=MOTION_MIN_AREA,
+                 learning_rate=MOTION_LEARNING_RATE, margin=MOTION_ROI_MARGIN,
+                 max_roi_share=MOTION_MAX_ROI_SHARE, refresh=MOTION_REFRESH):
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.learning_rate = learning_rate
+        self.margin = margin
+        self.max_roi_share = max_roi_share
+        self.refresh = refresh
+        self.counts = dict.fromkeys(RESULTS, 0)
+        self._background = None
+        self._last_full = 0.0
+
+    def _result(self, result, regions):
+        self.counts[result] += 1
+        FRAMES[result].inc()
+        return regions
+
+    def _changed(self, thumb, h, w):
+        """Boxes of the changed areas, in frame coordinates"""
+        diff = cv2.absdiff(thumb, cv2.convertScaleAbs(self._background))
+        mask = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)[1]
+        if cv2.countNonZero(mask) < self.min_area * mask.size:
+            return []
+        mask = cv2.dilate(mask, None, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        fx, fy = w / thumb.shape[1], h / thumb.shape[0]
+        boxes = []
+        for contour in contours:
+            x, y, cw, ch = cv2.boundingRect(contour)
+            if cw * ch >= 9:  # single flickering pixels survive the dilation as 3x3 blobs
+                boxes.append((int(y * fy), int((x + cw) * fx), int((y + ch) * fy), int(x * fx)))
+        return boxes
+
+    def _widen(self, box, h, w):
+        top, right, bottom, left = box
+        # Wide enough for the detector to see a whole face even when only its edge moved
+        pad = int(self.margin * max(bottom - top, right - left, min(h, w) // 4))
+        return (max(0, top - pad), min(w, right + pad), min(h, bottom + pad), max(0, left - pad))
+
+    def regions(self, img, tracked=()):
+        """Where to detect in this BGR frame.
+
+        Returns None for the whole frame, [] for nowhere, else a list of
+        non-overlapping (top, right, bottom, left) boxes in frame pixels.
+        tracked are the boxes of the faces currently being followed.
+        """
+        h, w = img.shape[:2]
+        size = (self.width, max(1, int(round(h * self.width / w))))
+        thumb = cv2.cvtColor(cv2.resize(img, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        thumb = cv2.GaussianBlur(thumb, (5, 5), 0)
+        now = time.monotonic()
+        if self._background is None or self._background.shape != thumb.shape:
+            self._background = thumb.astype(np.float32)
+            self._last_full = now
+            return self._result('full', None)
+
+        boxes = self._changed(thumb, h, w)
+        cv2.accumulateWeighted(thumb, self._background, self.learning_rate)
+        if now - self._last_full >= self.refresh:
+            self._last_full = now
+            return self._result('full', None)
+        boxes += list(tracked)
+        if not boxes:
+            return self._result('static', [])
+        boxes = merge_boxes([self._widen(box, h, w) for box in boxes])
+        if sum((b - t) * (r - l) for t, r, b, l in boxes) > self.max_roi_share * h * w:
+            return self._result('full', None)
+        return self._result('roi', boxes)
+
+    def report(self):
+        total = sum(self.counts.values()) or 1
+        shares = ' '.join(f"{result}={100.0 * self.counts[result] / total:.0f}%" for result in RESULTS)
+        return f"motion {shares}"
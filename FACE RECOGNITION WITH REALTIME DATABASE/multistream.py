@@ -0,0 +1,257 @@
+import sys
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from backend import open_backend
+from gallery import load_gallery
+from metrics import REGISTRY, start_monitoring
+from pipeline import DropOldestQueue, FrameRing, StageStats
+from services import BackendServices
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for multi-stream settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+STREAM_SOURCES = getattr(config, 'STREAM_SOURCES', [0])
+STREAM_WORKERS = getattr(config, 'STREAM_WORKERS', 4)
+STREAM_USE_PROCESSES = getattr(config, 'STREAM_USE_PROCESSES', True)
+STREAM_RECONNECT_DELAY = getattr(config, 'STREAM_RECONNECT_DELAY', 5.0)
+STATS_LOG_INTERVAL = getattr(config, 'STATS_LOG_INTERVAL', 10)
+
+
+def parse_source(source):
+    """Camera indices are given as integers, RTSP URLs and video files as strings"""
+    source = str(source)
+    return int(source) if source.isdigit() else source
+
+
+class Stream:
+    """One camera, RTSP feed or video file with its own recognition state.
+
+    The capture thread keeps only the newest frame that is due for
+    detection (every frame_skip-th frame). Live sources are reopened after
+    STREAM_RECONNECT_DELAY when they fail; a video file is played at its
+    own frame rate and the stream finishes at end of file.
+    """
+
+    def __init__(self, name, source, recognizer):
+        self.name = name
+        self.source = source
+        self.live = isinstance(source, int) or '://' in source
+        self.recognizer = recognizer
+        # The queued frame and the one being recognized are held, so capture cycles through the other slots
+        self.ring = FrameRing(4)
+        self.frames = DropOldestQueue(1, on_drop=self.ring.release)
+        self.stats = StageStats(name)
+        self.busy = False  # a worker holds a frame of this stream
+        self.finished = False
+        self.captured = 0
+        self.processed = 0
+        self.recognized = 0
+        for state in ('captured', 'processed', 'recognized'):
+            REGISTRY.counter('face_stream_frames_total', 'Frames per stream and state', {'stream': name, 'state': state},
+                             fn=lambda state=state: getattr(self, state))
+        REGISTRY.counter('face_frames_dropped_total', 'Frames dropped by a full queue', {'queue': name},
+                         fn=lambda: self.frames.dropped)
+
+    def capture_loop(self, stop, wake):
+        while not stop.is_set():
+            cap = cv2.VideoCapture(self.source)
+            if not cap.isOpened():
+                logger.warning(f"[{self.name}] Failed to open {self.source}")
+                if not self.live:
+                    break
+                stop.wait(STREAM_RECONNECT_DELAY)
+                continue
+            logger.info(f"[{self.name}] Opened {self.source}")
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            frame_id = 0
+            while not stop.is_set():
+                start = time.perf_counter()
+                success, img = self.ring.read(cap)
+                if not success:
+                    break
+                frame_id += 1
+                self.captured += 1
+                if frame_id % self.recognizer.frame_skip == 0:
+                    self.ring.hold(img)
+                    self.frames.put(img)
+                    wake()
+                if not self.live:
+                    # Pace file playback like a camera so frame skipping behaves the same
+                    stop.wait(max(0.0, 1.0 / fps - (time.perf_counter() - start)))
+            cap.release()
+            if not self.live:
+                logger.info(f"[{self.name}] End of {self.source}")
+                break
+            logger.warning(f"[{self.name}] Lost {self.source}, reconnecting in {STREAM_RECONNECT_DELAY}s")
+            stop.wait(STREAM_RECONNECT_DELAY)
+        self.finished = True
+        wake()
+
+    def report(self):
+        mean_ms, p95_ms, rate = self.stats.summary()
+        parts = [f"captured={self.captured} processed={self.processed} recognized={self.recognized} "
+                 f"dropped={self.frames.dropped} recognize {mean_ms:.1f}/{p95_ms:.1f}ms {rate:.1f}/s"]
+        parts.extend(reporter() for reporter in self.recognizer.reporters(shared=False))
+        return f"[{self.name}] {' | '.join(parts)}"
+
+
+class MultiStreamEngine:
+    """Headless recognition over N streams on one fixed-size worker pool.
+
+    Every stream owns its capture thread, tracker and scheduler; the
+    gallery, the detection process pool, the encoding batcher and the
+    backend services are shared. Workers take frames round-robin, and a stream never has more
+    than one frame in flight, so a busy camera cannot starve a quiet one.
+    new_recognizer() makes the recognizer of each stream, a
+    FrameRecognizer over the gallery unless given.
+    """
+
+    def __init__(self, sources, gallery, services, workers=4, executor=None, batcher=None, new_recognizer=None):
+        self.gallery = gallery
+        self.services = services
+        self.executor = executor
+        self.batcher = batcher
+        self.workers = max(1, workers)
+        new_recognizer = new_recognizer or self._frame_recognizer
+        self.streams = [Stream(f'stream-{i}', source, new_recognizer()) for i, source in enumerate(sources)]
+        self._next = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_report = time.monotonic()
+
+    def _frame_recognizer(self):
+        # dlib is only imported when the engine is built
+        from recognition import FrameRecognizer
+        return FrameRecognizer(self.gallery, self.executor, batcher=self.batcher)
+
+    def start(self):
+        for stream in self.streams:
+            self._threads.append(threading.Thread(target=stream.capture_loop, args=(self._stop, self._wake),
+                                                  name=f'capture-{stream.name}', daemon=True))
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._worker_loop, name=f'recognize-{i}', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Multi-stream engine started with {len(self.streams)} streams and {self.workers} workers")
+
+    def stop(self):
+        self._stop.set()
+        self._wake()
+        for thread in self._threads:
+            thread.join(timeout=2)
+
+    def running(self):
+        return not self._stop.is_set() and not all(s.finished for s in self.streams)
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _next_job(self):
+        """Round-robin over streams that are idle and have a frame waiting (caller holds the lock)"""
+        count = len(self.streams)
+        for offset in range(count):
+            stream = self.streams[(self._next + offset) % count]
+            if stream.busy:
+                continue
+            img = stream.frames.get_nowait()
+            if img is not None:
+                stream.busy = True
+                self._next = (self._next + offset + 1) % count
+                return stream, img
+        return None
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            with self._cond:
+                job = self._next_job()
+                if job is None:
+                    self._cond.wait(0.1)
+                    continue
+            stream, img = job
+            try:
+                with stream.stats.time():
+                    faces = stream.recognizer.recognize(img, stream.frames.dropped)
+                stream.processed += 1
+                for detected_id, distance, box in faces:
+                    if detected_id is not None:
+                        stream.recognized += 1
+                        self.services.submit(detected_id, stream.name, distance)
+            except Exception as e:
+                logger.error(f"[{stream.name}] Recognition failed: {e}")
+            finally:
+                stream.ring.release(img)
+                with self._cond:
+                    stream.busy = False
+                    self._cond.notify_all()
+
+    def report(self, interval=10.0):
+        """Log per-stream counters and latency every interval seconds"""
+        now = time.monotonic()
+        if now - self._last_report < interval:
+            return
+        self._last_report = now
+        for stream in self.streams:
+            logger.info(f"Stream {stream.report()}")
+        reporters = self.services.reporters() + ([self.batcher.report] if self.batcher is not None else [])
+        if hasattr(self.gallery, 'report'):
+            reporters.append(self.gallery.report)
+        logger.info(f"Shared: {' | '.join(reporter() for reporter in reporters)}")
+
+
+def main(sources):
+    logging.basicConfig(level=config.get_log_level() if config else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s')
+    backend = open_backend()
+    if backend is None:
+        return
+
+    gallery = load_gallery()
+    if gallery is None:
+        return
+
+    from recognition import create_batcher
+    stop_monitoring = start_monitoring()
+    services = BackendServices(backend)
+    services.start()
+    # Backend and monitoring threads are already running; spawn avoids forking them
+    executor = None
+    if STREAM_USE_PROCESSES:
+        executor = ProcessPoolExecutor(STREAM_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    batcher = create_batcher(executor, STREAM_WORKERS)
+    engine = MultiStreamEngine(sources, gallery, services, workers=STREAM_WORKERS,
+                               executor=executor, batcher=batcher)
+    engine.start()
+    try:
+        while engine.running():
+            time.sleep(1.0)
+            engine.report(STATS_LOG_INTERVAL)
+        logger.info("All streams finished")
+    except KeyboardInterrupt:
+        logger.info("Program interrupted by user")
+    finally:
+        engine.stop()
+        if batcher is not None:
+            batcher.close()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        services.close()
+        stop_monitoring()
+        logger.info("Multi-stream mode closed")
+
+
+if __name__ == "__main__":
+    main([parse_source(s) for s in (sys.argv[1:] or STREAM_SOURCES)])
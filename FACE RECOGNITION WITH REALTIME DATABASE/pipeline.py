@@ -0,0 +1,358 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class DropOldestQueue:
+    """Bounded queue that discards the oldest item instead of blocking the producer.
+
+    on_drop, if given, is called with every discarded item.
+    """
+
+    def __init__(self, maxsize, on_drop=None):
+        self._queue = queue.Queue(maxsize)
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    dropped = self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        """Return the next item, or None if nothing arrived within timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_nowait(self):
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+class FrameRing:
+    """Fixed set of frame buffers that capture reads into in turn.
+
+    cap.read() decodes straight into the least recently written slot
+    instead of allocating a new array per frame. A frame handed to a slow
+    consumer (a recognition worker) is held with hold(img) until the
+    consumer calls release(img), and capture never reads into a held slot,
+    so detection, the quality gate and encoding all see the same frame
+    however long they take. If every slot is held the frame goes into a new
+    buffer that is not kept. Frames that are not held, such as those on
+    their way to the display, are safe while fewer than size - held newer
+    frames have been captured.
+    """
+
+    def __init__(self, size):
+        self.size = max(2, size)
+        self._slots = []
+        self._written = []  # capture sequence number of each slot
+        self._held = []  # hold count of each slot
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _index(self, img):
+        for i, slot in enumerate(self._slots):
+            if slot is img:
+                return i
+        return None
+
+    def hold(self, img):
+        with self._lock:
+            i = self._index(img)
+            if i is not None:
+                self._held[i] += 1
+
+    def release(self, img):
+        with self._lock:
+            i = self._index(img)
+            if i is not None and self._held[i]:
+                self._held[i] -= 1
+
+    def read(self, cap):
+        with self._lock:
+            free = [i for i, held in enumerate(self._held) if not held]
+            i = min(free, key=self._written.__getitem__) if free and len(self._slots) == self.size else None
+        if i is None:
+            success, img = cap.read()
+            if success:
+                with self._lock:
+                    if len(self._slots) < self.size:
+                        self._slots.append(img)
+                        self._held.append(0)
+                        self._sequence += 1
+                        self._written.append(self._sequence)
+            return success, img
+        slot = self._slots[i]
+        success, img = cap.read(slot)
+        if success:
+            with self._lock:
+                if img is not slot:
+                    # Resolution changed; keep the buffer OpenCV allocated
+                    self._slots[i] = img
+                self._sequence += 1
+                self._written[i] = self._sequence
+        return success, img
+
+
+class FrameOrder:
+    """Keeps the per-stream steps of concurrently recognized frames in capture order.
+
+    ticket() numbers the frames in the order they are taken for
+    recognition. Inside recognition each named section (one of sections)
+    is entered with `with ticket.turn(name):`, which waits until every
+    earlier ticket has passed that section and runs it by itself, so
+    state such as a tracker sees frames in order while the rest of the work
+    overlaps. close() passes the sections a ticket skipped (an early return
+    or an error), so later frames are never held up; every ticket must be
+    closed.
+    """
+
+    def __init__(self, sections):
+        self.sections = tuple(sections)
+        self._issued = 0
+        self._next = dict.fromkeys(self.sections, 0)
+        self._cond = threading.Condition()
+
+    def ticket(self):
+        with self._cond:
+            number = self._issued
+            self._issued += 1
+        return FrameTicket(self, number)
+
+    def _enter(self, section, number):
+        with self._cond:
+            self._cond.wait_for(lambda: self._next[section] == number)
+
+    def _leave(self, section, number):
+        with self._cond:
+            self._next[section] = number + 1
+            self._cond.notify_all()
+
+
+class FrameTicket:
+    """One frame's place in a FrameOrder"""
+
+    def __init__(self, order, number):
+        self.order = order
+        self.number = number
+        self._passed = set()
+
+    @contextmanager
+    def turn(self, section):
+        self.order._enter(section, self.number)
+        try:
+            yield
+        finally:
+            self._passed.add(section)
+            self.order._leave(section, self.number)
+
+    def close(self):
+        for section in self.order.sections:
+            if section not in self._passed:
+                with self.turn(section):
+                    pass
+
+
+class StageStats:
+    """Rolling latency and throughput figures for one pipeline stage.
+
+    Every sample also goes to the face_stage_seconds histogram of the
+    metrics registry, labelled with the stage name.
+    """
+
+    def __init__(self, name, window=256):
+        self.name = name
+        self._samples = deque(maxlen=window)
+        self._stamps = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._histogram = REGISTRY.histogram('face_stage_seconds', 'Latency of each hot-path stage',
+                                             {'stage': name})
+
+    def record(self, seconds):
+        self._histogram.observe(seconds)
+        with self._lock:
+            self._samples.append(seconds)
+            self._stamps.append(time.monotonic())
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def summary(self):
+        """Return (mean ms, p95 ms, events per second) over the window"""
+        with self._lock:
+            samples = sorted(self._samples)
+            stamps = list(self._stamps)
+        if not samples:
+            return 0.0, 0.0, 0.0
+        mean_ms = 1000 * sum(samples) / len(samples)
+        p95_ms = 1000 * samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+        span = stamps[-1] - stamps[0]
+        rate = (len(stamps) - 1) / span if span > 0 else 0.0
+        return mean_ms, p95_ms, rate
+
+    def percentiles(self, *quantiles):
+        """Return the given quantiles (0..1) of the window in seconds"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return tuple(0.0 for _ in quantiles)
+        return tuple(samples[min(len(samples) - 1, int(q * len(samples)))] for q in quantiles)
+
+
+class PipelineEngine:
+    """Capture thread -> recognition worker pool -> render stage.
+
+    The capture thread feeds every frame to the display queue and every
+    frame_skip-th frame to the detection queue. Worker threads run
+    recognize(img, ticket) on detection frames and push results to the
+    result queue. ticket() is called as each frame is taken off the
+    detection queue; its FrameTicket lets the recognizer keep per-stream
+    state (tracker, motion background) in capture order while frames are
+    detected and encoded in parallel, and is closed when recognize()
+    returns. Without ticket the callable gets None. All queues drop the
+    oldest entry under load, so a slow detector never stalls capture or
+    display; the render stage (the caller's loop) pulls frames with
+    latest_frame() and results with poll_results().
+    """
+
+    STAGES = ('capture', 'recognize', 'render')
+
+    def __init__(self, cap, recognize, workers=2, queue_size=2, frame_skip=2, ticket=None):
+        self.cap = cap
+        self.recognize = recognize
+        self.ticket = ticket
+        self.workers = max(1, workers)
+        self.frame_skip = max(1, frame_skip)
+        self.display_queue = DropOldestQueue(queue_size)
+        # Frames queued for detection or being recognized are held in the ring until their worker is done
+        self.detect_queue = DropOldestQueue(queue_size, on_drop=lambda item: self.ring.release(item[1]))
+        self.result_queue = DropOldestQueue(queue_size * self.workers)
+        # Queued frames of both queues, one per worker, one being rendered and one being captured
+        self.ring = FrameRing(2 * queue_size + self.workers + 2)
+        self.stats = {name: StageStats(name) for name in self.STAGES}
+        self._stop = threading.Event()
+        self._threads = []
+        self._take_lock = threading.Lock()  # tickets are issued in detection queue order
+        self._last_result_id = -1
+        self._last_report = time.monotonic()
+        self.reporters = []  # callables returning extra text for the periodic report
+        for name, q in (('display', self.display_queue), ('detect', self.detect_queue), ('result', self.result_queue)):
+            REGISTRY.counter('face_frames_dropped_total', 'Frames dropped by a full queue',
+                             {'queue': name}, fn=lambda q=q: q.dropped)
+            REGISTRY.gauge('face_queue_depth', 'Items waiting in a pipeline queue', {'queue': name}, fn=q.qsize)
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._capture_loop, name='capture', daemon=True)]
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._worker_loop, name=f'recognize-{i}', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Pipeline started with {self.workers} recognition workers")
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+
+    def _capture_loop(self):
+        frame_id = 0
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            success, img = self.ring.read(self.cap)
+            if not success:
+                logger.warning("Failed to capture frame")
+                time.sleep(0.05)
+                continue
+            self.stats['capture'].record(time.perf_counter() - start)
+            frame_id += 1
+            self.display_queue.put((frame_id, img))
+            if frame_id % self.frame_skip == 0:
+                self.ring.hold(img)
+                self.detect_queue.put((frame_id, img))
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            with self._take_lock:
+                item = self.detect_queue.get(timeout=0.1)
+                ticket = self.ticket() if item is not None and self.ticket is not None else None
+            if item is None:
+                continue
+            frame_id, img = item
+            start = time.perf_counter()
+            try:
+                result = self.recognize(img, ticket)
+            except Exception as e:
+                logger.error(f"Recognition failed on frame {frame_id}: {e}")
+                continue
+            finally:
+                if ticket is not None:
+                    ticket.close()
+                self.ring.release(img)
+            self.stats['recognize'].record(time.perf_counter() - start)
+            self.result_queue.put((frame_id, result))
+
+    def latest_frame(self, timeout=1.0):
+        """Return (frame_id, img) of the next frame to display, or None"""
+        return self.display_queue.get(timeout=timeout)
+
+    def poll_results(self):
+        """Return recognition results that arrived since the last call, oldest first.
+
+        Workers can finish out of order; results older than one already
+        returned are discarded so the display never steps backwards.
+        """
+        results = []
+        while True:
+            item = self.result_queue.get_nowait()
+            if item is None:
+                break
+            results.append(item)
+        fresh = []
+        for frame_id, result in sorted(results, key=lambda r: r[0]):
+            if frame_id > self._last_result_id:
+                self._last_result_id = frame_id
+                fresh.append(result)
+        return fresh
+
+    def report(self, interval=10.0):
+        """Log per-stage latency every interval seconds"""
+        now = time.monotonic()
+        if now - self._last_report < interval:
+            return
+        self._last_report = now
+        parts = []
+        for name in self.STAGES:
+            mean_ms, p95_ms, rate = self.stats[name].summary()
+            parts.append(f"{name} {mean_ms:.1f}/{p95_ms:.1f}ms {rate:.1f}/s")
+        parts.append(f"dropped display={self.display_queue.dropped} detect={self.detect_queue.dropped}")
+        parts.extend(reporter() for reporter in self.reporters)
+        logger.info(f"Pipeline (mean/p95, rate): {' | '.join(parts)}")
@@ -0,0 +1,364 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+def _backend_metrics(op):
+    """Latency histogram and error counter of one kind of Firebase call"""
+    return (REGISTRY.histogram('face_backend_seconds', 'Latency of Firebase reads and writes', {'op': op}),
+            REGISTRY.counter('face_backend_errors_total', 'Failed backend operations', {'op': op}))
+
+
+PROFILE_GET, PROFILE_GET_ERRORS = _backend_metrics('profile_get')
+ROSTER_GET, ROSTER_GET_ERRORS = _backend_metrics('roster_get')
+PHOTO_GET, PHOTO_GET_ERRORS = _backend_metrics('photo_download')
+PHOTO_LIST, PHOTO_LIST_ERRORS = _backend_metrics('photo_list')
+
+
+class LRUCache:
+    """Thread-safe LRU map whose entries also expire after ttl seconds"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._lookup(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return item
+
+    def peek(self, key):
+        """Like get(), without counting a hit or miss (for per-frame polling)"""
+        with self._lock:
+            return self._lookup(key)
+
+    def _lookup(self, key):
+        item = self._data.get(key)
+        if item is None or item[1] < time.monotonic():
+            return None
+        self._data.move_to_end(key)
+        return item[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ProfileCache:
+    """Read-through cache of student profiles and photos.
+
+    Lookups go memory (bounded LRU with TTL) -> local SQLite store ->
+    Firebase. preload() fetches the whole Students node in one request and
+    every changed photo in the background, and start_listener() applies the
+    Realtime Database change feed to both tiers, so a recognized student's
+    card is normally served without a network round trip. While the
+    listener runs, stored profiles are current and never re-fetched;
+    without it, and for photos, an entry older than ttl is served as is
+    while a background refresh fetches the new copy, so only a student
+    missing from every tier waits on the network.
+    """
+
+    def __init__(self, students_ref, bucket, cache_dir='profile_cache',
+                 max_profiles=5000, max_photos=500, ttl=3600):
+        self.students_ref = students_ref
+        self.bucket = bucket
+        self.profiles = LRUCache(max_profiles, ttl)
+        self.photos = LRUCache(max_photos, ttl)
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'profiles.db'), check_same_thread=False)
+        self._db_lock = threading.Lock()
+        with self._db_lock:
+            self._db.execute('CREATE TABLE IF NOT EXISTS profiles (id TEXT PRIMARY KEY, data TEXT, fetched REAL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS photos (id TEXT PRIMARY KEY, md5 TEXT, data BLOB, fetched REAL)')
+            self._db.commit()
+        self._listener = None
+        self._closed = threading.Event()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='profile-refresh')
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        for name, cache in (('profile', self.profiles), ('photo', self.photos)):
+            REGISTRY.counter('face_cache_hits_total', 'Memory cache hits', {'cache': name},
+                             fn=lambda cache=cache: cache.hits)
+            REGISTRY.counter('face_cache_misses_total', 'Memory cache misses', {'cache': name},
+                             fn=lambda cache=cache: cache.misses)
+
+    # Local store
+
+    def _store_profile(self, student_id, info):
+        with self._db_lock:
+            if info is None:
+                self._db.execute('DELETE FROM profiles WHERE id = ?', (student_id,))
+            else:
+                self._db.execute('INSERT OR REPLACE INTO profiles VALUES (?, ?, ?)',
+                                 (student_id, json.dumps(info), time.time()))
+            self._db.commit()
+
+    def _store_profiles(self, roster, replace=False):
+        """Bulk write of a roster snapshot in one transaction; replace drops every profile not in it"""
+        for student_id, info in roster.items():
+            self.profiles.put(student_id, info)
+        with self._db_lock:
+            if replace:
+                self._db.execute('DELETE FROM profiles')
+            self._db.executemany('INSERT OR REPLACE INTO profiles VALUES (?, ?, ?)',
+                                 [(sid, json.dumps(info), time.time()) for sid, info in roster.items()])
+            self._db.commit()
+
+    def _stored_profile(self, student_id):
+        with self._db_lock:
+            row = self._db.execute('SELECT data, fetched FROM profiles WHERE id = ?', (student_id,)).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def _stored_photo(self, student_id):
+        with self._db_lock:
+            row = self._db.execute('SELECT data, fetched FROM photos WHERE id = ?', (student_id,)).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    # Reads
+
+    def get_profile(self, student_id):
+        """Return the profile dict, fetching it only if no tier has it"""
+        info = self.profiles.get(student_id)
+        if info is not None:
+            return info
+        info, fetched = self._stored_profile(student_id)
+        if info is None:
+            info = self._fetch_profile(student_id)
+        elif self._listener is None and time.time() - fetched > self.ttl:
+            self._refresh('profile', student_id, self._fetch_profile)
+        if info is not None:
+            self.profiles.put(student_id, info)
+        return info
+
+    def _fetch_profile(self, student_id):
+        if self._closed.is_set():
+            return None  # refreshes still queued at shutdown
+        try:
+            with PROFILE_GET.time():
+                info = self.students_ref.child(student_id).get()
+        except Exception as e:
+            # The stale local copy stays in use while the network is down
+            PROFILE_GET_ERRORS.inc()
+            logger.warning(f"Profile fetch failed for {student_id}: {e}")
+            return None
+        if info is not None:
+            self._store_profile(student_id, info)
+            self.profiles.put(student_id, info)
+        return info
+
+    def get_photo(self, student_id):
+        """Return the decoded BGR photo, fetching it only if no tier has it"""
+        img = self.photos.get(student_id)
+        if img is not None:
+            return img
+        data, fetched = self._stored_photo(student_id)
+        if data is None:
+            data = self._download_photo(student_id)
+        elif time.time() - fetched > self.ttl:
+            self._refresh('photo', student_id, self._download_photo)
+        if data is None:
+            return None
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is not None:
+            self.photos.put(student_id, img)
+        return img
+
+    def peek(self, student_id):
+        """Memory-only lookup for the render loop; never blocks on disk or network and is not counted"""
+        return self.profiles.peek(student_id), self.photos.peek(student_id)
+
+    def _refresh(self, kind, student_id, fetch):
+        """Run fetch(student_id) in the background unless a refresh of it is already queued"""
+        key = (kind, student_id)
+        with self._refresh_lock:
+            if key in self._refreshing or self._closed.is_set():
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                fetch(student_id)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        try:
+            self._refresher.submit(run)
+        except RuntimeError:
+            # Shut down by close() meanwhile
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+
+    def _download_photo(self, student_id, blob=None):
+        if self._closed.is_set():
+            return None  # preload downloads still queued at shutdown
+        try:
+            with PHOTO_GET.time():
+                blob = blob or self.bucket.get_blob(f'images/{student_id}.png')
+                if blob is None:
+                    logger.warning(f"No image found for student ID: {student_id}")
+                    return None
+                data = blob.download_as_bytes()
+            with self._db_lock:
+                self._db.execute('INSERT OR REPLACE INTO photos VALUES (?, ?, ?, ?)',
+                                 (student_id, blob.md5_hash, data, time.time()))
+                self._db.commit()
+            return data
+        except Exception as e:
+            PHOTO_GET_ERRORS.inc()
+            logger.warning(f"Photo download failed for {student_id}: {e}")
+            return None
+
+    # Writes and invalidation
+
+    def update_profile(self, student_id, changes):
+        """Apply a local change (e.g. an attendance write) to both tiers"""
+        info = self.get_profile(student_id)
+        if info is None:
+            return
+        info = dict(info, **changes)
+        self.profiles.put(student_id, info)
+        self._store_profile(student_id, info)
+
+    def preload(self, photo_workers=8):
+        """Fetch the full roster once and every photo whose content changed.
+
+        With the listener running its initial snapshot already delivers the
+        roster, so only photos are fetched here.
+        """
+        start = time.perf_counter()
+        count = 0
+        if self._listener is None:
+            try:
+                with ROSTER_GET.time():
+                    roster = self.students_ref.get() or {}
+                self._store_profiles(roster)
+                count = len(roster)
+            except Exception as e:
+                ROSTER_GET_ERRORS.inc()
+                logger.warning(f"Roster preload failed, serving local store: {e}")
+        if self._closed.is_set():
+            return
+        with self._db_lock:
+            known = dict(self._db.execute('SELECT id, md5 FROM photos').fetchall())
+
+        try:
+            with PHOTO_LIST.time():
+                blobs = {os.path.splitext(os.path.basename(b.name))[0]: b
+                         for b in self.bucket.list_blobs(prefix='images/') if b.name.endswith('.png')}
+        except Exception as e:
+            PHOTO_LIST_ERRORS.inc()
+            logger.warning(f"Photo listing failed: {e}")
+            blobs = {}
+        stale = [sid for sid, blob in blobs.items() if known.get(sid) != blob.md5_hash]
+        with self._db_lock:
+            # Unchanged photos were just validated against storage
+            self._db.executemany('UPDATE photos SET fetched = ? WHERE id = ?',
+                                 [(time.time(), sid) for sid in blobs if sid not in stale])
+            self._db.commit()
+        with ThreadPoolExecutor(max_workers=photo_workers) as executor:
+            for student_id in stale:
+                executor.submit(self._download_photo, student_id, blobs[student_id])
+        # Warm decoded photos up to the memory bound
+        for student_id in list(blobs or known)[:self.photos.max_entries]:
+            if self._closed.is_set():
+                return
+            self.get_photo(student_id)
+        logger.info(f"Preloaded {count} profiles and {len(stale)} changed photos "
+                    f"in {time.perf_counter() - start:.1f}s")
+
+    def start_listener(self):
+        """Apply the Students change feed to the cache instead of re-fetching"""
+        try:
+            self._listener = self.students_ref.listen(self._on_change)
+            logger.info("Listening for student profile changes")
+        except Exception as e:
+            logger.warning(f"Could not start profile listener, relying on TTL: {e}")
+
+    def _on_change(self, event):
+        # An exception here would end the listener, and the cache would silently stop following changes
+        try:
+            self._apply_change(event.event_type, event.path, event.data)
+        except Exception as e:
+            logger.warning(f"Ignoring student change at {event.path}: {e}")
+
+    def _apply_change(self, event_type, path, data):
+        parts = [p for p in path.split('/') if p]
+        if not parts:
+            roster = data if isinstance(data, dict) else {}
+            if event_type == 'put':
+                # Initial snapshot or whole-node write: students missing from it were deleted
+                self.profiles.clear()
+                self._store_profiles({sid: info for sid, info in roster.items() if isinstance(info, dict)},
+                                     replace=True)
+                return
+            # Multi-path update: every key ('<id>' or '<id>/<field>') is written as a put, None deletes
+            for key, value in roster.items():
+                self._apply_change('put', key, value)
+            return
+
+        student_id = parts[0]
+        if len(parts) == 1 and event_type == 'put':
+            info = data
+        elif len(parts) == 1 and isinstance(data, dict):
+            info = dict(self._stored_profile(student_id)[0] or {}, **data)
+        elif len(parts) == 2:
+            info = dict(self._stored_profile(student_id)[0] or {})
+            info[parts[1]] = data
+        else:
+            info = None  # Deeper change: drop the profile and let the next read fetch it
+        self._set_profile(student_id, info)
+
+    def _set_profile(self, student_id, info):
+        """Replace a student's profile in both tiers; None (a deletion) or a non-dict drops it"""
+        if isinstance(info, dict):
+            info = {field: value for field, value in info.items() if value is not None}
+        if not isinstance(info, dict) or not info:
+            self.profiles.pop(student_id)
+            self.photos.pop(student_id)
+            self._store_profile(student_id, None)
+            return
+        self.profiles.put(student_id, info)
+        self._store_profile(student_id, info)
+
+    def close(self):
+        self._closed.set()
+        if self._listener is not None:
+            self._listener.close()
+        self._refresher.shutdown(wait=True, cancel_futures=True)
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,101 @@
+import logging
+
+import cv2
+import numpy as np
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for quality gate settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+QUALITY_MIN_FACE_SIZE = getattr(config, 'QUALITY_MIN_FACE_SIZE', 40)
+QUALITY_MIN_SHARPNESS = getattr(config, 'QUALITY_MIN_SHARPNESS', 25.0)
+QUALITY_MIN_BRIGHTNESS = getattr(config, 'QUALITY_MIN_BRIGHTNESS', 40)
+QUALITY_MAX_BRIGHTNESS = getattr(config, 'QUALITY_MAX_BRIGHTNESS', 220)
+QUALITY_MAX_YAW = getattr(config, 'QUALITY_MAX_YAW', 0.35)
+
+REASONS = ('size', 'blur', 'exposure', 'pose')
+CHECKED = REGISTRY.counter('face_quality_checked_total', "Faces checked by the quality gate before encoding")
+REJECTED = {reason: REGISTRY.counter('face_quality_rejected_total', "Faces skipped before encoding, by reason",
+                                     {'reason': reason})
+            for reason in REASONS}
+
+# Faces are compared for sharpness at one size, since Laplacian variance grows with resolution
+_SHARPNESS_WIDTH = 64
+
+
+def face_yaw(shape):
+    """Horizontal head turn from a dlib 5-point shape: 0 frontal, about 0.5 and beyond in profile.
+
+    The nose tip's offset from the midpoint between the eyes, measured along
+    the eye line in units of the eye distance.
+    """
+    points = np.array([(shape.part(i).x, shape.part(i).y) for i in range(5)], dtype=np.float32)
+    eye_a, eye_b = points[0:2].mean(axis=0), points[2:4].mean(axis=0)
+    eye_line = eye_b - eye_a
+    length_sq = float(eye_line @ eye_line)
+    if length_sq < 1.0:
+        return float('inf')  # eyes on top of each other: a full profile
+    return float((points[4] - (eye_a + eye_b) / 2) @ eye_line) / length_sq
+
+
+class QualityGate:
+    """Cheap per-face checks that keep unmatchable faces out of the encoder.
+
+    check() looks at a face box on the full-resolution frame: its size, its
+    sharpness (variance of the Laplacian) and its mean brightness, a few
+    microseconds of work against tens of milliseconds for an encoding. Head
+    pose needs landmarks, so max_yaw is applied where the faces are aligned
+    for encoding (see encode_faces and face_chips in recognition.py) and
+    reported back through reject('pose'). Every rejection is counted per
+    reason in face_quality_rejected_total.
+    """
+
+    def __init__(self, min_size=QUALITY_MIN_FACE_SIZE, min_sharpness=QUALITY_MIN_SHARPNESS,
+                 min_brightness=QUALITY_MIN_BRIGHTNESS, max_brightness=QUALITY_MAX_BRIGHTNESS,
+                 max_yaw=QUALITY_MAX_YAW):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_yaw = max_yaw
+
+    def check(self, img, box):
+        """Return the reason a face box fails, or None if it is worth encoding"""
+        top, right, bottom, left = box
+        if min(bottom - top, right - left) < self.min_size:
+            return 'size'
+        crop = img[max(0, top):bottom, max(0, left):right]
+        if crop.size == 0:
+            return 'size'
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        brightness = float(gray.mean())
+        if brightness < self.min_brightness or brightness > self.max_brightness:
+            return 'exposure'
+        height = max(1, int(round(gray.shape[0] * _SHARPNESS_WIDTH / gray.shape[1])))
+        gray = cv2.resize(gray, (_SHARPNESS_WIDTH, height), interpolation=cv2.INTER_AREA)
+        if cv2.Laplacian(gray, cv2.CV_64F).var() < self.min_sharpness:
+            return 'blur'
+        return None
+
+    def accept(self, img, box):
+        """check() and count the outcome; True if the face should be encoded"""
+        CHECKED.inc()
+        reason = self.check(img, box)
+        if reason is not None:
+            REJECTED[reason].inc()
+        return reason is None
+
+    def reject(self, reason, count=1):
+        if count:
+            REJECTED[reason].inc(count)
+
+    def report(self):
+        rejected = ' '.join(f"{reason}={REJECTED[reason].value}" for reason in REASONS)
+        return f"quality checked={CHECKED.value} rejected {rejected}"
@@ -0,0 +1,318 @@
+import time
+import logging
+import threading
+
+import cv2
+import dlib
+import numpy as np
+import face_recognition
+from face_recognition import api as face_api
+
+# Gallery loading lives in gallery.py so it can run without dlib; re-exported for existing callers
+from gallery import build_matcher, load_centroids, load_encoding_file, load_gallery  # noqa: F401
+from tracker import FaceTracker
+from scheduler import AdaptiveScheduler
+from batcher import EncodingBatcher
+from pipeline import FrameOrder, StageStats
+from quality import QualityGate, face_yaw
+from motion import MotionGate
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for recognition settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+FRAME_SKIP = getattr(config, 'FRAME_SKIP', 2)
+FACE_DETECTION_SCALE = getattr(config, 'FACE_DETECTION_SCALE', 0.25)
+MIN_FACE_CONFIDENCE = getattr(config, 'MIN_FACE_CONFIDENCE', 0.6)
+FACE_DETECTION_MODEL = getattr(config, 'FACE_DETECTION_MODEL', 'cnn')
+TRACKING_ENABLED = getattr(config, 'TRACKING_ENABLED', True)
+TRACK_IOU_THRESHOLD = getattr(config, 'TRACK_IOU_THRESHOLD', 0.3)
+TRACK_MAX_MISSES = getattr(config, 'TRACK_MAX_MISSES', 5)
+TRACK_REENCODE_INTERVAL = getattr(config, 'TRACK_REENCODE_INTERVAL', 30)
+TRACK_CONFIDENCE_DECAY = getattr(config, 'TRACK_CONFIDENCE_DECAY', 0.95)
+TRACK_MIN_CONFIDENCE = getattr(config, 'TRACK_MIN_CONFIDENCE', 0.3)
+ADAPTIVE_SCHEDULING = getattr(config, 'ADAPTIVE_SCHEDULING', True)
+SCHEDULER_TARGET_LATENCY = getattr(config, 'SCHEDULER_TARGET_LATENCY', 0.2)
+SCHEDULER_CPU_BUDGET = getattr(config, 'SCHEDULER_CPU_BUDGET', 0.75)
+SCHEDULER_MAX_SKIP = getattr(config, 'SCHEDULER_MAX_SKIP', 6)
+SCHEDULER_INTERVAL = getattr(config, 'SCHEDULER_INTERVAL', 2.0)
+ENCODE_BATCHING = getattr(config, 'ENCODE_BATCHING', True)
+ENCODE_MAX_BATCH = getattr(config, 'ENCODE_MAX_BATCH', 16)
+ENCODE_MAX_WAIT = getattr(config, 'ENCODE_MAX_WAIT', 0.01)
+QUALITY_GATE = getattr(config, 'QUALITY_GATE', True)
+MOTION_GATING = getattr(config, 'MOTION_GATING', True)
+
+
+def detect_faces(imgS, model):
+    """Detect faces in a downscaled RGB frame (runs in the worker pool)"""
+    return face_recognition.face_locations(imgS, model=model)
+
+
+def detect_regions(crops, model):
+    """Detect faces in (crop, (top, left)) pieces of a frame; boxes are in frame coordinates"""
+    faces = []
+    for crop, (top, left) in crops:
+        faces.extend((t + top, r + left, b + top, l + left)
+                     for t, r, b, l in face_recognition.face_locations(crop, model=model))
+    return faces
+
+
+def face_landmarks(imgS, faceCurframe, max_yaw=0):
+    """5-point landmarks of the given faces, None for faces turned further than max_yaw"""
+    landmarks = face_api._raw_face_landmarks(imgS, faceCurframe, model="small")
+    return [shape if not max_yaw or abs(face_yaw(shape)) <= max_yaw else None for shape in landmarks]
+
+
+def encode_faces(imgS, faceCurframe, max_yaw=0):
+    """Encode the given faces of a downscaled RGB frame (runs in the worker pool).
+
+    With max_yaw, faces turned further away get None instead of an encoding.
+    """
+    if not max_yaw:
+        return face_recognition.face_encodings(imgS, faceCurframe)
+    # What face_encodings does, with the landmarks it computes anyway used to skip profile faces
+    return [np.array(face_api.face_encoder.compute_face_descriptor(imgS, shape, 1)) if shape is not None else None
+            for shape in face_landmarks(imgS, faceCurframe, max_yaw)]
+
+
+def face_chips(imgS, faceCurframe, max_yaw=0):
+    """Align the given faces to the 150x150 chips the encoder expects (runs in the worker pool)"""
+    # Same size and padding dlib uses inside compute_face_descriptor, so encodings are unchanged
+    return [np.asarray(dlib.get_face_chip(imgS, shape, size=150, padding=0.25)) if shape is not None else None
+            for shape in face_landmarks(imgS, faceCurframe, max_yaw)]
+
+
+def encode_chips(chips):
+    """Encode a batch of aligned chips in one network call (runs in the worker pool)"""
+    return [np.array(d) for d in face_api.face_encoder.compute_face_descriptor(chips)]
+
+
+_scratch = threading.local()
+
+
+def prepare_frame(img, scale):
+    """Downscale img and convert it to RGB in per-thread buffers that are reused across frames.
+
+    The returned array is overwritten by the next call from the same thread.
+    """
+    h, w = img.shape[:2]
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    small = getattr(_scratch, 'small', None)
+    if small is None or small.shape[1::-1] != size:
+        _scratch.small = small = np.empty((size[1], size[0], 3), np.uint8)
+        _scratch.rgb = np.empty_like(small)
+    cv2.resize(img, size, dst=small)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=_scratch.rgb)
+
+
+def warm_up():
+    """No-op submitted once per worker process at start-up so the first frame does not pay for spawning it"""
+    return True
+
+
+def create_batcher(executor=None, workers=1):
+    """Shared cross-frame encoding batcher, or None when batching is disabled.
+
+    With an executor of workers processes, up to workers batches encode at once.
+    """
+    if not ENCODE_BATCHING:
+        return None
+    return EncodingBatcher(encode_chips, max_batch=ENCODE_MAX_BATCH, max_wait=ENCODE_MAX_WAIT,
+                           executor=executor, max_in_flight=workers)
+
+
+class FrameRecognizer:
+    """Detect -> track -> encode -> match for one video stream.
+
+    Each stream owns its tracker and scheduler; the gallery and the worker
+    process pool (executor) are shared between streams. With executor None
+    detection and encoding run inline in the calling thread. With a batcher
+    the faces of this frame are aligned here and encoded together with the
+    faces of other frames and streams. With the quality gate, faces that
+    are too small, blurred, badly exposed or turned away are never encoded
+    and stay unknown until a better frame. With motion gating, detection is
+    skipped on static frames and limited to changed regions and active
+    tracks otherwise. stats holds the latency of the resize, detect, encode
+    and match stages.
+
+    recognize() may be called for several frames of the stream at once
+    (the kiosk's worker pool): the motion gate and scheduler settings, then
+    the tracker update, run one frame at a time in ticket order, and
+    detection and encoding of different frames overlap.
+    """
+
+    STAGES = ('resize', 'detect', 'encode', 'match')
+
+    def __init__(self, gallery, executor=None, workers=1, batcher=None,
+                 tracking=TRACKING_ENABLED, adaptive=ADAPTIVE_SCHEDULING, quality=QUALITY_GATE,
+                 motion=MOTION_GATING):
+        self.gallery = gallery
+        self.quality = QualityGate() if quality else None
+        self.motion = MotionGate() if motion else None
+        self.executor = executor
+        self.batcher = batcher
+        self.stats = {name: StageStats(name) for name in self.STAGES}
+        self.tracker = FaceTracker(iou_threshold=TRACK_IOU_THRESHOLD, max_misses=TRACK_MAX_MISSES,
+                                   reencode_interval=TRACK_REENCODE_INTERVAL,
+                                   confidence_decay=TRACK_CONFIDENCE_DECAY,
+                                   min_confidence=TRACK_MIN_CONFIDENCE) if tracking else None
+        self.scheduler = AdaptiveScheduler(scale=FACE_DETECTION_SCALE, model=FACE_DETECTION_MODEL,
+                                           frame_skip=FRAME_SKIP, max_skip=SCHEDULER_MAX_SKIP,
+                                           target_latency=SCHEDULER_TARGET_LATENCY,
+                                           cpu_budget=SCHEDULER_CPU_BUDGET, workers=workers,
+                                           interval=SCHEDULER_INTERVAL) if adaptive else None
+        self.order = FrameOrder(('prepare', 'track'))
+
+    def ticket(self):
+        """Place of the next frame in this stream's order, for callers recognizing frames concurrently"""
+        return self.order.ticket()
+
+    @property
+    def frame_skip(self):
+        return self.scheduler.frame_skip if self.scheduler is not None else FRAME_SKIP
+
+    def run(self, fn, *args):
+        """Run fn in the worker process pool, or inline when processes are disabled"""
+        if self.executor is not None:
+            return self.executor.submit(fn, *args).result()
+        return fn(*args)
+
+    def encode(self, imgS, faceCurframe):
+        """Encode the given faces, through the shared batcher when there is one.
+
+        Faces the quality gate rejects for their pose get None.
+        """
+        if not faceCurframe:
+            return []
+        max_yaw = self.quality.max_yaw if self.quality is not None else 0
+        with self.stats['encode'].time():
+            if self.batcher is None:
+                encodings = self.run(encode_faces, imgS, faceCurframe, max_yaw)
+            else:
+                chips = self.run(face_chips, imgS, faceCurframe, max_yaw)
+                encoded = iter(self.batcher.encode_many([chip for chip in chips if chip is not None]))
+                encodings = [next(encoded) if chip is not None else None for chip in chips]
+        if self.quality is not None:
+            self.quality.reject('pose', sum(encoding is None for encoding in encodings))
+        return encodings
+
+    def match(self, encodecurframe):
+        """Match encodings; faces that were not encoded (None) come back unknown"""
+        present = [encoding for encoding in encodecurframe if encoding is not None]
+        if not present:
+            return [(None, float('inf'), -1)] * len(encodecurframe)
+        with self.stats['match'].time():
+            results = iter(self.gallery.match(present, MIN_FACE_CONFIDENCE))
+        return [next(results) if encoding is not None else (None, float('inf'), -1) for encoding in encodecurframe]
+
+    def gate(self, img, boxes):
+        """Indices of the boxes worth encoding"""
+        if self.quality is None:
+            return list(range(len(boxes)))
+        return [i for i, box in enumerate(boxes) if self.quality.accept(img, box)]
+
+    def detect(self, imgS, scale, model, regions):
+        """Detect faces in the whole downscaled frame, or only in regions given in frame pixels"""
+        if regions is None:
+            return self.run(detect_faces, imgS, model)
+        crops = []
+        for top, right, bottom, left in regions:
+            top, right, bottom, left = (int(v * scale) for v in (top, right, bottom, left))
+            if bottom > top and right > left:
+                crops.append((imgS[top:bottom, left:right], (top, left)))
+        return self.run(detect_regions, crops, model) if crops else []
+
+    def recognize(self, img, dropped=0, ticket=None):
+        """Return (student_id or None, distance, (top, right, bottom, left)) per face in img.
+
+        dropped is the caller's detection queue drop count, used by the
+        scheduler to notice backlog. ticket is this frame's place from
+        ticket(), closed by the caller; without one the frame is ordered
+        by call.
+        """
+        if ticket is not None:
+            return self._recognize(img, dropped, ticket)
+        ticket = self.ticket()
+        try:
+            return self._recognize(img, dropped, ticket)
+        finally:
+            ticket.close()
+
+    def _recognize(self, img, dropped, ticket):
+        start = time.perf_counter()
+        regions = None
+        with ticket.turn('prepare'):
+            if self.motion is not None:
+                tracked = [t.box for t in self.tracker.tracks] if self.tracker is not None else []
+                regions = self.motion.regions(img, tracked)
+            if self.scheduler is not None:
+                scale, model = self.scheduler.settings()
+            else:
+                scale, model = FACE_DETECTION_SCALE, FACE_DETECTION_MODEL
+        if regions == []:
+            # Nothing moved and nobody is tracked: no faces can have appeared
+            if self.scheduler is not None:
+                self.scheduler.observe(time.perf_counter() - start, 0, dropped)
+            return []
+        with self.stats['resize'].time():
+            imgS = prepare_frame(img, scale)
+        with self.stats['detect'].time():
+            faceCurframe = self.detect(imgS, scale, model, regions)
+        # Scale face locations back to original size by the factor actually used
+        boxes = [tuple(int(round(v / scale)) for v in faceloc) for faceloc in faceCurframe]
+
+        if self.tracker is not None:
+            # Only new, stale or uncertain tracks go through the expensive encoder
+            with ticket.turn('track'):
+                tracks, to_encode = self.tracker.update(boxes)
+            # Rejected faces are not assigned, so their track asks for an encoding again next frame
+            to_encode = [to_encode[i] for i in self.gate(img, [t.box for t in to_encode])]
+            if to_encode:
+                small_boxes = {id(t): faceloc for t, faceloc in zip(tracks, faceCurframe)}
+                encodecurframe = self.encode(imgS, [small_boxes[id(t)] for t in to_encode])
+                for track, encoding, (detected_id, distance, _) in zip(to_encode, encodecurframe,
+                                                                       self.match(encodecurframe)):
+                    if encoding is not None:
+                        self.tracker.assign(track, detected_id, distance, MIN_FACE_CONFIDENCE)
+            matches = [(t.student_id, t.distance) for t in tracks]
+        else:
+            matches = [(None, float('inf'))] * len(boxes)
+            accepted = self.gate(img, boxes)
+            encodecurframe = self.encode(imgS, [faceCurframe[i] for i in accepted])
+            for i, (detected_id, distance, _) in zip(accepted, self.match(encodecurframe)):
+                matches[i] = (detected_id, distance)
+
+        faces = [(detected_id, distance, box) for (detected_id, distance), box in zip(matches, boxes)]
+        if self.scheduler is not None:
+            self.scheduler.observe(time.perf_counter() - start, len(faces), dropped)
+        return faces
+
+    def identify(self, crops):
+        """Return (student_id or None, distance) for pre-cropped BGR face images, one face each"""
+        if not crops:
+            return []
+        rgbs = [cv2.cvtColor(crop, cv2.COLOR_BGR2RGB) for crop in crops]
+        whole = [[(0, rgb.shape[1], rgb.shape[0], 0)] for rgb in rgbs]
+        with self.stats['encode'].time():
+            if self.batcher is not None:
+                chips = [chip for rgb, box in zip(rgbs, whole) for chip in self.run(face_chips, rgb, box)]
+                encodings = self.batcher.encode_many(chips)
+            else:
+                encodings = [enc for rgb, box in zip(rgbs, whole) for enc in self.run(encode_faces, rgb, box)]
+        return [(detected_id, distance) for detected_id, distance, _ in self.match(encodings)]
+
+    def reporters(self, shared=True):
+        """Report callables for the periodic pipeline log line.
+
+        shared=False leaves out the gallery's report, for callers that log
+        what the streams share once.
+        """
+        reporters = [r.report for r in (self.tracker, self.scheduler, self.quality, self.motion) if r is not None]
+        if shared and hasattr(self.gallery, 'report'):
+            reporters.append(self.gallery.report)
+        return reporters
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Detection settings from cheapest to most accurate: (downscale factor, detector model)
+DEFAULT_LEVELS = [
+    (0.2, 'hog'),
+    (0.25, 'hog'),
+    (0.33, 'hog'),
+    (0.25, 'cnn'),
+    (0.33, 'cnn'),
+    (0.5, 'cnn'),
+]
+
+
+class AdaptiveScheduler:
+    """Picks frame skip, downscale factor and detector at runtime.
+
+    Workers call settings() before each frame and observe() after it. Every
+    interval seconds the scheduler compares the recognition latency and the
+    share of worker time spent busy against target_latency and cpu_budget:
+    over budget it first lowers the detection level, then skips more
+    frames; under budget it processes more frames while faces are present
+    and raises detection quality while the scene is idle. A level that blew
+    the budget is not retried for a back-off period that doubles each time
+    it fails again, so the scheduler settles instead of oscillating.
+    """
+
+    def __init__(self, levels=None, scale=0.25, model='cnn', frame_skip=2, min_skip=1, max_skip=6,
+                 target_latency=0.2, cpu_budget=0.75, workers=1, interval=2.0, idle_frames=20):
+        self.levels = list(levels or DEFAULT_LEVELS)
+        if model == 'hog':
+            # Never escalate to the CNN detector when configured for HOG
+            self.levels = [lvl for lvl in self.levels if lvl[1] == 'hog'] or [(scale, model)]
+        self.level = min(range(len(self.levels)),
+                         key=lambda i: (self.levels[i][1] != model, abs(self.levels[i][0] - scale)))
+        self.frame_skip = frame_skip
+        self.min_skip = min_skip
+        self.max_skip = max_skip
+        self.target_latency = target_latency
+        self.cpu_budget = cpu_budget
+        self.workers = max(1, workers)
+        self.interval = interval
+        self.idle_frames = idle_frames
+        self._lock = threading.Lock()
+        self._reset_window(time.monotonic())
+        self._frames_without_faces = 0
+        self._last_dropped = 0
+        self._ceiling = len(self.levels)  # levels at or above this are backed off
+        self._ceiling_until = 0.0
+        self._backoff = 30.0
+        self._failed_level = None
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._busy = 0.0
+        self._samples = 0
+        self._latency_ema = None
+
+    def settings(self):
+        """Return (scale, model) to use for the next frame"""
+        with self._lock:
+            return self.levels[self.level]
+
+    def observe(self, latency, faces, dropped=0):
+        """Record one processed frame; dropped is the detection queue's total drop count"""
+        with self._lock:
+            now = time.monotonic()
+            self._busy += latency
+            self._samples += 1
+            self._latency_ema = latency if self._latency_ema is None else 0.8 * self._latency_ema + 0.2 * latency
+            self._frames_without_faces = 0 if faces else self._frames_without_faces + 1
+            if now - self._window_start >= self.interval and self._samples >= 3:
+                self._adjust(now, dropped)
+
+    def _adjust(self, now, dropped):
+        busy_share = self._busy / ((now - self._window_start) * self.workers)
+        backlog = dropped > self._last_dropped
+        self._last_dropped = dropped
+        latency = self._latency_ema
+        idle = self._frames_without_faces >= self.idle_frames
+        before = (self.level, self.frame_skip)
+
+        if now >= self._ceiling_until:
+            self._ceiling = len(self.levels)
+
+        if latency > self.target_latency and self.level > 0:
+            self._backoff = self._backoff * 2 if self._failed_level == self.level else 30.0
+            self._failed_level = self._ceiling = self.level
+            self._ceiling_until = now + min(self._backoff, 600.0)
+            self.level -= 1
+        elif (busy_share > self.cpu_budget or backlog) and self.frame_skip < self.max_skip:
+            self.frame_skip += 1
+        elif latency < 0.6 * self.target_latency and busy_share < 0.6 * self.cpu_budget and not backlog:
+            if idle and self.level + 1 < min(self._ceiling, len(self.levels)):
+                self.level += 1
+            elif self.frame_skip > self.min_skip and \
+                    busy_share * self.frame_skip / (self.frame_skip - 1) < self.cpu_budget:
+                # Only process more frames when the predicted load still fits the budget
+                self.frame_skip -= 1
+
+        if (self.level, self.frame_skip) != before:
+            scale, model = self.levels[self.level]
+            logger.info(f"Scheduler: latency {latency * 1000:.0f}ms, busy {busy_share:.0%}"
+                        f"{', idle' if idle else ''}{', backlog' if backlog else ''} -> "
+                        f"scale {scale}, model {model}, frame skip {self.frame_skip}")
+        self._reset_window(now)
+
+    def report(self):
+        scale, model = self.levels[self.level]
+        return f"detect scale={scale} model={model} skip={self.frame_skip}"
@@ -0,0 +1,439 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import multiprocessing
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from backend import open_backend
+from metrics import REGISTRY, start_monitoring
+from gallery import load_gallery
+from pipeline import StageStats
+from services import BackendServices
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for server settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+SERVER_HOST = getattr(config, 'SERVER_HOST', '127.0.0.1')
+SERVER_TOKEN = getattr(config, 'SERVER_TOKEN', '')
+SERVER_PORT = getattr(config, 'SERVER_PORT', 8765)
+SERVER_WORKERS = getattr(config, 'SERVER_WORKERS', 4)
+SERVER_USE_PROCESSES = getattr(config, 'SERVER_USE_PROCESSES', True)
+SERVER_MAX_BODY = getattr(config, 'SERVER_MAX_BODY', 8 * 1024 * 1024)
+SERVER_MAX_HEADERS = getattr(config, 'SERVER_MAX_HEADERS', 100)
+SERVER_CAMERA_IDLE = getattr(config, 'SERVER_CAMERA_IDLE', 300)
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 431: 'Request Header Fields Too Large', 500: 'Internal Server Error'}
+# Served without the token, for load balancer and orchestrator probes
+PUBLIC_PATHS = ('/health',)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=''):
+        super().__init__(message or STATUS_TEXT.get(status, ''))
+        self.status = status
+
+
+def decode_image(data):
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise HTTPError(400, "Body is not a decodable image")
+    return img
+
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == 'localhost'
+
+
+def face_json(detected_id, distance, box=None):
+    face = {'id': detected_id, 'distance': round(float(distance), 4) if distance is not None else None}
+    if box is not None:
+        face['box'] = [int(v) for v in box]  # top, right, bottom, left in frame pixels
+    return face
+
+
+class Camera:
+    """Recognition state of one client camera; frames of a camera are processed in order"""
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class RecognitionServer:
+    """Headless recognition service for many thin camera clients.
+
+    An asyncio server accepts JPEG frames (POST /recognize, or binary
+    messages on the /ws WebSocket) and pre-cropped face images (POST
+    /faces), and answers with identities and boxes as JSON. CPU work runs
+    on a fixed thread pool that drives the shared detection process pool
+    and encoding batcher, so faces from all cameras are batched together.
+    Every camera id gets its own tracker and scheduler. Recognized
+    students are recorded by the shared backend services, and their
+    profiles and photos are served at /students/<id> and
+    /students/<id>/photo for the clients' cards. With a token, every path
+    but /health needs it as a bearer token (or ?token= for WebSockets).
+    new_recognizer() makes the recognizer of a new camera, a
+    FrameRecognizer over the gallery unless given.
+    """
+
+    def __init__(self, gallery, services, executor=None, batcher=None, workers=4, token=SERVER_TOKEN,
+                 new_recognizer=None):
+        self.gallery = gallery
+        self.new_recognizer = new_recognizer or self._frame_recognizer
+        self.services = services
+        self.token = token
+        self.executor = executor
+        self.batcher = batcher
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognize')
+        self.cameras = {}
+        self.stats = StageStats('server-request')
+        self.requests = 0
+        self.frames_dropped = 0
+        REGISTRY.gauge('face_server_cameras', 'Cameras with recognition state', fn=lambda: len(self.cameras))
+        REGISTRY.counter('face_server_requests_total', 'Recognition requests served', fn=lambda: self.requests)
+        REGISTRY.counter('face_frames_dropped_total', 'Frames dropped by a full queue', {'queue': 'websocket'},
+                         fn=lambda: self.frames_dropped)
+
+    def _frame_recognizer(self):
+        # dlib is only imported once a camera connects
+        from recognition import FrameRecognizer
+        return FrameRecognizer(self.gallery, self.executor, batcher=self.batcher)
+
+    def camera(self, camera_id):
+        camera = self.cameras.get(camera_id)
+        if camera is None:
+            camera = Camera(self.new_recognizer())
+            self.cameras[camera_id] = camera
+            logger.info(f"New camera {camera_id} ({len(self.cameras)} active)")
+        camera.last_used = time.monotonic()
+        return camera
+
+    def expire_cameras(self):
+        cutoff = time.monotonic() - SERVER_CAMERA_IDLE
+        for camera_id in [c for c, cam in self.cameras.items() if cam.last_used < cutoff and not cam.lock.locked()]:
+            del self.cameras[camera_id]
+            logger.info(f"Dropped idle camera {camera_id}")
+
+    # Recognition
+
+    async def recognize(self, camera_id, data):
+        camera = self.camera(camera_id)
+        async with camera.lock:
+            start = time.perf_counter()
+            img = decode_image(data)
+            faces = await asyncio.get_running_loop().run_in_executor(self.pool, camera.recognizer.recognize, img)
+            self.stats.record(time.perf_counter() - start)
+        self.requests += 1
+        for detected_id, distance, _ in faces:
+            if detected_id is not None:
+                self.services.submit(detected_id, camera_id, distance)
+        return {'faces': [face_json(*face) for face in faces],
+                'frame_skip': camera.recognizer.frame_skip,
+                'latency_ms': round(1000 * (time.perf_counter() - start), 2)}
+
+    async def identify(self, camera_id, data):
+        camera = self.camera(camera_id)
+        start = time.perf_counter()
+        crop = decode_image(data)
+        matches = await asyncio.get_running_loop().run_in_executor(self.pool, camera.recognizer.identify, [crop])
+        self.stats.record(time.perf_counter() - start)
+        self.requests += 1
+        for detected_id, distance in matches:
+            if detected_id is not None:
+                self.services.submit(detected_id, camera_id, distance)
+        return {'faces': [face_json(*match) for match in matches],
+                'latency_ms': round(1000 * (time.perf_counter() - start), 2)}
+
+    async def student(self, student_id, photo=False):
+        loop = asyncio.get_running_loop()
+        if photo:
+            img = await loop.run_in_executor(self.pool, self.services.profile_cache.get_photo, student_id)
+            if img is None:
+                raise HTTPError(404, f"No photo for {student_id}")
+            return 'image/jpeg', cv2.imencode('.jpg', img)[1].tobytes()
+        info = await loop.run_in_executor(self.pool, self.services.profile_cache.get_profile, student_id)
+        if info is None:
+            raise HTTPError(404, f"No student {student_id}")
+        return 'application/json', json.dumps(info).encode()
+
+    # HTTP
+
+    def authorized(self, path, headers, query):
+        if not self.token or path in PUBLIC_PATHS:
+            return True
+        auth = headers.get('authorization', '')
+        given = auth[7:] if auth.lower().startswith('bearer ') else query.get('token', '')
+        return hmac.compare_digest(given.encode(), self.token.encode())
+
+    @staticmethod
+    async def _respond(writer, status, content_type, payload, keep_alive=True):
+        writer.write((f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                      f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode() + payload)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, 'application/json',
+                                        json.dumps({'error': "Malformed request line"}).encode(), keep_alive=False)
+                    break
+                headers = {}
+                lines = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    lines += 1
+                    if lines > SERVER_MAX_HEADERS:
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if lines > SERVER_MAX_HEADERS:
+                    # The rest of the headers is never read, so the connection ends here
+                    await self._respond(writer, 431, 'application/json',
+                                        json.dumps({'error': STATUS_TEXT[431]}).encode(), keep_alive=False)
+                    break
+                url = urlsplit(target)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                authorized = self.authorized(url.path, headers, query)
+
+                if (authorized and headers.get('upgrade', '').lower() == 'websocket' and url.path == '/ws'
+                        and 'sec-websocket-key' in headers):
+                    await self.websocket(reader, writer, headers, query.get('camera', 'default'))
+                    break
+
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    # The body cannot be skipped, so the connection ends here
+                    await self._respond(writer, 400, 'application/json',
+                                        json.dumps({'error': "Invalid Content-Length"}).encode(), keep_alive=False)
+                    break
+                try:
+                    if not authorized:
+                        raise HTTPError(401)
+                    if length > SERVER_MAX_BODY:
+                        raise HTTPError(413)
+                    body = await reader.readexactly(length) if length else b''
+                    content_type, payload = await self.route(method, url.path, query, body)
+                    status = 200
+                except HTTPError as e:
+                    status, content_type = e.status, 'application/json'
+                    payload = json.dumps({'error': str(e)}).encode()
+                except asyncio.IncompleteReadError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Request {method} {url.path} failed: {e}")
+                    status, content_type = 500, 'application/json'
+                    payload = json.dumps({'error': STATUS_TEXT[500]}).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive or status in (401, 413):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Connection handler failed: {e}")
+        finally:
+            writer.close()
+
+    async def route(self, method, path, query, body):
+        camera_id = query.get('camera', 'default')
+        if path == '/recognize' and method == 'POST':
+            return 'application/json', json.dumps(await self.recognize(camera_id, body)).encode()
+        if path == '/faces' and method == 'POST':
+            return 'application/json', json.dumps(await self.identify(camera_id, body)).encode()
+        if path.startswith('/students/') and method == 'GET':
+            parts = path.split('/')
+            return await self.student(parts[2], photo=len(parts) > 3 and parts[3] == 'photo')
+        if path == '/metrics' and method == 'GET':
+            return 'text/plain; version=0.0.4', REGISTRY.expose().encode()
+        if path == '/health' and method == 'GET':
+            return 'application/json', json.dumps({'status': 'ok', 'cameras': len(self.cameras),
+                                                   'gallery': len(self.gallery)}).encode()
+        if path in ('/recognize', '/faces', '/metrics', '/health'):
+            raise HTTPError(405)
+        raise HTTPError(404)
+
+    # WebSocket (RFC 6455): binary messages are JPEG frames, replies are JSON text messages
+
+    async def websocket(self, reader, writer, headers, camera_id):
+        accept = base64.b64encode(hashlib.sha1(headers['sec-websocket-key'].encode() + WEBSOCKET_GUID).digest())
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        await writer.drain()
+
+        # Only the newest frame waits; a client sending faster than we recognize loses the older ones
+        latest = []
+        ready = asyncio.Event()
+        closed = asyncio.Event()
+
+        async def process():
+            while not closed.is_set():
+                await ready.wait()
+                ready.clear()
+                if not latest:
+                    continue
+                seq, data = latest.pop()
+                try:
+                    result = await self.recognize(camera_id, data)
+                except HTTPError as e:
+                    result = {'error': str(e)}
+                except Exception as e:
+                    # Report the failed frame and keep the socket open for the next one
+                    logger.error(f"WebSocket frame {seq} from {camera_id} failed: {e}")
+                    result = {'error': STATUS_TEXT[500]}
+                result['seq'] = seq
+                self._send_frame(writer, 0x1, json.dumps(result).encode())
+                await writer.drain()
+
+        worker = asyncio.ensure_future(process())
+        seq = 0
+        try:
+            while True:
+                opcode, payload = await self._read_message(reader, writer)
+                if opcode == 0x8:
+                    self._send_frame(writer, 0x8, payload[:2])
+                    break
+                if opcode == 0x2:
+                    seq += 1
+                    if latest:
+                        self.frames_dropped += 1
+                        latest.clear()
+                    latest.append((seq, payload))
+                    ready.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            closed.set()
+            ready.set()
+            worker.cancel()
+
+    async def _read_message(self, reader, writer):
+        """Read one (possibly fragmented) client message; returns (opcode, payload).
+
+        Pings, which may arrive between the fragments of a message, are
+        answered here and pongs ignored. The whole message, not only each
+        frame, is limited to SERVER_MAX_BODY.
+        """
+        fragments, size, opcode = [], 0, None
+        while True:
+            head = await reader.readexactly(2)
+            fin, frame_opcode = head[0] & 0x80, head[0] & 0x0F
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack('>H', await reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack('>Q', await reader.readexactly(8))[0]
+            if size + length > SERVER_MAX_BODY:
+                raise ConnectionError("WebSocket message too large")
+            mask = await reader.readexactly(4) if head[1] & 0x80 else None
+            payload = await reader.readexactly(length)
+            if mask is not None:
+                payload = (np.frombuffer(payload, np.uint8) ^ np.resize(np.frombuffer(mask, np.uint8), length)).tobytes()
+            if frame_opcode == 0x8:
+                return frame_opcode, payload
+            if frame_opcode == 0x9:
+                self._send_frame(writer, 0xA, payload)
+            if frame_opcode >= 0x8:
+                continue  # control frames are never fragmented
+            opcode = opcode if frame_opcode == 0 else frame_opcode
+            fragments.append(payload)
+            size += length
+            if fin:
+                return opcode, b''.join(fragments)
+
+    @staticmethod
+    def _send_frame(writer, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            head = struct.pack('>BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            head = struct.pack('>BBH', 0x80 | opcode, 126, length)
+        else:
+            head = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+        writer.write(head + payload)
+
+    async def serve(self, host, port, stop_event=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Recognition server listening on {host}:{port} ({len(self.gallery)} encodings)")
+        async with server:
+            while stop_event is None or not stop_event.is_set():
+                await asyncio.sleep(1.0)
+                self.expire_cameras()
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    logging.basicConfig(level=config.get_log_level() if config else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s')
+    if not is_loopback(SERVER_HOST) and not SERVER_TOKEN:
+        # Profiles, photos and attendance would be open to anyone on the network
+        logger.error(f"SERVER_HOST {SERVER_HOST} is reachable from other machines; set SERVER_TOKEN first")
+        return
+    backend = open_backend()
+    if backend is None:
+        return
+
+    gallery = load_gallery()
+    if gallery is None:
+        return
+
+    from recognition import create_batcher
+    stop_monitoring = start_monitoring()
+    services = BackendServices(backend)
+    services.start()
+    # Backend and monitoring threads are already running; spawn avoids forking them
+    executor = None
+    if SERVER_USE_PROCESSES:
+        executor = ProcessPoolExecutor(SERVER_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    batcher = create_batcher(executor, SERVER_WORKERS)
+    server = RecognitionServer(gallery, services, executor, batcher, workers=SERVER_WORKERS)
+    try:
+        asyncio.run(server.serve(SERVER_HOST, SERVER_PORT))
+    except KeyboardInterrupt:
+        logger.info("Server interrupted by user")
+    finally:
+        server.close()
+        if batcher is not None:
+            batcher.close()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        services.close()
+        stop_monitoring()
+        logger.info("Recognition server closed")
+
+
+if __name__ == "__main__":
+    main()
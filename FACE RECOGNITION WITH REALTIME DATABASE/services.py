@@ -0,0 +1,111 @@
+import threading
+import logging
+
+from profile_cache import ProfileCache
+from attendance import AttendanceQueue
+from backend_pool import BackendPool
+from pipeline import StageStats
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for backend settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+PROFILE_CACHE_DIR = getattr(config, 'PROFILE_CACHE_DIR', 'profile_cache')
+PROFILE_CACHE_SIZE = getattr(config, 'PROFILE_CACHE_SIZE', 5000)
+PHOTO_CACHE_SIZE = getattr(config, 'PHOTO_CACHE_SIZE', 500)
+PROFILE_CACHE_TTL = getattr(config, 'PROFILE_CACHE_TTL', 3600)
+ATTENDANCE_COOLDOWN = getattr(config, 'ATTENDANCE_COOLDOWN', 300)
+ATTENDANCE_JOURNAL = getattr(config, 'ATTENDANCE_JOURNAL', 'attendance_journal.jsonl')
+ATTENDANCE_LEDGER = getattr(config, 'ATTENDANCE_LEDGER', 'attendance.db')
+ATTENDANCE_LATE_AFTER = getattr(config, 'ATTENDANCE_LATE_AFTER', 60)
+ATTENDANCE_BATCH_SIZE = getattr(config, 'ATTENDANCE_BATCH_SIZE', 50)
+ATTENDANCE_FLUSH_INTERVAL = getattr(config, 'ATTENDANCE_FLUSH_INTERVAL', 2.0)
+BACKEND_WORKERS = getattr(config, 'BACKEND_WORKERS', 4)
+BACKEND_MAX_PENDING = getattr(config, 'BACKEND_MAX_PENDING', 64)
+
+
+class BackendServices:
+    """Profile cache, attendance queue and backend pool over one backend client.
+
+    One instance serves every camera stream of the process. backend is a
+    FirebaseBackend or LocalBackend from backend.py (see open_backend);
+    the benchmark and load generator pass a local stand-in together with
+    their own cache_dir and ledger_path. close() also closes the backend.
+    """
+
+    def __init__(self, backend, cache_dir=PROFILE_CACHE_DIR, ledger_path=ATTENDANCE_LEDGER,
+                 journal_path=ATTENDANCE_JOURNAL):
+        self.backend = backend
+        root_ref = backend.reference()
+        self.profile_cache = ProfileCache(root_ref.child('Students'), backend.bucket, cache_dir=cache_dir,
+                                          max_profiles=PROFILE_CACHE_SIZE, max_photos=PHOTO_CACHE_SIZE,
+                                          ttl=PROFILE_CACHE_TTL)
+        self.attendance = AttendanceQueue(root_ref, cooldown=ATTENDANCE_COOLDOWN, ledger_path=ledger_path,
+                                          journal_path=journal_path, batch_size=ATTENDANCE_BATCH_SIZE,
+                                          flush_interval=ATTENDANCE_FLUSH_INTERVAL,
+                                          late_after=ATTENDANCE_LATE_AFTER, on_recorded=self._show_attendance)
+        self.pool = BackendPool(workers=BACKEND_WORKERS, max_pending=BACKEND_MAX_PENDING)
+        self.stats = StageStats('backend')
+
+    def start(self):
+        # Preload the roster and photos in the background and keep them current from the change feed
+        self.profile_cache.start_listener()
+        threading.Thread(target=self.profile_cache.preload, daemon=True).start()
+        self.attendance.start()
+
+    def _show_attendance(self, student_id, event):
+        """Reflect a queued attendance event on the cached profile before it is flushed"""
+        info = self.profile_cache.get_profile(student_id) or {}
+        self.profile_cache.update_profile(student_id, {'total_attendance': info.get('total_attendance', 0) + 1,
+                                                       'Last_attendance_time': event['time']})
+
+    def process(self, student_id, stream=None, distance=None):
+        """Load a recognized student's profile and record attendance (runs in the backend pool)"""
+        with self.stats.time():
+            return self._process(student_id, stream, distance)
+
+    def _process(self, student_id, stream=None, distance=None):
+        try:
+            # Profile and photo are served from the local cache; Firebase is only hit on a miss
+            student_info = self.profile_cache.get_profile(student_id)
+            if not student_info:
+                logger.warning(f"No data found for student ID: {student_id}")
+                return None, None
+
+            img_student = self.profile_cache.get_photo(student_id)
+            if img_student is None:
+                logger.warning(f"No image found for student ID: {student_id}")
+
+            # Cooldown is checked locally; the write is batched in the background
+            self.attendance.record(student_id, student_info, stream=stream, distance=distance)
+
+            return student_info, img_student
+
+        except Exception as e:
+            logger.error(f"Firebase operation failed: {e}")
+            return None, None
+
+    def submit(self, student_id, stream=None, distance=None):
+        """Queue a lookup for a recognized student; concurrent lookups of one id are coalesced.
+
+        stream and distance (which camera saw the student, how close the
+        match was) are recorded with the attendance event.
+        """
+        future = self.pool.submit(student_id, self.process, student_id, stream, distance)
+        if future is None:
+            logger.warning(f"Backend queue full, retrying student {student_id} on a later frame")
+        return future
+
+    def reporters(self):
+        return [self.attendance.report, self.pool.report]
+
+    def close(self):
+        self.pool.shutdown()
+        self.attendance.stop()
+        self.backend.close()
+        self.profile_cache.close()
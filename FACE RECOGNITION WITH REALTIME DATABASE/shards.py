@@ -0,0 +1,300 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from embedding_store import HEADER, EmbeddingStore
+from matcher import GalleryMatcher
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for sharding settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+MATCHER_SHARD_REFRESH = getattr(config, 'MATCHER_SHARD_REFRESH', 5.0)
+
+# Shard workers are started from background threads; spawn avoids forking a threaded process
+_context = multiprocessing.get_context('spawn')
+
+
+def _serve(conn, path, start, stop, index):
+    """Shard worker: build an index over rows [start, stop) of the mapped store and answer searches.
+
+    Requests are (request id, queries, k); each reply carries the id of its request.
+    """
+    try:
+        store = EmbeddingStore(path)
+        # Views into the mapped file: every shard reads the same page-cache pages, nothing is copied
+        matcher = GalleryMatcher(store.embeddings[start:stop], range(stop - start),
+                                 sq_norms=store.sq_norms[start:stop], **index)
+        conn.send(matcher.index_bytes)
+    except Exception as e:
+        conn.send(e)
+        return
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        request_id, queries, k = request
+        try:
+            dists, rows = matcher.search(queries, k)
+            conn.send((request_id, (dists, np.where(rows >= 0, rows + start, -1))))
+        except Exception as e:
+            conn.send((request_id, e))
+    conn.close()
+
+
+def _store_state(path):
+    """(file identity, record count) of a store, read from its header only"""
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        count = HEADER.unpack(f.read(HEADER.size))[3]
+    return (st.st_dev, st.st_ino), count
+
+
+class _Shard:
+    """One worker process serving a contiguous row range of the store.
+
+    Any number of threads may have searches outstanding on the shard at
+    once: submit() tags each request with an id and returns a Future, and
+    a receiver thread resolves the Futures as the worker's replies arrive.
+    """
+
+    def __init__(self, path, start, stop, index):
+        self.start = start
+        self.stop = stop
+        self.index_bytes = 0
+        self._pending = {}  # request id -> Future
+        self._ids = itertools.count()
+        self._send_lock = threading.Lock()
+        self._receiver = None
+        self._conn, child = _context.Pipe()
+        self._process = _context.Process(target=_serve, args=(child, path, start, stop, index),
+                                         name=f'shard-{start}-{stop}', daemon=True)
+        self._process.start()
+        child.close()
+
+    @property
+    def alive(self):
+        return self._process.is_alive()
+
+    def wait_ready(self):
+        try:
+            reply = self._conn.recv()
+        except EOFError:
+            raise RuntimeError(f"Shard worker for rows {self.start}-{self.stop} exited")
+        if isinstance(reply, Exception):
+            raise reply
+        self.index_bytes = reply
+        self._receiver = threading.Thread(target=self._receive_loop, name=f'shard-{self.start}-replies',
+                                          daemon=True)
+        self._receiver.start()
+        return self
+
+    def _receive_loop(self):
+        while True:
+            try:
+                request_id, reply = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if isinstance(reply, Exception):
+                future.set_exception(reply)
+            else:
+                future.set_result(reply)
+        with self._send_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(f"Shard worker for rows {self.start}-{self.stop} exited"))
+
+    def submit(self, queries, k):
+        """Send a search to the worker; returns a Future of its (distances, rows)"""
+        future = Future()
+        with self._send_lock:
+            if self._receiver is None or not self._receiver.is_alive():
+                raise RuntimeError(f"Shard worker for rows {self.start}-{self.stop} is gone")
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self._conn.send((request_id, queries, k))
+            except OSError as e:
+                del self._pending[request_id]
+                raise RuntimeError(f"Shard worker for rows {self.start}-{self.stop} is gone: {e}")
+        return future
+
+    def close(self):
+        """Stop the worker once it has answered the searches already sent"""
+        try:
+            with self._send_lock:
+                self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=5.0)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout=1.0)
+        if self._receiver is not None:
+            self._receiver.join(timeout=1.0)
+        self._conn.close()
+
+
+class ShardedMatcher:
+    """Gallery search split across worker processes, for rosters too large for one core.
+
+    The memory-mapped EmbeddingStore is cut into contiguous row ranges and
+    each range is served by its own process, which maps the same file, so
+    the gallery sits in the page cache once however many shards there are.
+    A search sends the frame's faces to every shard at once and merges the
+    per-shard top-k, so latency follows the shard size rather than the
+    roster size; more students just need more shards (and cores).
+
+    A background thread checks the store every refresh seconds. Rows
+    appended by encoding.py fill up the last shard and then start new ones;
+    a rewritten store, or a shard whose worker died, is rebuilt. Replacement
+    shards are built while the old ones keep serving and are swapped in
+    once ready. Each shard uses the configured index and quantization, and
+    rows are prototypes, so a student with several encodings matches on the
+    nearest one.
+    """
+
+    def __init__(self, path, shards, index=None, refresh=MATCHER_SHARD_REFRESH):
+        self.path = path
+        self.shard_count = max(1, int(shards))
+        self.index = dict(index or {})
+        self.refresh = refresh
+        self.ids = []
+        self.dim = 0
+        self.shard_rows = 0
+        self._file = None
+        self._shards = []
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._rebuild()
+        REGISTRY.gauge('face_matcher_shards', 'Gallery shard worker processes', fn=lambda: len(self._shards))
+        REGISTRY.gauge('face_gallery_size', 'Encodings in the gallery', fn=lambda: len(self.ids))
+        if refresh:
+            threading.Thread(target=self._watch, name='shard-refresh', daemon=True).start()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def index_bytes(self):
+        return sum(shard.index_bytes for shard in self._shards)
+
+    def _ranges(self, start, stop):
+        if start >= stop:
+            return []
+        return [(s, min(s + self.shard_rows, stop)) for s in range(start, stop, self.shard_rows)]
+
+    def _start(self, ranges):
+        """Start shard workers for row ranges and wait until all have built their index"""
+        shards = [_Shard(self.path, start, stop, self.index) for start, stop in ranges]
+        try:
+            return [shard.wait_ready() for shard in shards]
+        except Exception:
+            for shard in shards:
+                shard.close()
+            raise
+
+    def _swap(self, shards, keep, store, file):
+        with self._lock:
+            old = [shard for shard in self._shards if shard not in keep]
+            self._shards = list(keep) + shards
+            self.ids = store.ids
+            self.dim = store.dim
+            self._file = file
+        for shard in old:
+            shard.close()
+        logger.info(f"Sharded gallery: {len(self.ids)} encodings in {len(self._shards)} shard(s) "
+                     f"of up to {self.shard_rows} rows")
+
+    def _rebuild(self):
+        """Split the whole store into shard_count shards"""
+        file, _ = _store_state(self.path)
+        store = EmbeddingStore(self.path)
+        self.shard_rows = -(-len(store) // self.shard_count)
+        self._swap(self._start(self._ranges(0, len(store))), [], store, file)
+
+    def reload(self):
+        """Pick up changes to the store: appended rows, a rewritten file or dead workers"""
+        with self._reload_lock:
+            file, count = _store_state(self.path)
+            if file != self._file or count < len(self.ids) or (count and not self._shards):
+                logger.info(f"{self.path} was rewritten, rebuilding all shards")
+                self._rebuild()
+            elif count > len(self.ids):
+                keep = list(self._shards)
+                start = len(self.ids)
+                if keep and keep[-1].stop - keep[-1].start < self.shard_rows:
+                    start = keep.pop().start  # the last shard has room: rebuild it with the new rows
+                store = EmbeddingStore(self.path)
+                self._swap(self._start(self._ranges(start, len(store))), keep, store, file)
+            else:
+                dead = [shard for shard in self._shards if not shard.alive]
+                if dead:
+                    logger.warning(f"Restarting {len(dead)} dead shard worker(s)")
+                    keep = [shard for shard in self._shards if shard.alive]
+                    store = EmbeddingStore(self.path)
+                    shards = self._start([(shard.start, shard.stop) for shard in dead])
+                    self._swap(shards, keep, store, file)
+
+    def _watch(self):
+        while not self._stop.wait(self.refresh):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Failed to refresh sharded gallery: {e}")
+
+    def search(self, queries, k=1):
+        """Return (distances, row indices) of the k nearest gallery rows per query, merged over all shards"""
+        queries = np.ascontiguousarray(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        n = len(queries)
+        # Only the shard list is read under the lock; searches of concurrent callers overlap
+        with self._lock:
+            shards = list(self._shards)
+        if n == 0 or not shards:
+            return np.empty((n, 0), np.float32), np.empty((n, 0), np.int64)
+        futures, error = [], None
+        for shard in shards:
+            try:
+                futures.append(shard.submit(queries, k))
+            except Exception as e:
+                error = error or e
+        replies = []
+        for future in futures:
+            try:
+                replies.append(future.result())
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        dists = np.concatenate([d for d, _ in replies], axis=1)
+        rows = np.concatenate([r for _, r in replies], axis=1)
+        dists = np.where(rows >= 0, dists, np.inf)
+        top = np.argsort(dists, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(dists, top, axis=1), np.take_along_axis(rows, top, axis=1)
+
+    match = GalleryMatcher.match
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            shards, self._shards = self._shards, []
+        for shard in shards:
+            shard.close()
@@ -0,0 +1,199 @@
+import importlib
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# Try to import config for startup settings
+try:
+    import config
+except ImportError:
+    config = None
+
+# Configuration with fallbacks
+STARTUP_SNAPSHOT = getattr(config, 'STARTUP_SNAPSHOT', 'warm_start.pkl')
+
+SNAPSHOT_VERSION = 2
+BACKGROUND_FILE = 'Resources/background.png'
+MODE_DIR = 'Resources/Modes'
+
+
+def _mode_order(name):
+    stem = os.path.splitext(name)[0]
+    return (0, int(stem), name) if stem.isdigit() else (1, 0, name)
+
+
+def mode_paths():
+    """Mode images in display order (0.png, 1.png, ..., 10.png)"""
+    try:
+        return [os.path.join(MODE_DIR, name) for name in sorted(os.listdir(MODE_DIR), key=_mode_order)]
+    except OSError as e:
+        logger.error(f"Failed to list mode images: {e}")
+        return []
+
+
+def load_assets():
+    """Decode the background and mode images; returns (background or None, [mode images])"""
+    modes = []
+    for path in mode_paths():
+        img = cv2.imread(path)
+        if img is not None:
+            modes.append(img)
+        else:
+            logger.warning(f"Failed to load image: {path}")
+    background = cv2.imread(BACKGROUND_FILE)
+    if background is None:
+        logger.error("Failed to load background image")
+    logger.info(f"Loaded {len(modes)} mode images")
+    return background, modes
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+        return path, st.st_mtime_ns, st.st_size
+    except OSError:
+        return path, None, None
+
+
+def snapshot_keys(with_gallery):
+    """Identifies the files and settings each part of a snapshot was built from"""
+    keys = {'assets': (SNAPSHOT_VERSION, tuple(_stamp(path) for path in [BACKGROUND_FILE] + mode_paths()))}
+    if with_gallery:
+        from gallery import MATCHER_SETTINGS, SOURCE_FILES
+        keys['index'] = (SNAPSHOT_VERSION, tuple(_stamp(path) for path in SOURCE_FILES), MATCHER_SETTINGS)
+    return keys
+
+
+def load_snapshot(path):
+    """The snapshot's parts as {name: (key, value)}, empty without a readable snapshot"""
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable warm-start snapshot {path}: {e}")
+        return {}
+    return snapshot if isinstance(snapshot, dict) else {}
+
+
+def save_snapshot(path, parts):
+    """Write the snapshot atomically so a crash mid-write never leaves a broken one"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(parts, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+class Startup:
+    """Loads what the kiosk needs in the background while the camera is already showing.
+
+    Assets (background and mode images), the recognizer and the backend
+    services load concurrently; poll() hands each one over as it becomes
+    ready so the render loop can start with the first camera frame. With
+    a gallery, the recognition module (and the dlib models it loads) is
+    imported in parallel with loading the gallery, and make_recognizer is
+    called with the gallery once both are done.
+
+    The decoded assets and the trained index structures (IVF cells, not the
+    encodings, which stay memory-mapped from the embedding store) are
+    pickled into a warm-start snapshot. Each part is keyed on the files it
+    came from and reused on its own, so a restart skips decoding and k-means
+    and a new enrollment does not invalidate the assets.
+    """
+
+    def __init__(self, make_recognizer, make_services, gallery=True, snapshot_path=STARTUP_SNAPSHOT):
+        self.snapshot_path = snapshot_path
+        self._start = time.perf_counter()
+        # One thread per task: several tasks block on the results of others, which must not wait behind them
+        tasks = 3 + (2 if gallery else 0) + (2 if snapshot_path else 0)
+        self._pool = ThreadPoolExecutor(max_workers=tasks, thread_name_prefix='startup')
+        self._keys = snapshot_keys(gallery)
+        self._reused = set()
+        snapshot = self._pool.submit(load_snapshot, snapshot_path) if snapshot_path else None
+        models = self._pool.submit(importlib.import_module, 'recognition') if gallery else None
+        self._assets_future = self._pool.submit(self._timed, 'Assets', self._assets, snapshot)
+        self._pending = {
+            'services': self._pool.submit(self._timed, 'Backend', make_services),
+            'assets': self._assets_future,
+        }
+        self._gallery = self._pool.submit(self._timed, 'Gallery', self._load_gallery, snapshot) if gallery else None
+        self._pending['recognizer'] = self._pool.submit(self._timed, 'Recognizer', self._recognizer,
+                                                        make_recognizer, models)
+        if snapshot is not None:
+            self._pool.submit(self._save, snapshot)
+
+    @property
+    def ready(self):
+        return not self._pending
+
+    def _timed(self, name, fn, *args):
+        result = fn(*args)
+        logger.info(f"{name} ready {1000 * (time.perf_counter() - self._start):.0f}ms after start")
+        return result
+
+    def _cached(self, snapshot, name):
+        """The snapshot's value for name if it was built from the current files, else None"""
+        parts = snapshot.result() if snapshot is not None else {}
+        if name not in parts:
+            return None
+        key, value = parts[name]
+        if key != self._keys[name]:
+            logger.info(f"Warm-start {name} out of date, rebuilding")
+            return None
+        self._reused.add(name)
+        return value
+
+    def _assets(self, snapshot):
+        cached = self._cached(snapshot, 'assets')
+        if cached is not None:
+            return cached
+        return load_assets()
+
+    def _load_gallery(self, snapshot):
+        from gallery import load_gallery
+        return load_gallery(self._cached(snapshot, 'index'))
+
+    def _recognizer(self, make_recognizer, models):
+        if models is not None:
+            models.result()
+        gallery = self._gallery.result() if self._gallery is not None else None
+        if self._gallery is not None and gallery is None:
+            raise RuntimeError("No gallery to recognize against")
+        return make_recognizer(gallery)
+
+    def _save(self, snapshot):
+        """Rewrite the snapshot once every part is loaded, if any part was built from the source files"""
+        background, modes = self._assets_future.result()
+        gallery = self._gallery.result() if self._gallery is not None else None
+        if background is None or not modes or (self._gallery is not None and gallery is None):
+            return
+        if self._reused == set(self._keys):
+            return
+        parts = {'assets': (self._keys['assets'], (background, modes))}
+        if self._gallery is not None:
+            from gallery import index_state
+            parts['index'] = (self._keys['index'], index_state(gallery))
+        try:
+            save_snapshot(self.snapshot_path, parts)
+            logger.info(f"Warm-start snapshot written to {self.snapshot_path}")
+        except Exception as e:
+            logger.warning(f"Failed to write warm-start snapshot: {e}")
+
+    def poll(self):
+        """Return {name: value} for the parts that finished since the last call; raises if one failed"""
+        done = {}
+        for name, future in list(self._pending.items()):
+            if future.done():
+                del self._pending[name]
+                done[name] = future.result()
+        return done
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,155 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from attendance import AttendanceQueue
+from backend import LocalBackend
+from ledger import TIME_FORMAT
+
+
+@pytest.fixture
+def backend():
+    backend = LocalBackend()
+    backend.reference('Students/1').set({'name': 'Ada', 'total_attendance': 3,
+                                         'Last_attendance_time': '2000-01-01 00:00:00'})
+    return backend
+
+
+@pytest.fixture
+def make_queue(tmp_path, backend):
+    queues = []
+
+    def make(**kwargs):
+        kwargs.setdefault('ledger_path', str(tmp_path / 'attendance.db'))
+        kwargs.setdefault('journal_path', str(tmp_path / 'journal.jsonl'))
+        queue = AttendanceQueue(backend.reference(''), **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop()
+
+
+def test_attendance_cooldown(make_queue):
+    queue = make_queue(cooldown=300)
+    assert queue.record('1')
+    assert not queue.record('1')
+    assert queue.record('2')
+    assert queue.pending() == 2
+
+
+def test_attendance_cooldown_seeded_from_the_profile(make_queue):
+    queue = make_queue(cooldown=300)
+    recent = {'Last_attendance_time': datetime.now().strftime(TIME_FORMAT)}
+    assert not queue.record('1', recent)
+    assert queue.record('2', {'Last_attendance_time': '2000-01-01 00:00:00'})
+    assert queue.record('3', {'Last_attendance_time': 'not a time'})
+
+
+def test_attendance_flush_increments_on_the_server(make_queue, backend):
+    queue = make_queue(cooldown=0)
+    assert queue.record('1')
+    time.sleep(0.01)
+    assert queue.record('1')
+    assert queue.flush()
+    student = backend.reference('Students/1').get()
+    assert student['total_attendance'] == 5
+    assert student['Last_attendance_time'] > '2000-01-01 00:00:00'
+    assert (queue.pending(), queue.flushed) == (0, 2)
+
+
+def test_attendance_flush_failure_is_retried(make_queue, backend):
+    queue = make_queue()
+    queue.record('1')
+    backend.failure_rate = 1.0
+    assert not queue.flush()
+    assert (queue.pending(), queue.failures) == (1, 1)
+    backend.failure_rate = 0.0
+    assert queue.flush()
+    assert queue.pending() == 0
+    assert backend.reference('Students/1/total_attendance').get() == 4
+
+
+def test_late_event_does_not_move_the_time_back(make_queue, backend):
+    queue = make_queue(late_after=60)
+    queue.ledger.append('1', time.time() - 3600)
+    backend.reference('Students/1/Last_attendance_time').set('2999-01-01 00:00:00')
+    assert queue.flush()
+    student = backend.reference('Students/1').get()
+    assert student['Last_attendance_time'] == '2999-01-01 00:00:00'
+    assert student['total_attendance'] == 4
+
+
+def test_late_events_of_a_batch_are_checked_in_one_read(make_queue, backend):
+    backend.reference('Students/2').set({'name': 'Alan', 'Last_attendance_time': '2999-01-01 00:00:00'})
+    queue = make_queue(late_after=60)
+    for student_id in ('1', '2', '3'):
+        queue.ledger.append(student_id, time.time() - 3600)
+    calls = backend.calls
+    assert queue.flush()
+    # The query and the update, after the watermark check every run makes before its first batch
+    assert backend.calls - calls == 3
+    students = backend.reference('Students').get()
+    assert students['1']['Last_attendance_time'] > '2000-01-01 00:00:00'
+    assert students['2']['Last_attendance_time'] == '2999-01-01 00:00:00'
+    assert students['3']['total_attendance'] == 1
+
+
+def test_write_applied_before_a_timeout_is_not_counted_twice(make_queue, backend):
+    queue = make_queue(cooldown=0)
+    root = queue.root_ref
+    apply = root.update
+
+    def applied_then_timed_out(values):
+        apply(values)
+        raise TimeoutError('response lost')
+
+    queue.record('1')
+    queue.flush()  # confirms the watermark of any earlier run
+    queue.record('1')
+    root.update = applied_then_timed_out
+    assert not queue.flush()
+    root.update = apply
+    assert queue.flush()
+    assert backend.reference('Students/1/total_attendance').get() == 5
+    assert queue.pending() == 0 and queue.ledger.pending_count() == 0
+    queue.record('1')
+    assert queue.flush()
+    assert backend.reference('Students/1/total_attendance').get() == 6
+
+
+def test_restart_does_not_resend_a_written_batch(make_queue, backend, tmp_path):
+    queue = make_queue()
+    queue.record('1')
+    queue.ledger.mark_synced = lambda seqs: None  # crash between the write and the ledger update
+    assert queue.flush()
+    queue.stop()
+    restarted = make_queue()
+    assert restarted.pending() == 1
+    assert restarted.flush()
+    assert restarted.pending() == 0
+    assert backend.reference('Students/1/total_attendance').get() == 4
+
+
+def test_ledger_errors_fail_the_flush_instead_of_the_flusher(make_queue, backend):
+    import sqlite3
+
+    queue = make_queue(flush_interval=0.01)
+    queue.record('1')
+    unsynced = queue.ledger.unsynced
+
+    def locked(limit):
+        raise sqlite3.OperationalError('database is locked')
+
+    queue.ledger.unsynced = locked
+    assert not queue.flush()
+    assert queue.failures == 1
+    queue.ledger.unsynced = unsynced
+    queue.start()
+    deadline = time.time() + 5
+    while queue.pending() and time.time() < deadline:
+        time.sleep(0.01)
+    assert queue.pending() == 0
+    assert backend.reference('Students/1/total_attendance').get() == 4
@@ -0,0 +1,73 @@
+import pytest
+
+from backend import BackendUnavailable, LocalBackend
+
+
+def test_root_set_replaces_and_update_merges():
+    backend = LocalBackend()
+    root = backend.reference()
+    root.set({'Students': {'1': {'name': 'A'}}, 'Other': 1})
+    assert root.get() == {'Students': {'1': {'name': 'A'}}, 'Other': 1}
+    root.update({'Students/2': {'name': 'B'}, 'Other': None})
+    assert root.get() == {'Students': {'1': {'name': 'A'}, '2': {'name': 'B'}}}
+    root.set(None)
+    assert root.get() == {}
+    root.update({'Students/1/name': 'C'})
+    assert backend.reference('Students/1').get() == {'name': 'C'}
+
+
+def test_set_update_increment_and_delete():
+    backend = LocalBackend()
+    student = backend.reference('Students/1')
+    student.set({'name': 'A', 'total_attendance': 2})
+    student.update({'total_attendance': {'.sv': {'increment': 1}}, 'Last_attendance_time': '2024-03-04 09:00:00'})
+    assert student.get() == {'name': 'A', 'total_attendance': 3, 'Last_attendance_time': '2024-03-04 09:00:00'}
+    student.child('name').set(None)
+    assert 'name' not in student.get()
+    backend.reference('Students/1/total_attendance/extra').set(1)
+    assert student.child('total_attendance').get() == {'extra': 1}
+    assert backend.reference('Missing/path').get() is None
+    assert backend.calls == 8
+
+
+def test_order_by_child_start_at():
+    backend = LocalBackend()
+    backend.reference('Students').set({'1': {'t': '2024-03-04'}, '2': {'t': '2024-03-02'},
+                                       '3': {'t': '2024-03-03'}, '4': {'name': 'no key'}})
+    students = backend.reference('Students')
+    assert list(students.order_by_child('t').start_at('2024-03-03').get()) == ['3', '1']
+    assert list(students.order_by_child('t').get()) == ['2', '3', '1']
+    assert backend.reference('Empty').order_by_child('t').get() == {}
+
+
+def test_failure_injection_is_seeded():
+    def outcomes(seed):
+        backend = LocalBackend(failure_rate=0.5, seed=seed)
+        results = []
+        for _ in range(20):
+            try:
+                backend.reference('x').get()
+                results.append(True)
+            except BackendUnavailable:
+                results.append(False)
+        return results, backend.failures
+
+    first, failures = outcomes(3)
+    assert outcomes(3) == (first, failures)
+    assert failures == first.count(False) and 0 < failures < 20
+
+
+def test_save_and_load_round_trip(tmp_path):
+    backend = LocalBackend(str(tmp_path))
+    backend.reference('Students/1').set({'name': 'A'})
+    backend.bucket.blob('images/1.png').upload_from_string(b'png bytes')
+    backend.close()
+    reopened = LocalBackend(str(tmp_path))
+    assert reopened.reference('Students').get() == {'1': {'name': 'A'}}
+    blob = reopened.bucket.get_blob('images/1.png')
+    assert blob.download_as_bytes() == b'png bytes'
+    assert blob.md5_hash == backend.bucket.blobs['images/1.png'].md5_hash
+    assert [b.name for b in reopened.bucket.list_blobs('images/')] == ['images/1.png']
+    assert reopened.bucket.get_blob('images/2.png') is None
+    with pytest.raises(FileNotFoundError):
+        reopened.bucket.blob('images/2.png').download_as_bytes()
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from backend_pool import BackendPool
+
+
+@pytest.fixture
+def pool():
+    pool = BackendPool(workers=2, max_pending=2)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def settle(condition, timeout=5):
+    """Done callbacks run just after result() wakes up, so wait for them"""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert condition()
+
+
+def test_backend_pool_runs_requests(pool):
+    assert pool.submit('a', lambda x: x * 2, 21).result(timeout=5) == 42
+    assert pool.submitted == 1
+
+
+def test_backend_pool_coalesces_requests_for_the_same_key(pool):
+    gate = threading.Event()
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        gate.wait(5)
+        return key
+
+    first = pool.submit('a', fetch, 'a')
+    second = pool.submit('a', fetch, 'a')
+    assert second is first
+    gate.set()
+    assert first.result(timeout=5) == 'a'
+    assert calls == ['a']
+    assert (pool.submitted, pool.coalesced) == (1, 1)
+
+
+def test_backend_pool_rejects_beyond_max_pending(pool):
+    gate = threading.Event()
+    futures = [pool.submit(key, gate.wait, 5) for key in ('a', 'b')]
+    assert pool.submit('c', gate.wait, 5) is None
+    assert pool.rejected == 1
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+    settle(lambda: pool.queue_depth == 0)
+    assert pool.submit('c', lambda: 'ok').result(timeout=5) == 'ok'
+
+
+def test_backend_pool_counts_failures_and_forgets_the_key(pool):
+    def fail():
+        raise RuntimeError('backend down')
+
+    future = pool.submit('a', fail)
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+    settle(lambda: pool.errors == 1)
+    assert pool.submit('a', lambda: 'retry').result(timeout=5) == 'retry'
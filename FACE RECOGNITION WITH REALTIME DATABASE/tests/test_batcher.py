@@ -0,0 +1,81 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from batcher import EncodingBatcher
+
+
+def double(chips):
+    return [2 * chip for chip in chips]
+
+
+def test_batcher_splits_results_per_request():
+    batcher = EncodingBatcher(double, max_batch=16, max_wait=0.05)
+    try:
+        futures = [batcher.submit(list(range(i, i + 3))) for i in (0, 10, 20)]
+        assert [f.result(timeout=5) for f in futures] == [[0, 2, 4], [20, 22, 24], [40, 42, 44]]
+        assert batcher.submit([]).result(timeout=5) == []
+        assert batcher.chips == 9
+    finally:
+        batcher.close()
+
+
+def test_batcher_keeps_a_batch_in_flight_per_worker():
+    running = threading.Barrier(3, timeout=5)
+
+    def encode(chips):
+        running.wait()  # only returns once three batches encode at the same time
+        return double(chips)
+
+    with ThreadPoolExecutor(3) as executor:
+        batcher = EncodingBatcher(encode, max_batch=1, max_wait=0, executor=executor, max_in_flight=3)
+        try:
+            futures = [batcher.submit([i]) for i in range(6)]
+            assert [f.result(timeout=5) for f in futures] == [[2 * i] for i in range(6)]
+            assert batcher.batches == 6
+        finally:
+            batcher.close()
+
+
+def test_batcher_limits_batches_in_flight():
+    gate = threading.Event()
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def encode(chips):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        gate.wait(5)
+        with lock:
+            active[0] -= 1
+        return double(chips)
+
+    with ThreadPoolExecutor(4) as executor:
+        batcher = EncodingBatcher(encode, max_batch=1, max_wait=0, executor=executor, max_in_flight=2)
+        try:
+            futures = [batcher.submit([i]) for i in range(5)]
+            threading.Timer(0.1, gate.set).start()
+            assert [f.result(timeout=5) for f in futures] == [[2 * i] for i in range(5)]
+            assert peak[0] == 2
+        finally:
+            batcher.close()
+
+
+def test_batcher_failure_reaches_every_request_of_the_batch():
+    def fail(chips):
+        raise RuntimeError('encoder crashed')
+
+    with ThreadPoolExecutor(1) as executor:
+        batcher = EncodingBatcher(fail, max_batch=8, max_wait=0.05, executor=executor)
+        try:
+            futures = [batcher.submit([1]), batcher.submit([2])]
+            for future in futures:
+                with pytest.raises(RuntimeError):
+                    future.result(timeout=5)
+            # The slot is given back, so later batches still run
+            batcher.encode = double
+            assert batcher.encode_many([3]) == [6]
+        finally:
+            batcher.close()
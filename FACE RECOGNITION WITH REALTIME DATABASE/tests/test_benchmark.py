@@ -0,0 +1,88 @@
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+import benchmark
+import benchmark_matcher
+from pipeline import StageStats
+
+
+def test_synthetic_gallery_and_queries():
+    gallery = benchmark_matcher.synthetic_gallery(200, dim=16)
+    assert gallery.shape == (200, 16) and gallery.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(gallery, axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_array_equal(gallery, benchmark_matcher.synthetic_gallery(200, dim=16))
+    queries, truth = benchmark_matcher.noisy_queries(gallery, 50)
+    assert queries.shape == (50, 16) and truth.shape == (50,)
+    nearest = np.argmax(queries @ gallery.T, axis=1)
+    assert np.mean(nearest == truth) > 0.9
+
+
+def test_time_search_times_every_batch():
+    class CountingMatcher:
+        batches = []
+
+        def search(self, queries):
+            self.batches.append(len(queries))
+
+    latency = benchmark_matcher.time_search(CountingMatcher(), np.zeros((10, 4)), batch=4, repeats=2)
+    assert CountingMatcher.batches == [4, 4, 2] * 2 and latency >= 0.0
+
+
+def test_benchmark_matcher_main(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['benchmark_matcher.py', '--sizes', '300', '--queries', '16', '--repeats', '1'])
+    benchmark_matcher.main()
+    rows = capsys.readouterr().out.splitlines()[1:]
+    assert [row.split()[1:3] for row in rows][:2] == [['flat', 'none'], ['flat', 'float16']]
+    # The exact flat index is the reference recall
+    assert float(rows[0].split()[-1]) == 1.0
+
+
+def test_run_galleries_reports_each_build():
+    args = argparse.Namespace(sizes=[300], queries=16, indexes=['flat', 'ivf'], quantizations=['none', 'int8'],
+                              rerank=8, batch=4, repeats=1)
+    results = benchmark.run_galleries(args)
+    assert [(r['index'], r['quantization']) for r in results] == [('flat', 'none'), ('flat', 'int8'),
+                                                                 ('ivf', 'none'), ('ivf', 'int8')]
+    assert results[0]['recall_at_1'] > 0.9 and all(r['size'] == 300 for r in results)
+    if benchmark.rss_mb() is not None:
+        assert all(isinstance(r['build_rss_mb'], float) for r in results)
+
+
+def test_rss_follows_allocations():
+    before = benchmark.rss_mb()
+    if before is None:
+        return
+    block = np.ones(64 * 1024 * 1024, np.uint8)
+    assert benchmark.rss_mb() - before > 50
+    del block
+    assert benchmark.peak_rss_mb() >= benchmark.rss_mb()
+
+
+def test_replay_frames_from_a_directory(tmp_path):
+    (tmp_path / '2').mkdir()
+    for path in ('1.png', '2/a.png', '2/b.jpg'):
+        cv2.imwrite(str(tmp_path / path), np.zeros((8, 8, 3), np.uint8))
+    (tmp_path / '2' / 'notes.txt').write_text('not an image')
+    frames = list(benchmark.replay_frames(str(tmp_path)))
+    assert [expected for _, expected in frames] == ['1', '2', '2']
+    assert len(list(benchmark.replay_frames(str(tmp_path), limit=2))) == 2
+
+
+def test_local_backend_seeds_profiles_and_photos(tmp_path):
+    cv2.imwrite(str(tmp_path / '1.png'), np.zeros((8, 8, 3), np.uint8))
+    backend = benchmark.local_backend(['1', '2'], image_dir=str(tmp_path))
+    assert sorted(backend.reference('Students').get()) == ['1', '2']
+    assert list(backend.bucket.blobs) == ['images/1.png']
+
+
+def test_stage_summary():
+    stats = StageStats('match')
+    for ms in (1, 2, 3, 4):
+        stats.record(ms / 1000)
+    summary = benchmark.stage_summary(stats)
+    assert set(summary) == {'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'}
+    assert summary['mean_ms'] == 2.5
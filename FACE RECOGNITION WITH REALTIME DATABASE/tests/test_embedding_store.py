@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore, write_store
+from matcher import GalleryMatcher
+
+DIM = 128
+
+
+def encodings(n, seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, (n, DIM)).astype(np.float32)
+
+
+def test_create_is_empty(tmp_path):
+    store = EmbeddingStore.create(str(tmp_path / 'e.bin'))
+    assert len(store) == 0
+    assert store.embeddings.shape == (0, DIM)
+    assert store.ids == []
+
+
+def test_write_store_round_trip(tmp_path):
+    path = str(tmp_path / 'e.bin')
+    data = encodings(10)
+    ids = [str(1000 + i) for i in range(10)]
+    write_store(path, ids, data)
+    store = EmbeddingStore(path)
+    assert store.ids == ids
+    np.testing.assert_array_equal(store.embeddings, data)
+    np.testing.assert_allclose(store.sq_norms, (data ** 2).sum(axis=1), rtol=1e-5)
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_append_keeps_existing_records(tmp_path):
+    path = str(tmp_path / 'e.bin')
+    first, second = encodings(5, 0), encodings(3, 1)
+    store = write_store(path, ['a', 'b', 'c', 'd', 'e'], first)
+    store = store.append(['f', 'a', 'g'], second)
+    assert len(store) == 8
+    assert store.ids == ['a', 'b', 'c', 'd', 'e', 'f', 'a', 'g']
+    np.testing.assert_array_equal(store.embeddings[:5], first)
+    np.testing.assert_array_equal(store.embeddings[5:], second)
+    # Ids stay paired with their rows, several rows per student included
+    assert store.rows('a') == [0, 6]
+    assert EmbeddingStore(path).ids == store.ids
+
+
+def test_append_to_empty_store(tmp_path):
+    store = EmbeddingStore.create(str(tmp_path / 'e.bin')).append(['x'], encodings(1))
+    assert store.ids == ['x']
+
+
+def test_rewrite_replaces_the_file(tmp_path):
+    path = str(tmp_path / 'e.bin')
+    write_store(path, ['a', 'b'], encodings(2, 0))
+    replaced = encodings(3, 1)
+    store = write_store(path, ['c', 'd', 'e'], replaced)
+    assert store.ids == ['c', 'd', 'e']
+    np.testing.assert_array_equal(EmbeddingStore(path).embeddings, replaced)
+
+
+def test_long_ids_are_rejected(tmp_path):
+    store = EmbeddingStore.create(str(tmp_path / 'e.bin'), id_width=4)
+    with pytest.raises(ValueError):
+        store.append(['toolong'], encodings(1))
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / 'e.bin'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(path))
+
+
+def test_matcher_uses_the_mapped_rows_in_place(tmp_path):
+    store = write_store(str(tmp_path / 'e.bin'), [str(i) for i in range(50)], encodings(50))
+    matcher = GalleryMatcher(store.embeddings, store.ids, sq_norms=store.sq_norms)
+    assert np.shares_memory(matcher.matrix, store.records)
+    assert matcher.match(store.embeddings[7:8], 0.6)[0][0] == '7'
@@ -0,0 +1,84 @@
+import os
+
+import cv2
+import numpy as np
+
+import encoding
+from backend import LocalBackend
+from embedding_store import EmbeddingStore
+
+DIM = 128
+
+
+def write_image(path, shade):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv2.imwrite(path, np.full((32, 32, 3), shade, np.uint8))
+
+
+def fake_encoder(encoded):
+    def findencoding(paths, workers=None):
+        encoded.extend(paths)
+        results = {}
+        for path in paths:
+            # Encodings of one student are close together, different students far apart
+            student_id = encoding.student_of(os.path.relpath(path, 'Images').replace(os.sep, '/'))
+            results[path] = [int(student_id) * 0.01 + len(path) * 1e-4] * DIM
+        return results
+    return findencoding
+
+
+def test_scan_images_skips_unchanged(tmp_path):
+    folder = str(tmp_path)
+    write_image(os.path.join(folder, '1.png'), 10)
+    write_image(os.path.join(folder, '2', 'a.png'), 20)
+    images = encoding.list_images(folder)
+    assert images == [('1.png', '1'), ('2/a.png', '2')]
+    current, changed, removed = encoding.scan_images(folder, images, {})
+    assert changed == ['1.png', '2/a.png'] and removed == set()
+
+    current, changed, removed = encoding.scan_images(folder, images, current)
+    assert changed == [] and removed == set()
+
+    # A new mtime with the same content is rehashed but not re-encoded
+    stat = os.stat(os.path.join(folder, '1.png'))
+    os.utime(os.path.join(folder, '1.png'), (stat.st_atime, stat.st_mtime + 10))
+    current, changed, _ = encoding.scan_images(folder, images, current)
+    assert changed == [] and current['1.png']['mtime'] == stat.st_mtime + 10
+
+    write_image(os.path.join(folder, '2', 'a.png'), 30)
+    os.remove(os.path.join(folder, '1.png'))
+    current, changed, removed = encoding.scan_images(folder, encoding.list_images(folder), current)
+    assert changed == ['2/a.png'] and removed == {'1.png'}
+
+
+def test_incremental_enrollment(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    backend = LocalBackend()
+    backend.close = lambda: None
+    encoded = []
+    monkeypatch.setattr(encoding, 'open_backend', lambda: backend)
+    monkeypatch.setattr(encoding, 'findencoding', fake_encoder(encoded))
+    write_image('Images/1.png', 10)
+    write_image('Images/2/a.png', 20)
+    write_image('Images/2/b.jpg', 30)
+
+    encoding.main()
+    assert sorted(encoded) == sorted(os.path.join('Images', p) for p in ('1.png', '2/a.png', '2/b.jpg'))
+    assert sorted(backend.bucket.blobs) == ['images/1.png', 'images/2.png']
+    assert sorted(EmbeddingStore('centroids.bin').index) == ['1', '2']
+    assert len(EmbeddingStore('encodings.bin')) == 3
+
+    # Nothing changed: nothing is encoded or uploaded again
+    encoded.clear()
+    calls = backend.calls
+    encoding.main()
+    assert encoded == [] and backend.calls == calls
+
+    # Only the new and the changed image are encoded
+    write_image('Images/2/b.jpg', 40)
+    write_image('Images/3.png', 50)
+    encoding.main()
+    assert sorted(encoded) == sorted(os.path.join('Images', p) for p in ('2/b.jpg', '3.png'))
+    assert sorted(EmbeddingStore('centroids.bin').index) == ['1', '2', '3']
+    assert len(EmbeddingStore('encodings.bin')) == 4
+    assert sorted(backend.bucket.blobs) == ['images/1.png', 'images/2.png', 'images/3.png']
@@ -0,0 +1,52 @@
+import numpy as np
+
+from enrollment import prune_outliers, select_prototypes, summarize_identity
+
+DIM = 128
+
+
+def cluster(n, centre=0.0, noise=0.02, seed=0):
+    rng = np.random.default_rng(seed)
+    return (centre + noise * rng.normal(size=(n, DIM))).astype(np.float32)
+
+
+def test_centroid_is_the_mean_of_the_inliers():
+    encodings = cluster(4)
+    centroid, prototypes, outliers = summarize_identity(encodings)
+    np.testing.assert_allclose(centroid, encodings.mean(axis=0), rtol=1e-5)
+    assert sorted(prototypes) == [0, 1, 2, 3] and outliers == []
+
+
+def test_a_wrong_face_is_left_out_of_the_centroid():
+    encodings = np.vstack([cluster(4), cluster(1, centre=0.2, seed=1)])
+    centroid, prototypes, outliers = summarize_identity(encodings, max_distance=0.45)
+    assert outliers == [4] and 4 not in prototypes
+    np.testing.assert_allclose(centroid, encodings[:4].mean(axis=0), rtol=1e-5)
+
+
+def test_one_encoding_is_its_own_centroid():
+    encoding = cluster(1)[0]
+    centroid, prototypes, outliers = summarize_identity([encoding.tolist()])
+    np.testing.assert_allclose(centroid, encoding)
+    assert prototypes == [0] and outliers == []
+
+
+def test_prune_outliers_needs_a_majority():
+    two = np.vstack([cluster(1), cluster(1, centre=0.5, seed=1)])
+    assert prune_outliers(two).all()
+    # All far apart: the one closest to the median is kept
+    spread = np.eye(3, DIM, dtype=np.float32)
+    assert prune_outliers(spread, max_distance=0.1).sum() == 1
+
+
+def test_prototypes_start_typical_and_spread_out():
+    encodings = np.vstack([cluster(6, noise=0.01), cluster(1, centre=0.03, seed=1)])
+    centroid = encodings.mean(axis=0)
+    chosen = select_prototypes(encodings, centroid, max_prototypes=3)
+    assert len(chosen) == 3 and len(set(chosen)) == 3
+    assert chosen[0] == int(np.argmin(np.linalg.norm(encodings - centroid, axis=1)))
+    # The most different photo is kept as a prototype
+    assert 6 in chosen
+    assert select_prototypes(encodings[:2], centroid, max_prototypes=3) == [0, 1]
+    _, prototypes, _ = summarize_identity(encodings, max_prototypes=3)
+    assert len(prototypes) == 3
@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pytest
+
+from hot_cache import HotIdentityCache
+from matcher import GalleryMatcher
+
+DIM = 128
+THRESHOLD = 0.6
+
+
+ENCODINGS = np.random.default_rng(0).normal(0, 0.1, (500, DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def matcher():
+    return GalleryMatcher(ENCODINGS, [f'id{i}' for i in range(len(ENCODINGS))])
+
+
+@pytest.fixture
+def faces():
+    """Two noisy views of each of 20 enrolled students"""
+    rng = np.random.default_rng(1)
+    enrolled = ENCODINGS[rng.choice(len(ENCODINGS), 20, replace=False)]
+    return tuple(enrolled + rng.normal(0, 0.002, enrolled.shape).astype(np.float32) for _ in range(2))
+
+
+def test_hot_cache_hits_agree_with_the_gallery(matcher, faces):
+    cache = HotIdentityCache(matcher, capacity=64, radius=0.15, ttl=3600)
+    first, second = faces
+    expected = matcher.match(second, THRESHOLD)
+    cache.match(first, THRESHOLD)
+    assert (cache.hits, cache.fallbacks) == (0, 20)
+    results = cache.match(second, THRESHOLD)
+    assert (cache.hits, cache.fallbacks) == (20, 20)
+    assert [r[0] for r in results] == [r[0] for r in expected]
+    assert [r[2] for r in results] == [r[2] for r in expected]
+    for (_, bound, _), (_, distance, _) in zip(results, expected):
+        assert distance <= bound + 1e-5 < THRESHOLD
+
+
+def test_hot_cache_misses_fall_back_to_the_gallery(matcher, faces):
+    cache = HotIdentityCache(matcher, capacity=64, radius=0.15, ttl=3600)
+    first, _ = faces
+    cache.match(first[:10], THRESHOLD)
+    cache.match(first[10:], THRESHOLD)
+    assert (cache.hits, cache.fallbacks) == (0, 20)
+    stranger = np.full((1, DIM), 5.0, np.float32)
+    assert cache.match(stranger, THRESHOLD)[0][0] is None
+    assert cache.match(stranger, THRESHOLD)[0][0] is None
+    assert cache.fallbacks == 22
+
+
+def test_hot_cache_evicts_the_least_recently_used(matcher, faces):
+    cache = HotIdentityCache(matcher, capacity=4, radius=0.15, ttl=3600)
+    first, second = faces
+    cache.match(first[:4], THRESHOLD)
+    time.sleep(0.01)
+    cache.match(second[1:4], THRESHOLD)
+    assert cache.hits == 3
+    cache.match(first[4:5], THRESHOLD)
+    cache.match(second[1:5], THRESHOLD)
+    assert cache.hits == 7
+    cache.match(second[:1], THRESHOLD)
+    assert cache.hits == 7
+
+
+def test_hot_cache_entries_expire(matcher, faces):
+    cache = HotIdentityCache(matcher, capacity=64, radius=0.15, ttl=0)
+    first, second = faces
+    cache.match(first, THRESHOLD)
+    time.sleep(0.01)
+    cache.match(second, THRESHOLD)
+    assert cache.hits == 0
+
+
+def test_hot_cache_clears_when_the_gallery_changes(matcher, faces):
+    cache = HotIdentityCache(matcher, capacity=64, radius=0.15, ttl=3600)
+    first, second = faces
+    cache.match(first, THRESHOLD)
+    matcher.ids = list(matcher.ids)
+    cache.match(second, THRESHOLD)
+    assert cache.hits == 0
+    cache.match(first, THRESHOLD)
+    assert cache.hits == 20
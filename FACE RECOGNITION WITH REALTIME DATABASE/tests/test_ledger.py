@@ -0,0 +1,73 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from attendance import AttendanceQueue
+from backend import LocalBackend
+from ledger import DAY_FORMAT, AttendanceLedger
+
+DAY_ONE = datetime(2024, 3, 4, 9, 0).timestamp()
+DAY_TWO = datetime(2024, 3, 5, 9, 0).timestamp()
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = AttendanceLedger(str(tmp_path / 'attendance.db'))
+    yield ledger
+    ledger.close()
+
+
+def test_ledger_sync_state(ledger):
+    first = ledger.append('1', DAY_ONE, 'door', 0.31)
+    second = ledger.append('2', DAY_ONE + 60)
+    assert first['time'] == '2024-03-04 09:00:00'
+    assert second['seq'] > first['seq']
+    assert [event['id'] for event in ledger.unsynced(10)] == ['1', '2']
+    assert [event['id'] for event in ledger.unsynced(1)] == ['1']
+    ledger.mark_synced([first['seq']])
+    assert ledger.pending_count() == 1
+    assert ledger.unsynced(10)[0]['seq'] == second['seq']
+
+
+def test_ledger_queries(ledger):
+    ledger.append('1', DAY_ONE, 'door', 0.31)
+    ledger.append('2', DAY_ONE + 60)
+    ledger.append('1', DAY_ONE + 3600)
+    ledger.append('1', DAY_TWO, 'hall', 0.4)
+    assert ledger.last_seen() == {'1': DAY_TWO, '2': DAY_ONE + 60}
+    assert ledger.present('2024-03-04') == [('1', '2024-03-04 09:00:00', '2024-03-04 10:00:00', 2),
+                                           ('2', '2024-03-04 09:01:00', '2024-03-04 09:01:00', 1)]
+    assert ledger.present('2024-03-06') == []
+    assert [row[0] for row in ledger.history('1')] == ['2024-03-04 09:00:00', '2024-03-04 10:00:00',
+                                                       '2024-03-05 09:00:00']
+    assert ledger.history('1', since='2024-03-05') == [('2024-03-05 09:00:00', 'hall', 0.4, None)]
+    assert len(ledger.history('1', until='2024-03-04')) == 2
+    assert [row[0] for row in ledger.events(since='2024-03-04', until='2024-03-04')] == ['1', '2', '1']
+
+
+def test_queue_restores_cooldown_and_backlog_from_the_ledger(tmp_path):
+    paths = {'ledger_path': str(tmp_path / 'attendance.db'), 'journal_path': str(tmp_path / 'journal.jsonl')}
+    root = LocalBackend().reference('')
+    queue = AttendanceQueue(root, cooldown=300, **paths)
+    assert queue.record('1', stream='door', distance=0.3)
+    queue.stop()
+
+    queue = AttendanceQueue(root, cooldown=300, **paths)
+    assert queue.pending() == 1
+    assert not queue.record('1')
+    assert queue.flush()
+    assert queue.ledger.pending_count() == 0
+    assert root.child('Students/1/total_attendance').get() == 1
+    queue.stop()
+
+
+def test_queue_imports_the_old_journal(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    journal.write_text(''.join(json.dumps({'id': student_id, 'ts': DAY_ONE}) + '\n' for student_id in ('1', '2')))
+    queue = AttendanceQueue(LocalBackend().reference(''), ledger_path=str(tmp_path / 'attendance.db'),
+                            journal_path=str(journal))
+    assert not journal.exists()
+    assert queue.pending() == 2
+    assert [row[0] for row in queue.ledger.present(datetime.fromtimestamp(DAY_ONE).strftime(DAY_FORMAT))] == ['1', '2']
+    queue.stop()
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from backend import LocalBackend
+from ledger import AttendanceLedger
+from loadgen import (ledger_events, percentiles_ms, replay, seed_students, synthetic_events, synthetic_ids,
+                     synthetic_students)
+
+
+def test_synthetic_roster_is_reproducible():
+    ids = synthetic_ids(5)
+    assert ids == ['20000000', '20000001', '20000002', '20000003', '20000004']
+    students = synthetic_students(ids, seed=1)
+    assert students == synthetic_students(ids, seed=1)
+    assert set(students) == set(ids)
+    assert all(s['total_attendance'] == 0 and s['Starting_year'] + s['year'] == 2025 for s in students.values())
+
+
+def test_seed_students_batches_the_writes():
+    backend = LocalBackend()
+    ids = synthetic_ids(25)
+    seed_students(backend, synthetic_students(ids), photos=True, batch_size=10)
+    assert backend.calls == 3 + 25
+    assert sorted(backend.reference('Students').get()) == ids
+    assert backend.bucket.blobs['images/20000000.png'].data[:4] == b'\x89PNG'
+
+
+def test_synthetic_events_rate_and_skew():
+    ids = synthetic_ids(50)
+    events = synthetic_events(ids, rate=100, duration=20, cameras=3, skew=1.5, seed=2)
+    assert events == synthetic_events(ids, rate=100, duration=20, cameras=3, skew=1.5, seed=2)
+    assert 1700 < len(events) < 2300
+    assert [e[0] for e in events] == sorted(e[0] for e in events) and events[-1][0] < 20
+    assert {e[2] for e in events} == {'camera-0', 'camera-1', 'camera-2'}
+    counts = sorted((sum(e[1] == i for e in events) for i in ids), reverse=True)
+    assert counts[0] > 10 * counts[-1]
+    uniform = synthetic_events(ids, rate=100, duration=20, skew=0.0, seed=2)
+    uniform_counts = [sum(e[1] == i for e in uniform) for i in ids]
+    assert max(uniform_counts) < 3 * min(uniform_counts)
+
+
+def test_ledger_events_are_offsets_from_the_first(tmp_path):
+    path = str(tmp_path / 'attendance.db')
+    ledger = AttendanceLedger(path)
+    start = datetime(2024, 3, 4, 9, 0).timestamp()
+    ledger.append('1', start, 'door', 0.31)
+    ledger.append('2', start + 10)
+    ledger.close()
+    assert ledger_events(path, speed=2.0) == [(0.0, '1', 'door', 0.31), (5.0, '2', 'replay', None)]
+    assert ledger_events(str(tmp_path / 'empty.db')) == []
+
+
+def test_percentiles_ms():
+    assert percentiles_ms([]) == {}
+    stats = percentiles_ms([0.001 * i for i in range(1, 101)])
+    assert stats['mean_ms'] == 50.5 and stats['max_ms'] == 100.0 and stats['p50_ms'] == 50.5
+
+
+class FakeServices:
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(2)
+        self.seen = []
+
+    def submit(self, student_id, stream=None, distance=None):
+        self.seen.append(student_id)
+        if student_id == 'full':
+            return None
+        return self.executor.submit(self.record, student_id)
+
+    def record(self, student_id):
+        if student_id == 'bad':
+            raise ConnectionError(student_id)
+        return ({'name': student_id}, None)
+
+
+def test_replay_counts_outcomes():
+    services = FakeServices()
+    events = [(0.0, '1', 'camera-0', 0.4), (0.01, 'bad', 'camera-0', 0.4), (0.02, 'full', 'camera-1', 0.4),
+              (0.03, '2', 'camera-1', 0.4)]
+    report = replay(services, events, drain_timeout=5.0)
+    services.executor.shutdown()
+    assert services.seen == ['1', 'bad', 'full', '2']
+    assert (report['events'], report['completed'], report['failed'], report['rejected']) == (4, 2, 1, 1)
+    assert report['offered_per_s'] == round(4 / 0.03, 2)
+    assert report['seconds'] >= 0.03 and report['latency']['max_ms'] < 5000
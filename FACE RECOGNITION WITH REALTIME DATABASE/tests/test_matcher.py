@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from matcher import GalleryMatcher, IdentityMatcher
+
+DIM = 128
+
+
+def brute_force(gallery, queries):
+    dists = np.linalg.norm(queries[:, None, :] - gallery[None, :, :], axis=2)
+    return dists.argmin(axis=1), dists.min(axis=1)
+
+
+@pytest.fixture(scope='module')
+def gallery():
+    rng = np.random.default_rng(0)
+    encodings = rng.normal(0, 0.1, (2000, DIM)).astype(np.float32)
+    return encodings, [f'id{i}' for i in range(len(encodings))]
+
+
+@pytest.fixture(scope='module')
+def queries(gallery):
+    """Noisy copies of known rows, like a second photo of an enrolled student"""
+    encodings, _ = gallery
+    rng = np.random.default_rng(1)
+    rows = rng.choice(len(encodings), 200, replace=False)
+    return rows, encodings[rows] + rng.normal(0, 0.01, (len(rows), DIM)).astype(np.float32)
+
+
+def test_flat_search_is_exact(gallery, queries):
+    encodings, ids = gallery
+    _, q = queries
+    matcher = GalleryMatcher(encodings, ids)
+    dists, rows = matcher.search(q, k=1)
+    expected_rows, expected_dists = brute_force(encodings, q)
+    assert (rows[:, 0] == expected_rows).all()
+    np.testing.assert_allclose(dists[:, 0], expected_dists, rtol=1e-4, atol=1e-4)
+
+
+def test_flat_search_top_k_is_sorted(gallery, queries):
+    encodings, ids = gallery
+    _, q = queries
+    dists, rows = GalleryMatcher(encodings, ids).search(q[:10], k=5)
+    assert rows.shape == (10, 5)
+    assert (np.diff(dists, axis=1) >= 0).all()
+
+
+def test_match_applies_threshold(gallery, queries):
+    encodings, ids = gallery
+    rows, q = queries
+    matcher = GalleryMatcher(encodings, ids)
+    far = np.full((1, DIM), 10.0, np.float32)
+    results = matcher.match(np.vstack([q[:1], far]), threshold=0.6)
+    assert results[0][0] == ids[rows[0]] and results[0][2] == rows[0]
+    student_id, distance, row = results[1]
+    assert student_id is None and row == -1 and distance >= 0.6
+
+
+def test_ivf_recall(gallery, queries):
+    encodings, ids = gallery
+    rows, q = queries
+    matcher = GalleryMatcher(encodings, ids, index_type='ivf', nlist=32, nprobe=8)
+    found = matcher.search(q, k=1)[1][:, 0]
+    assert (found == rows).mean() >= 0.95
+
+
+def test_ivf_probing_every_cell_is_exact(gallery):
+    encodings, ids = gallery
+    q = np.random.default_rng(2).normal(0, 0.1, (50, DIM)).astype(np.float32)
+    matcher = GalleryMatcher(encodings, ids, index_type='ivf', nlist=16, nprobe=16)
+    assert (matcher.search(q, k=1)[1][:, 0] == brute_force(encodings, q)[0]).all()
+
+
+@pytest.mark.parametrize('index_type', ['flat', 'ivf'])
+@pytest.mark.parametrize('encodings', [[], np.zeros((0, DIM), np.float32)])
+def test_empty_gallery(index_type, encodings):
+    matcher = GalleryMatcher(encodings, [], index_type=index_type)
+    assert len(matcher) == 0
+    assert matcher.match(np.zeros((2, DIM), np.float32), 0.6) == [(None, float('inf'), -1)] * 2
+
+
+def test_unknown_index_type_is_rejected(gallery):
+    encodings, ids = gallery
+    with pytest.raises(ValueError):
+        GalleryMatcher(encodings, ids, index_type='hnsw')
+
+
+def test_identity_matcher_reports_nearest_prototype():
+    rng = np.random.default_rng(3)
+    centres = rng.normal(0, 0.1, (100, DIM)).astype(np.float32)
+    prototypes = np.repeat(centres, 3, axis=0) + rng.normal(0, 0.02, (300, DIM)).astype(np.float32)
+    prototype_ids = [f'id{i // 3}' for i in range(300)]
+    matcher = IdentityMatcher(centres, [f'id{i}' for i in range(100)], prototypes, prototype_ids, shortlist=4)
+    q = prototypes[::3] + rng.normal(0, 0.005, (100, DIM)).astype(np.float32)
+    results = matcher.match(q, threshold=0.6)
+    assert [r[0] for r in results] == [f'id{i}' for i in range(100)]
+    expected_rows, expected_dists = brute_force(prototypes, q)
+    assert [r[2] for r in results] == list(expected_rows)
+    np.testing.assert_allclose([r[1] for r in results], expected_dists, rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize('quantization', ['float16', 'int8'])
+@pytest.mark.parametrize('index_type', ['flat', 'ivf'])
+def test_quantized_search_reports_exact_distances(gallery, queries, index_type, quantization):
+    encodings, ids = gallery
+    rows, q = queries
+    matcher = GalleryMatcher(encodings, ids, index_type=index_type, nlist=32, nprobe=8,
+                             quantization=quantization, rerank=32)
+    dists, found = matcher.search(q, k=1)
+    assert (found[:, 0] == rows).mean() >= 0.95
+    # Re-ranking against the float32 rows: the distance is the true one to the row returned
+    true = np.linalg.norm(encodings[found[:, 0]] - q, axis=1)
+    np.testing.assert_allclose(dists[:, 0], true, rtol=1e-4, atol=1e-4)
+
+
+def test_quantization_shrinks_the_scanned_index(gallery):
+    encodings, ids = gallery
+    full = GalleryMatcher(encodings, ids).index_bytes
+    assert GalleryMatcher(encodings, ids, quantization='float16').index_bytes < 0.55 * full
+    assert GalleryMatcher(encodings, ids, quantization='int8').index_bytes < 0.3 * full
+
+
+def test_unknown_quantization_is_rejected(gallery):
+    encodings, ids = gallery
+    with pytest.raises(ValueError):
+        GalleryMatcher(encodings, ids, quantization='int4')
+
+
+def test_index_state_skips_training_on_the_next_build(gallery, queries, monkeypatch):
+    encodings, ids = gallery
+    _, q = queries
+    built = GalleryMatcher(encodings, ids, index_type='ivf', nlist=32, nprobe=8)
+    state = built.index_state()
+    assert GalleryMatcher(encodings, ids).index_state() is None
+
+    def no_training(*args):
+        raise AssertionError("k-means ran although the trained cells were passed in")
+
+    monkeypatch.setattr('matcher._kmeans', no_training)
+    warm = GalleryMatcher(encodings, ids, index_type='ivf', nlist=32, nprobe=8, trained=state)
+    for got, expected in zip(warm.search(q, k=3), built.search(q, k=3)):
+        np.testing.assert_array_equal(got, expected)
+
+
+def test_index_state_for_other_rows_is_not_reused(gallery):
+    encodings, ids = gallery
+    state = GalleryMatcher(encodings, ids, index_type='ivf', nlist=32).index_state()
+    smaller = GalleryMatcher(encodings[:500], ids[:500], index_type='ivf', nlist=32, trained=state)
+    assert smaller.index_state()['rows'] == 500
+    assert len(smaller.index_state()['order']) == 500
@@ -0,0 +1,100 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import Histogram, MetricsServer, Registry, SamplingProfiler
+
+
+def test_exposition_format():
+    registry = Registry()
+    registry.counter('face_frames_total', 'Frames seen', {'stream': 'door'}).inc(3)
+    registry.gauge('face_queue_depth', 'Queued requests', fn=lambda: 2.5)
+    latency = registry.histogram('face_stage_seconds', 'Stage latency', {'stage': 'match'}, buckets=(0.01, 0.1))
+    latency.observe(0.005)
+    latency.observe(0.05)
+    latency.observe(3.0)
+    assert registry.expose() == (
+        '# HELP face_frames_total Frames seen\n'
+        '# TYPE face_frames_total counter\n'
+        'face_frames_total{stream="door"} 3\n'
+        '# HELP face_queue_depth Queued requests\n'
+        '# TYPE face_queue_depth gauge\n'
+        'face_queue_depth 2.5\n'
+        '# HELP face_stage_seconds Stage latency\n'
+        '# TYPE face_stage_seconds histogram\n'
+        'face_stage_seconds_bucket{stage="match",le="0.01"} 1\n'
+        'face_stage_seconds_bucket{stage="match",le="0.1"} 2\n'
+        'face_stage_seconds_bucket{stage="match",le="+Inf"} 3\n'
+        'face_stage_seconds_sum{stage="match"} 3.055\n'
+        'face_stage_seconds_count{stage="match"} 3\n'
+    )
+
+
+def test_label_sets_and_escaping():
+    registry = Registry()
+    first = registry.counter('requests_total', 'Requests', {'path': '/a', 'code': '200'})
+    assert registry.counter('requests_total', 'Requests', {'code': '200', 'path': '/a'}) is first
+    registry.counter('requests_total', 'Requests', {'path': 'say "hi"\\'}).inc()
+    lines = registry.expose().splitlines()
+    assert lines[2] == 'requests_total{code="200",path="/a"} 0'
+    assert lines[3] == 'requests_total{path="say \\"hi\\"\\\\"} 1'
+
+
+def test_callbacks_are_read_at_scrape_time():
+    registry = Registry()
+    value = [1]
+    registry.gauge('pool_depth', 'Depth', fn=lambda: value[0])
+    value[0] = 7
+    assert 'pool_depth 7\n' in registry.expose()
+    # Registering again replaces the callback; one that fails is left out of the scrape
+    registry.gauge('pool_depth', 'Depth', fn=lambda: 1 / 0)
+    assert registry.expose() == '# HELP pool_depth Depth\n# TYPE pool_depth gauge\n'
+    with pytest.raises(ValueError):
+        registry.counter('pool_depth', 'Depth')
+
+
+def test_histogram_time():
+    histogram = Histogram(buckets=(1.0,))
+    with histogram.time():
+        pass
+    cumulative, total, count = histogram.snapshot()
+    assert cumulative == [(1.0, 1), (float('inf'), 1)] and count == 1 and 0 <= total < 1.0
+
+
+def test_metrics_server():
+    registry = Registry()
+    registry.counter('hits_total', 'Hits').inc()
+    server = MetricsServer(registry, port=0)
+    server.start()
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics?x=1') as response:
+            assert response.headers['Content-Type'] == 'text/plain; version=0.0.4'
+            assert 'hits_total 1\n' in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f'http://127.0.0.1:{server.port}/profile')
+        assert error.value.code == 404
+    finally:
+        server.stop()
+
+
+def test_profiler_samples_named_threads():
+    stop = threading.Event()
+
+    def busy_wait():
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    worker = threading.Thread(target=busy_wait, name='recognize-0')
+    profiler = SamplingProfiler(interval=0.001)
+    worker.start()
+    profiler.start()
+    time.sleep(0.05)
+    profiler.stop()
+    stop.set()
+    worker.join()
+    lines = profiler.collapsed().splitlines()
+    assert profiler.samples > 0
+    assert any(line.startswith('recognize-0;') and 'busy_wait (test_metrics.py:' in line for line in lines)
@@ -0,0 +1,96 @@
+import types
+
+import numpy as np
+import pytest
+
+import motion
+from motion import MotionGate, merge_boxes
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(motion, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def scene(square=None, size=(480, 640)):
+    """A grey frame, with a white square at (top, left, side) if given"""
+    img = np.full(size + (3,), 90, np.uint8)
+    if square is not None:
+        top, left, side = square
+        img[top:top + side, left:left + side] = 250
+    return img
+
+
+def contains(outer, inner):
+    return outer[0] <= inner[0] and outer[1] >= inner[1] and outer[2] >= inner[2] and outer[3] <= inner[3]
+
+
+def test_merge_boxes():
+    assert merge_boxes([(0, 10, 10, 0), (5, 20, 15, 5), (50, 60, 60, 50)]) == [(0, 20, 15, 0), (50, 60, 60, 50)]
+    # Touching boxes are not merged
+    assert merge_boxes([(0, 10, 10, 0), (10, 20, 20, 10)]) == [(0, 10, 10, 0), (10, 20, 20, 10)]
+    assert merge_boxes([]) == []
+
+
+def test_static_scene_skips_detection(clock):
+    gate = MotionGate()
+    assert gate.regions(scene()) is None
+    assert gate.regions(scene()) == []
+    # Sensor noise stays below the threshold
+    noisy = np.clip(scene().astype(int) + np.random.default_rng(0).integers(-5, 6, (480, 640, 3)), 0, 255)
+    assert gate.regions(noisy.astype(np.uint8)) == []
+
+
+def test_motion_limits_detection_to_the_changed_region(clock):
+    gate = MotionGate()
+    gate.regions(scene())
+    regions = gate.regions(scene(square=(100, 200, 80)))
+    assert len(regions) == 1
+    assert contains(regions[0], (100, 280, 180, 200))
+    top, right, bottom, left = regions[0]
+    assert (bottom - top) * (right - left) < 0.5 * 480 * 640
+
+
+def test_small_changes_are_ignored(clock):
+    gate = MotionGate(min_area=0.002)
+    gate.regions(scene())
+    assert gate.regions(scene(square=(100, 200, 8))) == []
+    assert gate.regions(scene(square=(100, 200, 40))) != []
+
+
+def test_tracked_faces_are_searched_without_motion(clock):
+    gate = MotionGate()
+    gate.regions(scene())
+    face = (100, 300, 200, 200)
+    regions = gate.regions(scene(), tracked=[face])
+    assert len(regions) == 1 and contains(regions[0], face)
+
+
+def test_large_motion_searches_the_whole_frame(clock):
+    gate = MotionGate(max_roi_share=0.5)
+    gate.regions(scene())
+    assert gate.regions(scene(square=(0, 0, 400))) is None
+
+
+def test_periodic_refresh_and_new_resolution(clock):
+    gate = MotionGate(refresh=10.0)
+    gate.regions(scene())
+    clock[0] += 9.0
+    assert gate.regions(scene()) == []
+    clock[0] += 1.0
+    assert gate.regions(scene()) is None
+    assert gate.regions(scene()) == []
+    # The same aspect ratio at another size gives the same thumbnail; another aspect ratio restarts
+    assert gate.regions(scene(size=(240, 320))) == []
+    assert gate.regions(scene(size=(480, 480))) is None
+    assert gate.counts == {'static': 3, 'roi': 0, 'full': 3}
+    assert gate.report() == "motion static=50% roi=0% full=50%"
+
+
+def test_a_still_object_fades_into_the_background(clock):
+    gate = MotionGate(learning_rate=0.5)
+    gate.regions(scene())
+    frames = [gate.regions(scene(square=(100, 200, 80))) for _ in range(10)]
+    assert frames[0] and frames[-1] == []
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from multistream import MultiStreamEngine, parse_source
+
+
+def write_video(path, shade, frames=30, fps=200):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (32, 32))
+    for _ in range(frames):
+        writer.write(np.full((32, 32, 3), shade, np.uint8))
+    writer.release()
+    return str(path)
+
+
+class FakeRecognizer:
+    """Names the face after the frame's shade and records how many frames it had in flight"""
+
+    frame_skip = 1
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.shades = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def recognize(self, img, dropped=0):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("detector crashed")
+            shade = int(img.mean())
+            self.shades.append(shade)
+            return [('dark' if shade < 100 else 'light', 0.4, (0, 32, 32, 0))]
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def reporters(self, shared=True):
+        return []
+
+
+class FakeServices:
+    def __init__(self):
+        self.submitted = []
+        self.lock = threading.Lock()
+
+    def submit(self, student_id, stream=None, distance=None):
+        with self.lock:
+            self.submitted.append((student_id, stream))
+
+    def reporters(self):
+        return []
+
+
+def run(engine, timeout=10.0):
+    engine.start()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and (engine.running() or any(s.busy or s.frames.qsize() for s in engine.streams)):
+        time.sleep(0.02)
+    engine.stop()
+
+
+def test_parse_source():
+    assert parse_source('0') == 0 and parse_source(2) == 2
+    assert parse_source('rtsp://cam/1') == 'rtsp://cam/1'
+
+
+def test_streams_keep_their_own_recognizer_and_one_frame_in_flight(tmp_path):
+    sources = [write_video(tmp_path / 'dark.avi', 40), write_video(tmp_path / 'light.avi', 200)]
+    recognizers = iter([FakeRecognizer(delay=0.03), FakeRecognizer()])
+    services = FakeServices()
+    engine = MultiStreamEngine(sources, None, services, workers=3, new_recognizer=lambda: next(recognizers))
+    run(engine)
+    slow, fast = (stream.recognizer for stream in engine.streams)
+    assert all(shade < 100 for shade in slow.shades) and all(shade > 100 for shade in fast.shades)
+    assert slow.max_in_flight == 1 and fast.max_in_flight == 1
+    # The slow camera drops frames instead of holding up the fast one
+    assert engine.streams[0].frames.dropped > 0
+    assert fast.shades and len(fast.shades) > len(slow.shades)
+    assert {(student_id, stream) for student_id, stream in services.submitted} == \
+        {('dark', 'stream-0'), ('light', 'stream-1')}
+    assert engine.streams[1].recognized == len(fast.shades)
+
+
+def test_a_failing_stream_does_not_stop_the_others(tmp_path):
+    sources = [write_video(tmp_path / 'dark.avi', 40), write_video(tmp_path / 'light.avi', 200)]
+    recognizers = iter([FakeRecognizer(fail=True), FakeRecognizer()])
+    services = FakeServices()
+    engine = MultiStreamEngine(sources, None, services, workers=2, new_recognizer=lambda: next(recognizers))
+    run(engine)
+    broken, working = engine.streams
+    assert broken.processed == 0 and broken.captured == 30
+    assert working.processed == len(working.recognizer.shades) > 0
+    assert {stream for _, stream in services.submitted} == {'stream-1'}
+    assert 'stream-0' in broken.report() and 'processed=0' in broken.report()
+
+
+def test_missing_file_finishes_the_stream(tmp_path):
+    engine = MultiStreamEngine([str(tmp_path / 'missing.avi')], None, FakeServices(), workers=1,
+                               new_recognizer=FakeRecognizer)
+    run(engine, timeout=5.0)
+    assert engine.streams[0].finished and not engine.running()
@@ -0,0 +1,149 @@
+import threading
+import time
+
+import numpy as np
+
+from pipeline import DropOldestQueue, FrameOrder, FrameRing, PipelineEngine
+
+
+def test_drop_oldest_queue_keeps_the_newest_items():
+    q = DropOldestQueue(2)
+    for item in range(5):
+        q.put(item)
+    assert q.dropped == 3
+    assert q.qsize() == 2
+    assert [q.get_nowait(), q.get_nowait()] == [3, 4]
+    assert q.get_nowait() is None
+
+
+def test_drop_oldest_queue_get_times_out():
+    assert DropOldestQueue(1).get(timeout=0.01) is None
+
+
+def test_drop_oldest_queue_never_blocks_concurrent_producers():
+    q = DropOldestQueue(3)
+
+    def produce(base):
+        for i in range(1000):
+            q.put(base + i)
+
+    threads = [threading.Thread(target=produce, args=(n * 1000,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    assert q.qsize() == 3
+    assert q.dropped == 4000 - 3
+
+
+class FakeCapture:
+    """cv2.VideoCapture stand-in that writes a running counter into each frame."""
+
+    def __init__(self):
+        self.count = 0
+
+    def read(self, image=None):
+        self.count += 1
+        if image is None:
+            image = np.empty((4, 4), dtype=np.int64)
+        image.fill(self.count)
+        return True, image
+
+
+def test_frame_ring_reuses_its_buffers():
+    ring, cap = FrameRing(3), FakeCapture()
+    first = [ring.read(cap)[1] for _ in range(3)]
+    again = [ring.read(cap)[1] for _ in range(3)]
+    assert [id(img) for img in again] == [id(img) for img in first]
+    assert [int(img[0, 0]) for img in again] == [4, 5, 6]
+
+
+def test_frame_ring_never_overwrites_a_held_frame():
+    ring, cap = FrameRing(3), FakeCapture()
+    _, held = ring.read(cap)
+    ring.hold(held)
+    for _ in range(10):
+        _, img = ring.read(cap)
+        assert img is not held
+    assert int(held[0, 0]) == 1
+    ring.release(held)
+    reused = [ring.read(cap)[1] for _ in range(3)]
+    assert any(img is held for img in reused)
+
+
+def test_frame_ring_reads_into_fresh_buffers_when_all_slots_are_held():
+    ring, cap = FrameRing(2), FakeCapture()
+    slots = [ring.read(cap)[1] for _ in range(2)]
+    for img in slots:
+        ring.hold(img)
+    _, extra = ring.read(cap)
+    assert all(extra is not img for img in slots)
+    assert [int(img[0, 0]) for img in slots] == [1, 2]
+    assert int(extra[0, 0]) == 3
+
+
+def test_frame_order_runs_sections_in_ticket_order():
+    order = FrameOrder(('prepare', 'track'))
+    tickets = [order.ticket() for _ in range(8)]
+    seen = {'prepare': [], 'track': []}
+
+    def recognize(ticket):
+        time.sleep(0.001 * (8 - ticket.number))  # later frames arrive first
+        with ticket.turn('prepare'):
+            seen['prepare'].append(ticket.number)
+        if ticket.number % 3 == 0:
+            ticket.close()  # an early return skips the tracker
+            return
+        with ticket.turn('track'):
+            seen['track'].append(ticket.number)
+        ticket.close()
+
+    threads = [threading.Thread(target=recognize, args=(ticket,)) for ticket in reversed(tickets)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    assert seen == {'prepare': list(range(8)), 'track': [1, 2, 4, 5, 7]}
+
+
+class CountingCapture:
+    def __init__(self):
+        self.count = 0
+
+    def read(self, image=None):
+        time.sleep(0.002)
+        self.count += 1
+        return True, np.full((2, 2), self.count, dtype=np.int64)
+
+
+def test_pipeline_recognizes_frames_in_parallel_and_in_order():
+    order = FrameOrder(('track',))
+    active, peak, tracked = [0], [0], []
+    lock = threading.Lock()
+
+    def recognize(img, ticket):
+        frame = int(img[0, 0])
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02 if frame % 2 else 0.005)  # odd frames are slower, so workers finish out of order
+        with ticket.turn('track'):
+            tracked.append(frame)
+        with lock:
+            active[0] -= 1
+        return frame
+
+    engine = PipelineEngine(CountingCapture(), recognize, workers=3, queue_size=4, frame_skip=1,
+                            ticket=order.ticket)
+    engine.start()
+    results = []
+    deadline = time.monotonic() + 5
+    while len(results) < 20 and time.monotonic() < deadline:
+        results.extend(engine.poll_results())
+        time.sleep(0.005)
+    engine.stop()
+    assert peak[0] > 1
+    assert tracked == sorted(tracked)
+    assert results == sorted(results) and len(set(results)) == len(results)
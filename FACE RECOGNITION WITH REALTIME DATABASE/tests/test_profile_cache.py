@@ -0,0 +1,106 @@
+import pytest
+
+from backend import ListenEvent, LocalBackend
+from profile_cache import ProfileCache
+
+ADA = {'name': 'Ada', 'major': 'Maths', 'total_attendance': 3}
+ALAN = {'name': 'Alan', 'major': 'Logic', 'total_attendance': 1}
+
+
+@pytest.fixture
+def backend():
+    backend = LocalBackend()
+    backend.reference('Students').set({'1': dict(ADA), '2': dict(ALAN)})
+    return backend
+
+
+@pytest.fixture
+def cache(tmp_path, backend):
+    cache = ProfileCache(backend.reference('Students'), backend.bucket, cache_dir=str(tmp_path))
+    yield cache
+    cache.close()
+
+
+def stored(cache):
+    return {student_id: cache._stored_profile(student_id)[0] for student_id in ('1', '2', '3')}
+
+
+def test_profile_is_read_through_and_then_served_locally(cache, backend):
+    assert cache.get_profile('1') == ADA
+    calls = backend.calls
+    assert cache.get_profile('1') == ADA
+    cache.profiles.clear()
+    assert cache.get_profile('1') == ADA
+    assert backend.calls == calls
+    assert cache.get_profile('3') is None
+
+
+def test_peek_is_not_counted(cache):
+    cache.get_profile('1')
+    hits, misses = cache.profiles.hits, cache.profiles.misses
+    assert cache.peek('1') == (ADA, None)
+    assert cache.peek('2') == (None, None)
+    assert (cache.profiles.hits, cache.profiles.misses) == (hits, misses)
+
+
+def test_change_feed_updates_both_tiers(cache):
+    cache.start_listener()
+    assert stored(cache) == {'1': ADA, '2': ALAN, '3': None}
+    cache._on_change(ListenEvent('put', '/1/total_attendance', 4))
+    cache._on_change(ListenEvent('patch', '/2', {'major': 'Computing'}))
+    cache._on_change(ListenEvent('put', '/3', {'name': 'Grace'}))
+    expected = {'1': dict(ADA, total_attendance=4), '2': dict(ALAN, major='Computing'), '3': {'name': 'Grace'}}
+    assert stored(cache) == expected
+    assert {sid: cache.peek(sid)[0] for sid in expected} == expected
+
+
+def test_change_feed_deletions(cache):
+    cache.start_listener()
+    cache._on_change(ListenEvent('put', '/1', None))
+    cache._on_change(ListenEvent('patch', '/', {'2/major': None, '2/name': None, '2/total_attendance': None}))
+    assert stored(cache) == {'1': None, '2': None, '3': None}
+    assert cache.peek('1') == (None, None)
+
+
+def test_root_put_replaces_both_tiers(cache):
+    cache.start_listener()
+    cache._on_change(ListenEvent('put', '/', {'2': ALAN, '3': {'name': 'Grace'}}))
+    assert stored(cache) == {'1': None, '2': ALAN, '3': {'name': 'Grace'}}
+    assert cache.peek('1') == (None, None)
+    cache._on_change(ListenEvent('put', '/', None))
+    assert stored(cache) == {'1': None, '2': None, '3': None}
+
+
+def test_malformed_change_is_ignored(cache):
+    cache.start_listener()
+    cache._on_change(ListenEvent('put', '/1', 'not a profile'))
+    cache._on_change(ListenEvent('patch', '/', ['not', 'a', 'dict']))
+    cache._on_change(ListenEvent('put', '/2/major', 'Computing'))
+    assert stored(cache) == {'1': None, '2': dict(ALAN, major='Computing'), '3': None}
+
+
+def age_store(cache):
+    """Make every stored profile older than the cache ttl"""
+    with cache._db_lock:
+        cache._db.execute('UPDATE profiles SET fetched = 0')
+        cache._db.commit()
+    cache.profiles.clear()
+
+
+def test_listener_keeps_old_rows_current_without_refetching(cache, backend):
+    cache.start_listener()
+    age_store(cache)
+    calls = backend.calls
+    assert cache.get_profile('1') == ADA
+    cache.close()  # waits for any background refresh
+    assert backend.calls == calls
+
+
+def test_stale_row_is_served_and_refreshed_in_the_background(cache, backend):
+    cache.preload(photo_workers=1)
+    backend.reference('Students/1/major').set('Physics')
+    age_store(cache)
+    assert cache.get_profile('1') == ADA
+    cache._refresher.shutdown(wait=True)
+    assert cache._stored_profile('1')[0] == dict(ADA, major='Physics')
+    assert cache.get_profile('1') == dict(ADA, major='Physics')
@@ -0,0 +1,79 @@
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from quality import CHECKED, QUALITY_MAX_YAW, REJECTED, QualityGate, face_yaw
+
+Point = namedtuple('Point', 'x y')
+
+# face_recognition box (top, right, bottom, left) of the face drawn by frame()
+BOX = (20, 140, 140, 20)
+
+
+class Shape:
+    """dlib 5-point shape: two corners of each eye, then the nose tip"""
+
+    def __init__(self, points):
+        self.points = [Point(x, y) for x, y in points]
+
+    def part(self, i):
+        return self.points[i]
+
+
+def frame(shade=128, contrast=60, seed=0):
+    """A 160x160 frame with a sharp textured face region"""
+    rng = np.random.default_rng(seed)
+    img = np.full((160, 160, 3), shade, np.uint8)
+    texture = rng.integers(-contrast, contrast + 1, (120, 120, 1))
+    img[20:140, 20:140] = np.clip(shade + texture, 0, 255).astype(np.uint8)
+    return img
+
+
+def test_sharp_face_passes():
+    assert QualityGate().check(frame(), BOX) is None
+
+
+def test_blur_threshold():
+    gate = QualityGate(min_sharpness=25.0)
+    blurred = cv2.GaussianBlur(frame(), (0, 0), 6)
+    assert gate.check(blurred, BOX) == 'blur'
+    # Only slightly soft faces still pass
+    assert gate.check(cv2.GaussianBlur(frame(), (0, 0), 0.5), BOX) is None
+    assert QualityGate(min_sharpness=0.0).check(blurred, BOX) is None
+
+
+def test_sharpness_does_not_depend_on_face_size():
+    big = cv2.resize(frame(), (320, 320), interpolation=cv2.INTER_NEAREST)
+    gate = QualityGate()
+    assert gate.check(big, tuple(2 * v for v in BOX)) is None
+
+
+def test_size_and_exposure():
+    gate = QualityGate(min_size=40, min_brightness=40, max_brightness=220)
+    assert gate.check(frame(), (20, 50, 50, 20)) == 'size'
+    assert gate.check(frame(), (200, 300, 300, 200)) == 'size'
+    assert gate.check(frame(shade=20, contrast=10), BOX) == 'exposure'
+    assert gate.check(frame(shade=240, contrast=10), BOX) == 'exposure'
+
+
+def test_face_yaw():
+    frontal = Shape([(30, 40), (40, 40), (70, 40), (60, 40), (50, 60)])
+    assert face_yaw(frontal) == 0.0
+    turned = Shape([(30, 40), (40, 40), (70, 40), (60, 40), (62, 60)])
+    assert face_yaw(turned) == 12 / 30 > QUALITY_MAX_YAW
+    slightly = Shape([(30, 40), (40, 40), (70, 40), (60, 40), (44, 60)])
+    assert abs(face_yaw(slightly)) == 6 / 30 < QUALITY_MAX_YAW
+    profile = Shape([(50, 40), (50, 40), (50, 40), (50, 40), (60, 60)])
+    assert face_yaw(profile) == float('inf')
+
+
+def test_rejections_are_counted_by_reason():
+    gate = QualityGate()
+    checked, blur, pose = CHECKED.value, REJECTED['blur'].value, REJECTED['pose'].value
+    assert gate.accept(frame(), BOX)
+    assert not gate.accept(cv2.GaussianBlur(frame(), (0, 0), 6), BOX)
+    gate.reject('pose', 2)
+    gate.reject('pose', 0)
+    assert (CHECKED.value - checked, REJECTED['blur'].value - blur, REJECTED['pose'].value - pose) == (2, 1, 2)
+    assert gate.report().startswith('quality checked=')
@@ -0,0 +1,94 @@
+import types
+
+import pytest
+
+import scheduler
+from scheduler import AdaptiveScheduler
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def window(clock, sched, latency, faces=1, dropped=0, frames=4):
+    """Observe frames evenly spread over one adjustment interval"""
+    for _ in range(frames):
+        clock[0] += sched.interval / frames
+        sched.observe(latency, faces, dropped)
+
+
+def test_starts_at_the_configured_level():
+    sched = AdaptiveScheduler(scale=0.25, model='cnn')
+    assert sched.settings() == (0.25, 'cnn')
+    hog = AdaptiveScheduler(scale=0.25, model='hog')
+    assert hog.settings() == (0.25, 'hog')
+    assert all(model == 'hog' for _, model in hog.levels)
+
+
+def test_no_adjustment_before_the_interval(clock):
+    sched = AdaptiveScheduler(interval=2.0)
+    for _ in range(10):
+        clock[0] += 0.1
+        sched.observe(5.0, 1)
+    assert sched.settings() == (0.25, 'cnn') and sched.frame_skip == 2
+
+
+def test_slow_frames_lower_the_level_and_back_off(clock):
+    sched = AdaptiveScheduler(target_latency=0.2, cpu_budget=0.9, workers=4, idle_frames=1)
+    start = sched.level
+    window(clock, sched, 0.3)
+    assert sched.level == start - 1
+    # Idle and cheap again, but the failed level stays off limits during the back-off
+    window(clock, sched, 0.01, faces=0)
+    assert sched.level == start - 1
+    # A window that spans the rest of the back-off adjusts on its third frame
+    clock[0] += 30.0
+    window(clock, sched, 0.01, faces=0, frames=3)
+    assert sched.level == start
+    # Failing the same level again doubles the back-off
+    window(clock, sched, 0.3)
+    assert sched.level == start - 1 and sched._backoff == 60.0
+
+
+def test_busy_workers_skip_more_frames(clock):
+    sched = AdaptiveScheduler(target_latency=1.0, cpu_budget=0.5, frame_skip=2, max_skip=3)
+    level = sched.level
+    window(clock, sched, 0.4)
+    assert sched.frame_skip == 3
+    window(clock, sched, 0.4)
+    assert sched.frame_skip == 3 and sched.level == level
+
+
+def test_dropped_frames_skip_more_frames(clock):
+    sched = AdaptiveScheduler(target_latency=1.0, frame_skip=1)
+    window(clock, sched, 0.01, dropped=0)
+    assert sched.frame_skip == 1
+    window(clock, sched, 0.01, dropped=5)
+    assert sched.frame_skip == 2
+
+
+def test_spare_capacity_with_faces_processes_more_frames(clock):
+    sched = AdaptiveScheduler(target_latency=0.2, cpu_budget=0.75, frame_skip=3, min_skip=1)
+    level = sched.level
+    window(clock, sched, 0.01)
+    window(clock, sched, 0.01)
+    window(clock, sched, 0.01)
+    assert sched.frame_skip == 1 and sched.level == level
+    assert sched.report() == "detect scale=0.25 model=cnn skip=1"
+
+
+def test_predicted_load_over_budget_keeps_the_skip(clock):
+    sched = AdaptiveScheduler(target_latency=1.0, cpu_budget=0.75, frame_skip=2, min_skip=1)
+    # 40% busy fits the 45% spare-capacity bar but would be 80% at skip 1
+    window(clock, sched, 0.2)
+    assert sched.frame_skip == 2
+
+
+def test_idle_scene_raises_quality_up_to_the_top(clock):
+    sched = AdaptiveScheduler(idle_frames=4)
+    for _ in range(len(sched.levels)):
+        window(clock, sched, 0.01, faces=0)
+    assert sched.settings() == sched.levels[-1]
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import server as server_module
+from backend import LocalBackend
+from client import RecognitionClient, RemoteProfiles, ServerConnection
+from server import RecognitionServer
+from services import BackendServices
+
+FACE = ('1', 0.31, (10, 60, 50, 20))
+ADA = {'name': 'Ada', 'major': 'Maths', 'total_attendance': 3}
+
+
+class FixedRecognizer:
+    """Recognizer double: every frame shows student 1, so only the server layer is exercised"""
+
+    frame_skip = 3
+
+    def __init__(self):
+        self.frames = []
+
+    def recognize(self, img):
+        self.frames.append(img.shape)
+        return [FACE]
+
+    def identify(self, crops):
+        return [FACE[:2] for _ in crops]
+
+
+def jpeg(width=64, height=48):
+    return cv2.imencode('.jpg', np.full((height, width, 3), 128, np.uint8))[1].tobytes()
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    running = []
+
+    def start(token=''):
+        backend = LocalBackend()
+        backend.reference('Students/1').set(dict(ADA))
+        backend.bucket.upload('images/1.png', cv2.imencode('.png', np.zeros((8, 8, 3), np.uint8))[1].tobytes())
+        services = BackendServices(backend, cache_dir=str(tmp_path / 'cache'), ledger_path=str(tmp_path / 'a.db'),
+                                   journal_path=str(tmp_path / 'journal.jsonl'))
+        recognition = RecognitionServer(['encoding'], services, workers=2, token=token,
+                                        new_recognizer=FixedRecognizer)
+        loop = asyncio.new_event_loop()
+        ports = []
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            listener = loop.run_until_complete(asyncio.start_server(recognition.handle, '127.0.0.1', 0))
+            ports.append(listener.sockets[0].getsockname()[1])
+            ready.set()
+            loop.run_forever()
+            listener.close()
+            # Let open connections finish their handlers before the loop goes away
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        assert ready.wait(5)
+        running.append((loop, thread, recognition, services))
+        return recognition, f'http://127.0.0.1:{ports[0]}'
+
+    yield start
+    for loop, thread, recognition, services in running:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        recognition.close()
+        services.close()
+
+
+def test_recognize_endpoint(start_server):
+    recognition, url = start_server()
+    client = RecognitionClient(ServerConnection(url), 'door')
+    assert client.recognize(np.zeros((48, 64, 3), np.uint8)) == [FACE]
+    assert client.frame_skip == 3
+    assert recognition.cameras['door'].recognizer.frames == [(48, 64, 3)]
+    # The recognized student goes through the shared services: attendance is queued locally
+    deadline = time.monotonic() + 5
+    while recognition.services.attendance.pending() == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert recognition.services.attendance.pending() == 1
+
+
+def test_bad_requests(start_server):
+    _, url = start_server()
+    connection = ServerConnection(url)
+    status, body = connection.request('POST', '/recognize', b'not an image')
+    assert status == 400 and json.loads(body)['error']
+    assert connection.request('GET', '/recognize')[0] == 405
+    assert connection.request('GET', '/nowhere')[0] == 404
+    assert connection.request('GET', '/students/2')[0] == 404
+
+
+def test_student_profile_and_photo_for_clients(start_server):
+    _, url = start_server()
+    profiles = RemoteProfiles(ServerConnection(url))
+    profiles.fetch('1')
+    info, photo = profiles.peek('1')
+    assert info == ADA
+    assert photo.shape == (8, 8, 3)
+
+
+def test_token_is_required_except_for_health(start_server):
+    _, url = start_server(token='s3cret')
+    assert ServerConnection(url).request('POST', '/recognize', jpeg())[0] == 401
+    assert ServerConnection(url, token='wrong').request('POST', '/recognize', jpeg())[0] == 401
+    assert ServerConnection(url).request('GET', '/health')[0] == 200
+    status, body = ServerConnection(url, token='s3cret').request('POST', '/recognize', jpeg())
+    assert status == 200 and json.loads(body)['faces'][0]['id'] == '1'
+
+
+def connect(url):
+    host, port = url[len('http://'):].split(':')
+    sock = socket.create_connection((host, int(port)), timeout=5)
+    return sock, sock.makefile('rb')
+
+
+def test_too_many_headers_are_refused(start_server, monkeypatch):
+    monkeypatch.setattr(server_module, 'SERVER_MAX_HEADERS', 10)
+    _, url = start_server()
+    sock, stream = connect(url)
+    headers = ''.join(f'X-Filler-{i}: {i}\r\n' for i in range(20))
+    sock.sendall(f'GET /health HTTP/1.1\r\nHost: test\r\n{headers}\r\n'.encode())
+    assert stream.readline().startswith(b'HTTP/1.1 431')
+    sock.close()
+
+
+def ws_handshake(url, key=b'dGhlIHNhbXBsZSBub25jZQ=='):
+    sock, stream = connect(url)
+    sock.sendall(b'GET /ws?camera=door HTTP/1.1\r\nHost: test\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                 b'Sec-WebSocket-Version: 13\r\nSec-WebSocket-Key: ' + key + b'\r\n\r\n')
+    response = []
+    while True:
+        line = stream.readline()
+        if line in (b'\r\n', b''):
+            break
+        response.append(line.decode().strip())
+    return sock, stream, response
+
+
+def ws_frame(opcode, payload, fin=True):
+    """A masked client frame, as RFC 6455 requires"""
+    mask = os.urandom(4)
+    head = bytes([(0x80 if fin else 0) | opcode])
+    if len(payload) < 126:
+        head += bytes([0x80 | len(payload)])
+    elif len(payload) < 1 << 16:
+        head += bytes([0x80 | 126]) + struct.pack('>H', len(payload))
+    else:
+        head += bytes([0x80 | 127]) + struct.pack('>Q', len(payload))
+    masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return head + mask + masked
+
+
+def ws_read(stream):
+    head = stream.read(2)
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', stream.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', stream.read(8))[0]
+    return head[0] & 0x0F, stream.read(length)
+
+
+def test_websocket_handshake(start_server):
+    _, url = start_server()
+    sock, _, response = ws_handshake(url)
+    # The example key and accept value of RFC 6455 section 1.3
+    assert response[0] == 'HTTP/1.1 101 Switching Protocols'
+    assert 'Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=' in response
+    sock.close()
+
+
+def test_websocket_fragmented_frame(start_server):
+    _, url = start_server()
+    sock, stream, _ = ws_handshake(url)
+    data = jpeg()
+    thirds = [data[:len(data) // 3], data[len(data) // 3:2 * len(data) // 3], data[2 * len(data) // 3:]]
+    sock.sendall(ws_frame(0x2, thirds[0], fin=False) + ws_frame(0x9, b'ping')
+                 + ws_frame(0x0, thirds[1], fin=False) + ws_frame(0x0, thirds[2]))
+    assert ws_read(stream) == (0xA, b'ping')
+    opcode, payload = ws_read(stream)
+    result = json.loads(payload)
+    assert opcode == 0x1
+    assert result['seq'] == 1 and result['faces'][0]['id'] == '1'
+    # A frame that fails keeps the socket open for the next one
+    sock.sendall(ws_frame(0x2, b'not an image'))
+    assert 'error' in json.loads(ws_read(stream)[1])
+    sock.sendall(ws_frame(0x8, struct.pack('>H', 1000)))
+    assert ws_read(stream)[0] == 0x8
+    sock.close()
+
+
+def test_websocket_message_size_covers_all_fragments(start_server, monkeypatch):
+    monkeypatch.setattr(server_module, 'SERVER_MAX_BODY', 1000)
+    _, url = start_server()
+    sock, stream, _ = ws_handshake(url)
+    # Every fragment is under the limit, the message is not
+    sock.sendall(b''.join(ws_frame(0x2 if i == 0 else 0x0, b'x' * 400, fin=False) for i in range(3)))
+    assert stream.read(1) == b''
+    sock.close()
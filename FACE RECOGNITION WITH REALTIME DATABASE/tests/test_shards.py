@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore, write_store
+from matcher import GalleryMatcher
+from shards import ShardedMatcher
+
+DIM = 128
+
+
+def encodings(n, seed=0):
+    return np.random.default_rng(seed).normal(0, 0.1, (n, DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    path = str(tmp_path / 'encodings.bin')
+    write_store(path, [f'id{i}' for i in range(300)], encodings(300))
+    return path
+
+
+@pytest.fixture
+def sharded(store_path):
+    matcher = ShardedMatcher(store_path, shards=3, refresh=0)
+    yield matcher
+    matcher.close()
+
+
+def test_sharded_search_matches_a_single_matcher(sharded, store_path):
+    store = EmbeddingStore(store_path)
+    queries = store.embeddings[::7] + encodings(len(store.embeddings[::7]), 1) * 0.05
+    expected_dists, expected_rows = GalleryMatcher(store.embeddings, store.ids).search(queries, k=3)
+    dists, rows = sharded.search(queries, k=3)
+    assert len(sharded._shards) == 3
+    np.testing.assert_array_equal(rows, expected_rows)
+    np.testing.assert_allclose(dists, expected_dists, rtol=1e-4, atol=1e-5)
+    assert sharded.match(queries[:2], 0.6)[0][0] == 'id0'
+
+
+def test_concurrent_searches_get_their_own_results(sharded, store_path):
+    store = EmbeddingStore(store_path)
+    errors, wrong = [], []
+
+    def search(offset):
+        try:
+            for i in range(offset, 300, 10):
+                _, rows = sharded.search(store.embeddings[i:i + 1])
+                if rows[0, 0] != i:
+                    wrong.append((i, rows[0, 0]))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=search, args=(offset,)) for offset in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not errors and not wrong
+
+
+def test_reload_picks_up_appended_rows(sharded, store_path):
+    added = encodings(150, 2)
+    EmbeddingStore(store_path).append([f'new{i}' for i in range(150)], added)
+    sharded.reload()
+    assert len(sharded) == 450
+    assert len(sharded._shards) == 5  # the 100-row shards stay, new rows get new ones
+    assert [r[0] for r in sharded.match(added[[0, 149]], 0.6)] == ['new0', 'new149']
+
+
+def test_reload_rebuilds_a_rewritten_store(sharded, store_path):
+    replaced = encodings(40, 3)
+    write_store(store_path, [f'other{i}' for i in range(40)], replaced)
+    sharded.reload()
+    assert len(sharded) == 40
+    assert sharded.match(replaced[5:6], 0.6)[0][0] == 'other5'
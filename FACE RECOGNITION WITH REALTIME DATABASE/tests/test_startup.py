@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import startup
+
+
+@pytest.fixture
+def resources(tmp_path, monkeypatch):
+    modes = tmp_path / 'Modes'
+    modes.mkdir()
+    for i in (1, 2, 10, 3):
+        cv2.imwrite(str(modes / f'{i}.png'), np.full((8, 8, 3), i, np.uint8))
+    cv2.imwrite(str(tmp_path / 'background.png'), np.zeros((8, 8, 3), np.uint8))
+    monkeypatch.setattr(startup, 'MODE_DIR', str(modes))
+    monkeypatch.setattr(startup, 'BACKGROUND_FILE', str(tmp_path / 'background.png'))
+    return tmp_path
+
+
+def wait_ready(boot, timeout=5.0):
+    parts = {}
+    deadline = time.monotonic() + timeout
+    while not boot.ready and time.monotonic() < deadline:
+        parts.update(boot.poll())
+        time.sleep(0.01)
+    assert boot.ready
+    return parts
+
+
+def test_mode_paths_sort_numerically(resources):
+    assert [os.path.basename(path) for path in startup.mode_paths()] == ['1.png', '2.png', '3.png', '10.png']
+    background, modes = startup.load_assets()
+    assert background is not None and [int(img[0, 0, 0]) for img in modes] == [1, 2, 3, 10]
+
+
+def test_startup_loads_concurrently_and_reuses_the_snapshot(resources):
+    snapshot_path = str(resources / 'warm_start.pkl')
+    both = threading.Barrier(2, timeout=5.0)
+
+    def make_services():
+        both.wait()
+        return 'services'
+
+    def make_recognizer(gallery):
+        both.wait()
+        return 'recognizer'
+
+    # The recognizer and services only finish if they run at the same time
+    boot = startup.Startup(make_recognizer, make_services, gallery=False, snapshot_path=snapshot_path)
+    parts = wait_ready(boot)
+    boot.close()
+    assert parts['services'] == 'services' and parts['recognizer'] == 'recognizer'
+    assert len(parts['assets'][1]) == 4
+
+    deadline = time.monotonic() + 5.0
+    while not os.path.exists(snapshot_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert set(startup.load_snapshot(snapshot_path)) == {'assets'}
+
+    boot = startup.Startup(lambda gallery: None, lambda: None, gallery=False, snapshot_path=snapshot_path)
+    wait_ready(boot)
+    boot.close()
+    assert boot._reused == {'assets'}
@@ -0,0 +1,74 @@
+import numpy as np
+
+from tracker import FaceTracker, iou_matrix
+
+# face_recognition boxes: (top, right, bottom, left)
+LEFT = (100, 200, 200, 100)
+RIGHT = (100, 500, 200, 400)
+
+
+def shifted(box, dx):
+    top, right, bottom, left = box
+    return (top, right + dx, bottom, left + dx)
+
+
+def test_iou_matrix():
+    ious = iou_matrix([LEFT, RIGHT], [LEFT, shifted(LEFT, 50)])
+    np.testing.assert_allclose(ious, [[1.0, 50 / 150], [0.0, 0.0]], rtol=1e-6)
+    assert iou_matrix([], [LEFT]).shape == (0, 1)
+
+
+def test_boxes_keep_their_tracks_as_they_move():
+    tracker = FaceTracker()
+    first, to_encode = tracker.update([LEFT, RIGHT])
+    assert [t.track_id for t in first] == [1, 2] and to_encode == first
+    # Swapped order and a small movement: association is by overlap, not position in the list
+    tracks, _ = tracker.update([shifted(RIGHT, 10), shifted(LEFT, -10)])
+    assert [t.track_id for t in tracks] == [2, 1]
+    assert tracks[1].box == shifted(LEFT, -10) and tracks[1].age == 1
+    # Too little overlap starts a new track
+    tracks, _ = tracker.update([shifted(LEFT, 90)])
+    assert tracks[0].track_id == 3
+
+
+def test_two_boxes_do_not_share_a_track():
+    tracker = FaceTracker()
+    tracker.update([LEFT])
+    tracks, _ = tracker.update([LEFT, shifted(LEFT, 5)])
+    assert tracks[0].track_id == 1 and tracks[1].track_id == 2
+
+
+def test_tracks_expire_after_max_misses():
+    tracker = FaceTracker(max_misses=2)
+    tracker.update([LEFT, RIGHT])
+    for _ in range(2):
+        tracker.update([RIGHT])
+    assert [t.track_id for t in tracker.tracks] == [1, 2]
+    tracker.update([RIGHT])
+    assert [t.track_id for t in tracker.tracks] == [2]
+    tracks, _ = tracker.update([LEFT, RIGHT])
+    assert tracks[0].track_id == 3
+
+
+def test_known_tracks_reuse_their_identity():
+    tracker = FaceTracker(reencode_interval=3, unknown_interval=2)
+    (known, unknown), _ = tracker.update([LEFT, RIGHT])
+    tracker.assign(known, '11', 0.1, threshold=0.5)
+    tracker.assign(unknown, None, 0.7, threshold=0.5)
+    assert known.confidence == 1.0 and unknown.confidence == 0.0
+    encodes = [[t.track_id for t in tracker.update([LEFT, RIGHT])[1]] for _ in range(3)]
+    # Unknown faces are retried every unknown_interval frames, known ones every reencode_interval
+    assert encodes == [[], [2], [1, 2]]
+    assert tracker.encoded == 2 + 3 and tracker.reused == 6 - 3
+
+
+def test_movement_decays_confidence_until_reencoded():
+    tracker = FaceTracker(reencode_interval=100, min_confidence=0.7)
+    (track,), _ = tracker.update([LEFT])
+    tracker.assign(track, '11', 0.2, threshold=0.5)
+    assert track.confidence == 1.0
+    _, to_encode = tracker.update([LEFT])
+    assert to_encode == [] and track.confidence == 0.95
+    _, to_encode = tracker.update([shifted(LEFT, 30)])
+    assert to_encode == [track] and track.confidence < 0.7
+    assert 'encodes saved' in tracker.report()
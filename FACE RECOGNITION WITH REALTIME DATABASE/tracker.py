@@ -0,0 +1,124 @@
+import itertools
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU between two lists of face_recognition boxes (top, right, bottom, left)"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(bottom - top, 0, None) * np.clip(right - left, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 1] - a[:, 3])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 1] - b[:, 3])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    """One face followed across frames, with the identity last recognized on it"""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.student_id = None
+        self.distance = float('inf')
+        self.confidence = 0.0
+        self.age = 0
+        self.misses = 0
+        self.since_encoded = None  # None until the first encoding
+
+
+class FaceTracker:
+    """IoU tracker that caches recognized identities on persistent track IDs.
+
+    update() associates the detected boxes of a frame with existing tracks
+    and returns the tracks that need a fresh face encoding: new tracks,
+    tracks not encoded for reencode_interval frames, and tracks whose
+    confidence has decayed below min_confidence. All other tracks keep the
+    identity from their last encoding, so a student standing at the kiosk
+    is encoded a few times instead of on every frame.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=5, reencode_interval=30,
+                 confidence_decay=0.95, min_confidence=0.3, unknown_interval=5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.reencode_interval = reencode_interval
+        self.confidence_decay = confidence_decay
+        self.min_confidence = min_confidence
+        self.unknown_interval = unknown_interval
+        self.tracks = []
+        self.encoded = 0
+        self.reused = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def update(self, boxes):
+        """Associate boxes with tracks; returns (tracks in box order, tracks to encode)"""
+        with self._lock:
+            for track in self.tracks:
+                track.misses += 1
+
+            assigned = [None] * len(boxes)
+            if self.tracks and boxes:
+                ious = iou_matrix([t.box for t in self.tracks], boxes)
+                # Greedy assignment, best overlap first
+                for flat in np.argsort(-ious, axis=None):
+                    ti, bi = divmod(int(flat), len(boxes))
+                    if ious[ti, bi] < self.iou_threshold:
+                        break
+                    track = self.tracks[ti]
+                    if assigned[bi] is not None or track.misses == 0:
+                        continue
+                    # Movement lowers confidence; a still face barely decays
+                    track.confidence *= self.confidence_decay * float(np.sqrt(ious[ti, bi]))
+                    track.box = boxes[bi]
+                    track.misses = 0
+                    track.age += 1
+                    if track.since_encoded is not None:
+                        track.since_encoded += 1
+                    assigned[bi] = track
+
+            for bi, box in enumerate(boxes):
+                if assigned[bi] is None:
+                    track = Track(next(self._ids), box)
+                    self.tracks.append(track)
+                    assigned[bi] = track
+
+            self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+            to_encode = [t for t in assigned if self._needs_encoding(t)]
+            self.encoded += len(to_encode)
+            self.reused += len(assigned) - len(to_encode)
+            return assigned, to_encode
+
+    def _needs_encoding(self, track):
+        if track.since_encoded is None:
+            return True
+        if track.student_id is None:
+            return track.since_encoded >= self.unknown_interval
+        return track.since_encoded >= self.reencode_interval or track.confidence < self.min_confidence
+
+    def assign(self, track, student_id, distance, threshold):
+        """Store the match result of a fresh encoding on the track"""
+        with self._lock:
+            if track.student_id is not None and student_id != track.student_id:
+                logger.info(f"Track {track.track_id} changed identity {track.student_id} -> {student_id}")
+            track.student_id = student_id
+            track.distance = distance
+            # Matches well inside the threshold start fully confident, borderline ones decay out sooner
+            track.confidence = min(1.0, 2.0 * (1.0 - distance / threshold)) if student_id is not None else 0.0
+            track.since_encoded = 0
+
+    def report(self):
+        total = self.encoded + self.reused
+        saved = 100.0 * self.reused / total if total else 0.0
+        return f"tracks={len(self.tracks)} encoded={self.encoded} reused={self.reused} ({saved:.0f}% encodes saved)"